@@ -0,0 +1,258 @@
+# Sends the orders that come due at about the same time for one pair together, with AddOrderBatch.
+# https://docs.kraken.com/rest/#tag/User-Trading/operation/addOrderBatch
+#
+# With a lot of schedules on the same pair, every child order used to be its own AddOrder round trip.
+# Here submit() only queues the order and hands back a Future. Orders for a pair are held for up to
+# batch_window seconds ( or until there are batch_max_orders of them ) and then sent in one request.
+# Kraken answers with one result per order, in the same order they were sent, so every Future gets
+# its own txid or its own error.
+#
+# A batch still adds one order's worth to the pair's trading counter for every order in it,
+# the saving is in round trips and in time spent waiting on them.
+#
+# An order sent on its own goes out from a BodyTemplate for its pair and direction, which is what every
+# order from the same schedule shares, so only its volume and price are encoded each time.
+#
+# Every order in a request carries the same userref. If the connection drops or Kraken answers that it's unavailable,
+# the orders might have been placed anyway, so they're never just sent again: after lookup_delay seconds they're
+# looked for by their userref in OpenOrders and ClosedOrders. Orders Kraken has get their txid, only the rest are sent
+# again. If the lookup doesn't work either, they fail with the kind 'unknown', since nobody can tell if they're out.
+#
+# Kraken turns a whole AddOrderBatch down for one order it won't take ( a volume under the minimum, say ).
+# The other orders in it were fine, and they're often other schedules' orders, so a batch that's turned down for good
+# is sent again one order at a time with AddOrder. Only the orders that are turned down on their own fail.
+#
+# Sending can take seconds ( retries, backoff, lookups ), so the thread in run() only decides what's due and hands
+# it to one of batch_senders threads. Every pair has at most one send out at a time. Its orders that come due
+# meanwhile wait in the next batch and go as soon as that send is back, so one slow pair doesn't hold up the others.
+import decimal
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from config import batch_window, batch_senders
+from rate_limiter import rate_limits
+from retry_policy import retry_policy, RequestFailed, error_kind, unsure_kinds
+from signing import BodyTemplate
+
+# AddOrderBatch takes between 2 and 15 orders, all for the same pair
+batch_max_orders = 15
+# How many times orders that might not have gone through are looked up ( and the ones that weren't placed sent again )
+placement_lookups = 3
+# Seconds Kraken is given to finish placing them before they're looked up
+lookup_delay = 1
+# ClosedOrders hands out 50 orders at a time
+closed_page_size = 50
+
+
+# Kraken rejected the order. errors is the list of error strings it gave, and kind is what kind of failure it was
+# ( see retry_policy.py ), or 'unknown' if it might have been placed after all.
+class OrderError(Exception):
+    def __init__(self, errors, kind=None):
+        super().__init__(', '.join(errors))
+        self.errors = errors
+        self.kind = kind or error_kind(errors)
+
+
+class OrderBatcher:
+    # request_function is kraken_request ( for one key ), passed in so this doesn't have to import kraken_api
+    def __init__(self, request_function, window=batch_window, the_retry_policy=retry_policy):
+        self.kraken_request = request_function
+        self.retry_policy = the_retry_policy
+        self.window = window
+        # pair -> {'orders': [(order, future), ..], 'send_at': ..}
+        self.waiting = {}
+        # (pair, direction) -> BodyTemplate, only ever added to
+        self.templates = {}
+        # Pairs with a send out right now
+        self.in_flight = set()
+        self.senders = ThreadPoolExecutor(max_workers=batch_senders, thread_name_prefix="order_sender")
+        self.condition = threading.Condition()
+        self.killed = False
+        self.thread = threading.Thread(target=self.run, name="order_batcher", daemon=True)
+        self.thread.start()
+
+    # Queues a limit order. The Future's result is the txid, or it raises OrderError.
+    def submit(self, order_direction, the_volume, the_pair, the_price):
+        the_future = Future()
+        the_order = {'ordertype': 'limit', 'type': order_direction, 'volume': str(the_volume), 'price': str(the_price)}
+        with self.condition:
+            if self.killed:
+                the_future.set_exception(OrderError(['Order batcher stopped'], 'unavailable'))
+                return the_future
+            the_batch = self.waiting.setdefault(the_pair, {'orders': [], 'send_at': time.monotonic() + self.window})
+            the_batch['orders'].append((the_order, the_future))
+            if len(the_batch['orders']) >= batch_max_orders:
+                the_batch['send_at'] = 0
+            self.condition.notify()
+        return the_future
+
+    # Hands every pair whose batch is due ( and that has no send out ) to a sender, and never sends anything itself
+    def run(self):
+        with self.condition:
+            while True:
+                # Pairs that still have a send out are left waiting until it's back
+                the_ready = {each_pair: self.waiting[each_pair]['send_at'] for each_pair in self.waiting
+                             if each_pair not in self.in_flight}
+                if self.killed:
+                    # Nothing new is accepted, but whatever was already queued still gets sent
+                    due = list(the_ready)
+                    if not due and not self.waiting and not self.in_flight:
+                        break
+                else:
+                    due = [each_pair for each_pair in the_ready if the_ready[each_pair] <= time.monotonic()]
+                for each_pair in due:
+                    self.in_flight.add(each_pair)
+                    self.senders.submit(self.send_all, each_pair, self.waiting.pop(each_pair)['orders'])
+                if due:
+                    continue
+                if the_ready and not self.killed:
+                    self.condition.wait(min(the_ready.values()) - time.monotonic())
+                else:
+                    self.condition.wait()
+        self.senders.shutdown()
+
+    # On a sender thread: sends the orders batch_max_orders at a time, then lets the pair's next batch go
+    def send_all(self, the_pair, the_orders):
+        try:
+            for the_index in range(0, len(the_orders), batch_max_orders):
+                the_chunk = the_orders[the_index:the_index + batch_max_orders]
+                try:
+                    self.send(the_pair, the_chunk)
+                except Exception as e:
+                    # Anything unexpected only fails this request, the rest are still sent.
+                    # It might have gone out already, so it's not known whether the orders were placed.
+                    print(f"Sending {len(the_chunk)} order(s) for {the_pair} broke: {e!r}")
+                    self.fail(the_chunk, OrderError([repr(e)], 'unknown'))
+        finally:
+            with self.condition:
+                self.in_flight.discard(the_pair)
+                self.condition.notify()
+
+    # Sends the orders and gives every Future its result. A single order goes through plain AddOrder.
+    # Failures that can pass are retried by retry_policy, ones that might have placed the orders are looked up,
+    # and anything else fails every order in the request.
+    def send(self, the_pair, the_orders):
+        the_userref = random.randint(1, 2 ** 31 - 1)
+        for each_order, _ in the_orders:
+            each_order['userref'] = the_userref
+        sent_at = time.time()
+        for each_lookup in range(placement_lookups + 1):
+            try:
+                the_result = self.place(the_pair, the_orders)
+            except RequestFailed as e:
+                if e.kind == 'permanent' and len(the_orders) > 1:
+                    print(f"AddOrderBatch for {the_pair} was turned down ( {', '.join(e.errors)} ), "
+                          f"sending its {len(the_orders)} orders one at a time")
+                    for each_item in the_orders:
+                        self.send(the_pair, [each_item])
+                    return
+                if e.kind not in unsure_kinds or each_lookup == placement_lookups:
+                    # The whole request was turned down, so every order in it was
+                    print(f"There was an issue in the orders for {the_pair}: {e.errors}")
+                    self.fail(the_orders, OrderError(e.errors, e.kind))
+                    return
+                print(f"Orders for {the_pair} might have been placed anyway ( {', '.join(e.errors)} ), looking them up")
+                time.sleep(lookup_delay)
+                try:
+                    the_orders = self.find_placed(the_userref, sent_at, the_orders)
+                except RequestFailed as lookup_error:
+                    print(f"Couldn't find out if {len(the_orders)} order(s) for {the_pair} were placed: "
+                          f"{lookup_error.errors}")
+                    self.fail(the_orders, OrderError(e.errors + lookup_error.errors, 'unknown'))
+                    return
+                if not the_orders:
+                    return
+                continue
+            self.hand_out(the_orders, the_result)
+            return
+
+    # Kraken's result for the orders, or raises RequestFailed
+    def place(self, the_pair, the_orders):
+        if len(the_orders) == 1:
+            the_order = the_orders[0][0]
+            return self.retry_policy.send(self.kraken_request, "/0/private/AddOrder",
+                                          self.template(the_pair, the_order['type']).fill(
+                                              volume=the_order['volume'], price=the_order['price'],
+                                              userref=the_order['userref']),
+                                          pair=the_pair)
+        return self.retry_policy.send(self.kraken_request, "/0/private/AddOrderBatch",
+                                      {'pair': the_pair, 'orders': [each_order for each_order, _ in the_orders]},
+                                      pair=the_pair, trading_cost=rate_limits['place_order'] * len(the_orders),
+                                      as_json=True)
+
+    # Gives every order's Future its txid or its error, from Kraken's result
+    def hand_out(self, the_orders, the_result):
+        if len(the_orders) == 1:
+            the_orders[0][1].set_result(the_result['txid'][0])
+            return
+        # {"orders": [{"txid": .., "descr": ..} or {"error": ..}, ..]}, one for every order sent
+        the_results = the_result['orders']
+        for the_index, (_, each_future) in enumerate(the_orders):
+            each_result = the_results[the_index] if the_index < len(the_results) else {}
+            if each_result.get('txid'):
+                each_future.set_result(each_result['txid'])
+            elif each_result.get('error'):
+                the_error = each_result['error']
+                each_future.set_exception(OrderError(the_error if isinstance(the_error, list) else [the_error]))
+            else:
+                # Kraken didn't say what happened to this one
+                each_future.set_exception(OrderError(['No txid returned'], 'unknown'))
+
+    @staticmethod
+    def fail(the_orders, the_error):
+        for _, each_future in the_orders:
+            if not each_future.done():
+                each_future.set_exception(the_error)
+
+    # Looks for the orders sent with the_userref since sent_at. Every one Kraken has gets its txid,
+    # and the ones it doesn't have are returned. Raises RequestFailed if they can't be looked up.
+    def find_placed(self, the_userref, sent_at, the_orders):
+        # https://docs.kraken.com/rest/#tag/User-Data/operation/getOpenOrders
+        the_result = self.retry_policy.send(self.kraken_request, "/0/private/OpenOrders", {'userref': str(the_userref)})
+        found = dict(the_result.get('open') or {})
+        # https://docs.kraken.com/rest/#tag/User-Data/operation/getClosedOrders
+        # Filled ( or cancelled ) since they were sent
+        the_offset = 0
+        while True:
+            the_result = self.retry_policy.send(self.kraken_request, "/0/private/ClosedOrders",
+                                                {'userref': str(the_userref), 'start': str(int(sent_at) - 1),
+                                                 'ofs': str(the_offset)})
+            the_closed = the_result.get('closed') or {}
+            found.update(the_closed)
+            the_offset += len(the_closed)
+            if len(the_closed) < closed_page_size or the_offset >= int(the_result.get('count', 0)):
+                break
+        not_placed = []
+        for each_order, each_future in the_orders:
+            the_txid = next((each_txid for each_txid in found if same_order(found[each_txid], each_order)), None)
+            if the_txid is None:
+                not_placed.append((each_order, each_future))
+            else:
+                # Orders that are exactly the same are interchangeable, but each one found can only be used once
+                del found[the_txid]
+                each_future.set_result(the_txid)
+        return not_placed
+
+    def template(self, the_pair, order_direction):
+        the_template = self.templates.get((the_pair, order_direction))
+        if the_template is None:
+            the_template = BodyTemplate({'ordertype': 'limit', 'type': order_direction, 'pair': the_pair})
+            self.templates[(the_pair, order_direction)] = the_template
+        return the_template
+
+    def stop(self):
+        with self.condition:
+            self.killed = True
+            self.condition.notify()
+
+
+# True if the_kraken_order ( as OpenOrders / ClosedOrders have it ) is the_order that was sent
+def same_order(the_kraken_order, the_order):
+    the_descr = the_kraken_order.get('descr') or {}
+    try:
+        return (the_descr.get('type') == the_order['type']
+                and decimal.Decimal(the_kraken_order.get('vol', '0')) == decimal.Decimal(the_order['volume'])
+                and decimal.Decimal(the_descr.get('price', '0')) == decimal.Decimal(the_order['price']))
+    except decimal.InvalidOperation:
+        return False
@@ -0,0 +1,304 @@
+# Latency benchmarks that run against the local stand-in in kraken_stub.py
+#
+# Example: python benchmark.py transport --requests 500
+#          python benchmark.py submit --orders 100 --latency 0.05
+#          python benchmark.py history
+#          python benchmark.py export --rows 20000 --latency 0.05
+#          python benchmark.py all
+#
+# Everything but "transport" goes through the program's own modules ( kraken_api, engine, .. ),
+# pointed at the stand-in instead of api.kraken.com. The rate limiter is lifted unless --respect-limits is given,
+# so what's measured is the program and not how long Kraken's limits make it wait.
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import requests
+from kraken_stub import start_stub
+from transport import Transport
+
+
+def summarize(name, timings):
+    timings = sorted(timings)
+    p50 = timings[len(timings) // 2]
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"{name:<28} n={len(timings):<6} mean={statistics.mean(timings) * 1000:8.3f} ms  "
+          f"p50={p50 * 1000:8.3f} ms  p99={p99 * 1000:8.3f} ms")
+
+
+def time_calls(the_function, how_many):
+    timings = []
+    for _ in range(how_many):
+        start_time = time.perf_counter()
+        the_function()
+        timings.append(time.perf_counter() - start_time)
+    return timings
+
+
+# Starts the stand-in and points the shared transport ( and the cache ) at it.
+# Has to be called before kraken_api is imported, since that reads the cache as soon as it starts.
+def use_stub(arguments, cache_dir=None):
+    stub_server = start_stub(latency=arguments.latency, rate_limit_every=arguments.rate_limit_every,
+                             fill_after=arguments.fill_after)
+    base_url = f'http://127.0.0.1:{stub_server.server_address[1]}'
+    import disk_cache
+    import transport
+    transport.transport.base_url = base_url
+    # Never mixes the stand-in's data into the real cache
+    disk_cache.api_url = base_url
+    disk_cache.cache_dir = cache_dir or tempfile.mkdtemp()
+    import kraken_api
+    # The stand-in's nonces are reserved in files of their own, so they never move the real keys' nonce files on
+    nonce_dir = tempfile.mkdtemp()
+    for each_key in kraken_api.key_pool:
+        each_key.nonces.nonce_file = os.path.join(nonce_dir, each_key.name)
+        each_key.nonces.last_nonce = each_key.nonces.reserved = 0
+    import journal
+    journal.journal.dir = tempfile.mkdtemp()
+    # Nothing is listening here, so the market feed falls back to REST straight away
+    kraken_api.market_feed.ws_url = 'ws://127.0.0.1:9'
+    # The stand-in has no private WebSocket, so open orders are polled
+    import order_tracker
+    order_tracker.websocket = None
+    if not arguments.respect_limits:
+        from rate_limiter import limiter
+        limiter.api_max = limiter.trading_max = float('inf')
+    return stub_server
+
+
+# Before: bare requests.get, a new connection every call.
+# After: the pooled keep-alive Transport, pre-warmed like it is at startup.
+def bench_transport(arguments):
+    stub_server = start_stub(latency=arguments.latency)
+    base_url = f'http://127.0.0.1:{stub_server.server_address[1]}'
+    the_transport = Transport(base_url)
+    the_transport.prewarm()
+    summarize('bare requests.get', time_calls(lambda: requests.get(base_url + '/0/public/Ticker'),
+                                              arguments.requests))
+    summarize('pooled Transport.public_get', time_calls(lambda: the_transport.public_get('/0/public/Ticker'),
+                                                        arguments.requests))
+    the_transport.close()
+    stub_server.shutdown()
+
+
+# Order submit latency: one signed AddOrder at a time, then the same amount of orders arriving
+# all at once and going through the batcher.
+def bench_submit(arguments):
+    stub_server = use_stub(arguments)
+    import kraken_api
+    from batcher import OrderBatcher
+    the_order = {'ordertype': 'limit', 'type': 'buy', 'volume': '0.01', 'price': '20000', 'pair': 'XXBTZUSD'}
+    summarize('AddOrder, one at a time', time_calls(lambda: kraken_api.kraken_request("/0/private/AddOrder", the_order,
+                                                                                      pair='XXBTZUSD'),
+                                                    arguments.orders))
+    the_batcher = OrderBatcher(kraken_api.kraken_request)
+    submitted_at = {}
+    timings = []
+
+    def record(the_future):
+        timings.append(time.perf_counter() - submitted_at[id(the_future)])
+    start_time = time.perf_counter()
+    the_futures = []
+    for _ in range(arguments.orders):
+        the_future = the_batcher.submit('buy', '0.01', 'XXBTZUSD', '20000')
+        submitted_at[id(the_future)] = time.perf_counter()
+        the_futures.append(the_future)
+        the_future.add_done_callback(record)
+    for each_future in the_futures:
+        each_future.exception()
+    total_time = time.perf_counter() - start_time
+    summarize('OrderBatcher, all at once', timings)
+    print(f"{'':<28} {arguments.orders} orders in {total_time * 1000:.1f} ms, "
+          f"{sum(1 for each_future in the_futures if each_future.exception())} failed")
+    the_batcher.stop()
+    stub_server.shutdown()
+
+
+# The CPU time each order costs before it's sent, without any network.
+# Before: the order's dict built again, url-encoded to sign it, the secret decoded and a new HMAC made,
+# and then the dict encoded again by requests to send it.
+# After: a BodyTemplate filled with the volume and price, encoded once, and signed with the key's Signer.
+def bench_signing(arguments):
+    import kraken_api
+    from requests.models import RequestEncodingMixin
+    from signing import BodyTemplate
+    the_secret = 'c2VjcmV0LXNlY3JldC1zZWNyZXQtc2VjcmV0'
+    the_key = kraken_api.ApiKey('benchmark', 'key', the_secret, None, None, None)
+
+    def before():
+        the_data = {'nonce': '1700000000000000', 'ordertype': 'limit', 'type': 'buy', 'volume': '0.01',
+                    'price': '20000', 'pair': 'XXBTZUSD'}
+        kraken_api.get_kraken_signature("/0/private/AddOrder", the_data, the_secret)
+        RequestEncodingMixin._encode_params(the_data)
+    the_template = BodyTemplate({'ordertype': 'limit', 'type': 'buy', 'pair': 'XXBTZUSD'})
+
+    def after():
+        the_body = the_template.fill(volume='0.01', price='20000').encode('1700000000000000')
+        the_key.signer.sign("/0/private/AddOrder", '1700000000000000', the_body)
+    # The same body and signature both ways
+    the_body = the_template.fill(volume='0.01', price='20000').encode('1700000000000000')
+    assert the_key.signer.sign("/0/private/AddOrder", '1700000000000000', the_body) == kraken_api.get_kraken_signature(
+        "/0/private/AddOrder", {'nonce': '1700000000000000'}, the_secret, the_body.decode())
+    how_many = arguments.requests * 50
+    summarize('sign + encode, before', time_calls(before, how_many))
+    summarize('sign + encode, after', time_calls(after, how_many))
+
+
+# How long keeping up with open orders takes: the full OpenOrders download against the change-only poll
+def bench_polling(arguments):
+    stub_server = use_stub(arguments)
+    import kraken_api
+    import order_tracker
+    for _ in range(arguments.orders):
+        kraken_api.kraken_request("/0/private/AddOrder", {'ordertype': 'limit', 'type': 'buy', 'volume': '0.01',
+                                                          'price': '20000', 'pair': 'XXBTZUSD'}, pair='XXBTZUSD')
+    the_tracker = order_tracker.OrderTracker(kraken_api.kraken_request)
+    # Every poll checks for partial fills as well, the most it can cost
+    order_tracker.trades_poll_interval = 0
+    summarize(f'resync, {arguments.orders} open', time_calls(the_tracker.resync, arguments.requests))
+    summarize(f'poll_changes, {arguments.orders} open', time_calls(the_tracker.poll_changes, arguments.requests))
+    stub_server.shutdown()
+
+
+# Startup time, measured in a new process every time: cold ( empty cache ) and warm ( cache from the run before )
+def bench_startup(arguments):
+    cache_dir = tempfile.mkdtemp()
+    for each_kind in ('cold', 'warm'):
+        timings = []
+        for _ in range(arguments.runs):
+            if each_kind == 'cold':
+                for each_file in os.listdir(cache_dir):
+                    os.remove(os.path.join(cache_dir, each_file))
+            the_output = subprocess.run([sys.executable, os.path.abspath(__file__), 'startup_once',
+                                         '--latency', str(arguments.latency), '--cache-dir', cache_dir],
+                                        capture_output=True, text=True, check=True).stdout
+            timings.append(float(the_output.strip().splitlines()[-1]))
+        summarize(f'startup, {each_kind} cache', timings)
+
+
+# One startup, for bench_startup. Prints how long until the main window could be shown.
+def bench_startup_once(arguments):
+    use_stub(arguments, arguments.cache_dir)
+    import kraken_api
+    start_time = time.perf_counter()
+    kraken_api.start_updates()
+    kraken_api.wait_until_ready(('balances', 'pairs', 'tickers'))
+    print(time.perf_counter() - start_time)
+    # Lets the background downloads finish, so the next warm run has a cache to start from
+    kraken_api.wait_until_ready()
+    time.sleep(0.5)
+    kraken_api.stop_updates()
+
+
+# Many schedules on one pair at once: how long they take against how long their intervals alone would take,
+# and how many threads it needs
+def bench_schedules(arguments):
+    stub_server = use_stub(arguments)
+    import kraken_api
+    import engine
+    kraken_api.start_updates()
+    kraken_api.wait_until_ready()
+    threads_before = threading.active_count()
+    the_schedules = [engine.create_schedule('XXBTZUSD', 'sell', '1', '0.001', arguments.interval, 'fixed',
+                                            str(arguments.orders_per_schedule))
+                     for _ in range(arguments.schedules)]
+    start_time = time.perf_counter()
+    for each_schedule in the_schedules:
+        engine.start_schedule(each_schedule)
+    while engine.schedules_active():
+        time.sleep(0.01)
+    total_time = time.perf_counter() - start_time
+    ideal_time = (arguments.orders_per_schedule - 1) * arguments.interval
+    orders_placed = sum(each_schedule['orders_placed'] for each_schedule in the_schedules)
+    print(f"{arguments.schedules} schedules x {arguments.orders_per_schedule} orders: {orders_placed} placed "
+          f"in {total_time:.3f} s ( intervals alone: {ideal_time:.3f} s, overhead {total_time - ideal_time:.3f} s )")
+    print(f"threads: {threads_before} before, {threading.active_count()} while running, "
+          f"{len(stub_server.exchange.orders)} orders reached the stand-in")
+    engine.stop()
+    stub_server.shutdown()
+
+
+# Reading rolling statistics from market history, once a pair's trades and candles are in from the stand-in,
+# against asking Kraken for the trades each time
+def bench_history(arguments):
+    stub_server = use_stub(arguments)
+    import kraken_api
+    from transport import transport as the_transport
+    from market_history import MarketHistory
+    the_history = MarketHistory(the_dir=tempfile.mkdtemp())
+    kraken_api.trade_flow.add_listener(the_history.add_trades)
+    kraken_api.start_updates()
+    kraken_api.wait_until_ready()
+    the_history.track('XXBTZUSD')
+    kraken_api.track_trades('XXBTZUSD')
+    while the_history.volatility('XXBTZUSD', 3600) is None or not the_history.volume('XXBTZUSD', 300):
+        the_history.poll_step()
+        time.sleep(0.05)
+    summarize('Trades call per read', time_calls(
+        lambda: the_transport.public_get('/0/public/Trades', {'pair': 'XXBTZUSD', 'since': str(int(time.time()) - 300)}),
+        arguments.requests))
+    summarize('market_history.stats', time_calls(lambda: the_history.stats('XXBTZUSD', 300), arguments.requests))
+    print(the_history.stats('XXBTZUSD', 3600))
+    kraken_api.stop_updates()
+    stub_server.shutdown()
+
+
+# Exporting a long trade history from the stand-in: one page after another, against export_workers pages at once
+def bench_export(arguments):
+    stub_server = use_stub(arguments)
+    import kraken_api
+    from exporter import Exporter
+    stub_server.exchange.add_history(arguments.rows)
+    for each_workers in (1, arguments.workers):
+        the_exporter = Exporter(kraken_api.key_pool.main, the_dir=tempfile.mkdtemp(), workers=each_workers)
+        start_time = time.perf_counter()
+        the_rows = the_exporter.export('trades')
+        print(f"{each_workers} worker(s): {the_rows} rows in {time.perf_counter() - start_time:.3f} s")
+    stub_server.shutdown()
+
+
+benchmarks = {'transport': bench_transport,
+              'submit': bench_submit,
+              'polling': bench_polling,
+              'startup': bench_startup,
+              'schedules': bench_schedules,
+              'history': bench_history,
+              'export': bench_export,
+              'signing': bench_signing}
+
+
+# Every benchmark, each in its own process since they share kraken_api's state
+def bench_all(arguments):
+    for each_name in benchmarks:
+        print(f"--- {each_name}")
+        subprocess.run([sys.executable, os.path.abspath(__file__), each_name] + sys.argv[2:], check=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Kraken-API latency benchmarks against a local stand-in")
+    parser.add_argument('which', choices=sorted(benchmarks) + ['all', 'startup_once'])
+    parser.add_argument('--requests', type=int, default=200, help="Requests per measurement")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds of server-side latency to add")
+    parser.add_argument('--orders', type=int, default=100, help="Orders placed ( submit ) or open ( polling )")
+    parser.add_argument('--runs', type=int, default=5, help="Startups measured for each kind of start")
+    parser.add_argument('--schedules', type=int, default=100, help="Schedules running at once")
+    parser.add_argument('--orders-per-schedule', type=int, default=3)
+    parser.add_argument('--interval', type=float, default=1, help="Seconds between a schedule's orders")
+    parser.add_argument('--rows', type=int, default=5000, help="Trades in the stand-in's history ( export )")
+    parser.add_argument('--workers', type=int, default=4, help="Pages fetched at once ( export )")
+    parser.add_argument('--rate-limit-every', type=int, default=0,
+                        help="The stand-in turns down every n-th private call with a rate limit error")
+    parser.add_argument('--fill-after', type=float, default=None, help="Seconds until the stand-in fills orders")
+    parser.add_argument('--respect-limits', action='store_true', help="Keep the rate limiter's normal limits")
+    parser.add_argument('--cache-dir', help=argparse.SUPPRESS)
+    the_arguments = parser.parse_args()
+    if the_arguments.which == 'all':
+        bench_all(the_arguments)
+    elif the_arguments.which == 'startup_once':
+        bench_startup_once(the_arguments)
+    else:
+        benchmarks[the_arguments.which](the_arguments)
@@ -0,0 +1,200 @@
+# Cancels orders in the background, as few requests as possible at a time.
+#
+# Cancelling used to be one CancelOrder round trip per order, on whatever thread asked for it
+# ( which was the Tk main thread, so the window froze every time ).
+# Here cancel() only queues the txids and hands back a Future for each one. One thread takes everything
+# that's queued at that moment and sends it as CancelOrderBatch, 50 txids at a time.
+# Only cancel_all() ( the "Cancel all orders" menu item ) sends CancelAll. A selection is never turned into CancelAll,
+# even if it happens to be every order that's known to be open: an order placed a moment ago might not be known yet.
+# Kraken only answers with how many orders were cancelled. If that's fewer than were sent, some were already
+# filled or cancelled, so just those orders are looked up to find out which.
+# Cancels that fail because Kraken was busy or the connection dropped are sent again through retry_policy,
+# ones that can't work ( the order is already gone ) are given up on straight away.
+#
+# The cancel penalty from rate_limits ( more for young orders ) is charged to every order's pair before sending.
+#
+# If cancel_after_timeout in config.py is more than 0, CancelAllOrdersAfter is also kept armed while this runs:
+# if the program dies or loses its connection, Kraken cancels every open order after that many seconds.
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from config import cancel_after_timeout
+from rate_limiter import limiter, order_age_penalty
+from retry_policy import retry_policy, RequestFailed
+from responses import Order
+
+# CancelOrderBatch takes at most 50 txids at once
+cancel_batch_limit = 50
+# Queued by cancel_all() in place of a txid, along with {txid: [futures]} for every order that was open
+all_orders = object()
+
+
+class CancelPipeline:
+    # request_function is kraken_request and the_order_tracker is kraken_api.order_tracker, or the same for another key
+    # along with its limiter and retry policy.
+    # pair_name_function turns the pair in an order's descr into the REST pair name, for the trading counter.
+    def __init__(self, request_function, the_order_tracker, pair_name_function, the_cancel_after=cancel_after_timeout,
+                 the_limiter=limiter, the_retry_policy=retry_policy):
+        self.kraken_request = request_function
+        self.order_tracker = the_order_tracker
+        self.limiter = the_limiter
+        self.retry_policy = the_retry_policy
+        self.pair_name = pair_name_function
+        self.cancel_after = the_cancel_after
+        # (txid, future), (all_orders, {txid: [futures]}) or None to wake the thread up
+        self.queue = queue.Queue()
+        self.killed = False
+        self.thread = threading.Thread(target=self.run, name="cancel_pipeline", daemon=True)
+        self.thread.start()
+
+    # Queues the txids. Each Future's result is True if that order was cancelled, False if it wasn't.
+    def cancel(self, txids):
+        the_futures = []
+        for each_txid in txids:
+            the_future = Future()
+            if self.killed:
+                the_future.set_result(False)
+            else:
+                self.queue.put((each_txid, the_future))
+            the_futures.append(the_future)
+        return the_futures
+
+    # Cancels every open order with CancelAll. There's a Future for each order that's open right now.
+    def cancel_all(self):
+        the_items = {txid: [Future()] for txid in list(self.order_tracker.open_orders) if txid != 'error'}
+        if self.killed:
+            for each_txid in the_items:
+                the_items[each_txid][0].set_result(False)
+        else:
+            self.queue.put((all_orders, the_items))
+        return [the_items[each_txid][0] for each_txid in the_items]
+
+    def run(self):
+        next_arm = 0
+        while not self.killed:
+            wait_time = max(0.0, next_arm - time.monotonic()) if self.cancel_after > 0 else None
+            try:
+                the_item = self.queue.get(timeout=wait_time)
+            except queue.Empty:
+                the_item = None
+            self.send_queued(the_item)
+            if self.cancel_after > 0 and time.monotonic() >= next_arm:
+                # Re-armed well before it runs out, so one slow request doesn't set it off
+                self.arm(self.cancel_after)
+                next_arm = time.monotonic() + self.cancel_after / 3
+        # Whatever was queued before stop() still gets sent
+        self.send_queued(None)
+        if self.cancel_after > 0:
+            self.arm(0)
+
+    # Sends the_item along with everything else that's queued right now
+    def send_queued(self, the_item):
+        the_items = {}
+        cancel_everything = None
+        while True:
+            if the_item is not None and the_item[0] is all_orders:
+                cancel_everything = cancel_everything or {}
+                for each_txid in the_item[1]:
+                    cancel_everything.setdefault(each_txid, []).extend(the_item[1][each_txid])
+            elif the_item is not None:
+                the_items.setdefault(the_item[0], []).append(the_item[1])
+            try:
+                the_item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+        # CancelAll goes out even if no order is known to be open, in case one is that isn't known yet
+        for each_function, each_items in ((self.send, the_items or None), (self.send_cancel_all, cancel_everything)):
+            if each_items is None:
+                continue
+            try:
+                each_function(each_items)
+            except Exception as e:
+                # Anything unexpected only fails these cancels, the thread keeps going for the next ones
+                print(f"Cancelling {len(each_items)} order(s) broke: {e!r}")
+                for each_txid in each_items:
+                    for each_future in each_items[each_txid]:
+                        if not each_future.done():
+                            each_future.set_exception(e)
+
+    # https://docs.kraken.com/rest/#tag/User-Trading/operation/cancelAllOrdersAfter
+    # 0 turns it off
+    def arm(self, the_timeout):
+        try:
+            self.retry_policy.send(self.kraken_request, "/0/private/CancelAllOrdersAfter", {'timeout': the_timeout})
+        except RequestFailed as e:
+            print(f"Couldn't set CancelAllOrdersAfter to {the_timeout} seconds: {e.errors}")
+        except Exception as e:
+            print(f"Couldn't set CancelAllOrdersAfter to {the_timeout} seconds: {e!r}")
+
+    # Kraken's result for a cancel, or None and why it didn't work
+    def request(self, uri_path, data, as_json=False):
+        try:
+            return self.retry_policy.send(self.kraken_request, uri_path, data, as_json=as_json), None
+        except RequestFailed as e:
+            return None, e
+
+    # Charges the cancel penalty for every order to its pair. Orders that aren't known yet can't be charged.
+    def charge_penalties(self, txids):
+        the_costs = {}
+        for each_txid in txids:
+            the_order = self.order_tracker.open_orders.get(each_txid)
+            if isinstance(the_order, Order) and the_order.pair:
+                the_pair = self.pair_name(the_order.pair)
+                the_costs[the_pair] = the_costs.get(the_pair, 0) + order_age_penalty(
+                    'cancel', time.time() - the_order.opentm)
+        for each_pair in the_costs:
+            self.limiter.acquire("/0/private/CancelOrderBatch", each_pair, the_costs[each_pair])
+
+    # https://docs.kraken.com/rest/#tag/User-Trading/operation/cancelAllOrders
+    # txid -> [futures] for every order that was open when cancel_all() was called
+    def send_cancel_all(self, the_items):
+        txids = list(the_items)
+        self.charge_penalties(txids)
+        self.finish(txids, the_items, *self.request("/0/private/CancelAll", {}))
+
+    # txid -> [futures]. Every future gets its result before this returns.
+    def send(self, the_items):
+        txids = list(the_items)
+        for the_index in range(0, len(txids), cancel_batch_limit):
+            the_chunk = txids[the_index:the_index + cancel_batch_limit]
+            self.charge_penalties(the_chunk)
+            if len(the_chunk) == 1:
+                # https://docs.kraken.com/rest/#tag/User-Trading/operation/cancelOrder
+                the_answer = self.request("/0/private/CancelOrder", {'txid': the_chunk[0]})
+            else:
+                # https://docs.kraken.com/rest/#tag/User-Trading/operation/cancelOrderBatch
+                the_answer = self.request("/0/private/CancelOrderBatch", {'orders': the_chunk}, as_json=True)
+            self.finish(the_chunk, the_items, *the_answer)
+
+    # Works out which of txids were cancelled from Kraken's result ( or the_failure ) and hands out the results
+    def finish(self, txids, the_items, the_result, the_failure):
+        if the_failure is not None:
+            if the_failure.errors == ['EOrder:Unknown order']:
+                print("This order can't be cancelled as it's already completed.")
+            else:
+                print(f"Issue cancelling {len(txids)} order(s), gave up. Here's your error: {the_failure.errors}")
+            cancelled = set()
+        elif int(the_result.get('count', 0)) >= len(txids):
+            cancelled = set(txids)
+        else:
+            # Some of them were already gone, so each one is looked up to find out which
+            cancelled = set()
+            for the_index in range(0, len(txids), cancel_batch_limit):
+                the_result = self.order_tracker.private_result(
+                    "/0/private/QueryOrders", {'txid': ','.join(txids[the_index:the_index + cancel_batch_limit])})
+                for each_txid in the_result or {}:
+                    self.order_tracker.apply_order(each_txid, the_result[each_txid])
+                    if the_result[each_txid].get('status') == 'canceled':
+                        cancelled.add(each_txid)
+        if cancelled:
+            print(f"Cancelled {len(cancelled)} order(s)")
+        for each_txid in txids:
+            if each_txid in cancelled:
+                self.order_tracker.apply_order(each_txid, {'status': 'canceled'})
+            for each_future in the_items[each_txid]:
+                each_future.set_result(each_txid in cancelled)
+
+    def stop(self):
+        self.killed = True
+        self.queue.put(None)
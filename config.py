@@ -3,7 +3,96 @@ api_key_b = ""
 # Base64 string of the secret
 api_secret_b = ""
 api_url = "https://api.kraken.com"
+ws_url = "wss://ws.kraken.com"
+ws_auth_url = "wss://ws-auth.kraken.com"
 account_type = 'intermediate'
+# More keys ( other accounts or sub-accounts ) that schedules are spread over, each with its own rate limits. Like:
+# [{'name': 'second', 'api_key_b': "", 'api_secret_b': "", 'account_type': 'intermediate'}]
+# account_type can be left out if it's the same as the one above. The balance shown is the main key's.
+extra_api_keys = []
+# Where the last nonce is kept between restarts, so a new run never reuses one
+nonce_file = '.kraken_nonce'
+
+# Connection information
+# How many keep-alive connections are kept open to the api url
+pool_size = 10
+# Seconds to wait for a connection / for a response
+connect_timeout = 3.05
+read_timeout = 10
+# How many connections are opened at startup, before the first real request
+prewarm_connections = 2
+
+# Seconds between Ticker polls when the WebSocket market feed isn't connected
+ticker_poll_interval = 6
+
+# Seconds between checks for order changes when the private order stream isn't connected,
+# while schedules have orders out. With nothing going on, every check that finds nothing waits twice as long
+# as the one before, up to order_idle_poll_interval.
+order_poll_interval = 2
+order_idle_poll_interval = 60
+# Seconds between checks for partial fills ( TradesHistory costs twice as much ) when not streaming
+trades_poll_interval = 30
+# Seconds between full downloads of every open order, to find orders placed outside this program
+order_resync_interval = 300
+# The balance is refreshed after every fill. Without any, it's refreshed this often ( in seconds ) for deposits
+# and withdrawals.
+balance_refresh_interval = 300
+
+# POV ( participation of volume ) schedules size their orders from the public trades of the last pov_window seconds,
+# which are fetched every trades_fetch_interval seconds
+pov_window = 300
+trades_fetch_interval = 5
+# Market history ( recent trades and 1 minute candles ) kept in memory for every pair it's asked for.
+# Only benchmark.py's history run keeps any for now, see market_history.py.
+# Older rows go to files in history_dir, up to history_spill_rows of each but never more than
+# history_spill_megabytes per file, and candles are fetched every ohlc_fetch_interval seconds. Needs numpy.
+history_trade_rows = 20000
+history_ohlc_rows = 1440
+history_spill_rows = 500000
+history_spill_megabytes = 8
+history_dir = '.kraken_history'
+ohlc_fetch_interval = 60
+
+# Where schedules are journaled, so they're picked up where they stopped after a crash or a restart.
+# Records that come in within journal_sync_interval seconds of each other are written with one fsync,
+# and the journal is compacted into a snapshot every journal_snapshot_every records.
+journal_dir = '.kraken_journal'
+journal_sync_interval = 0.005
+journal_snapshot_every = 1000
+
+# Where exporter.py writes trades, closed orders and ledger entries ( a folder for every key ), how many pages
+# it fetches at once, and how many API credits it always leaves for the rest of the program
+export_dir = 'kraken_exports'
+export_workers = 4
+export_reserve = 6
+
+# How many threads place orders for all of the schedules together
+scheduler_workers = 4
+# Orders for the same pair that come due within this many seconds of each other are sent together with AddOrderBatch
+batch_window = 0.25
+# How many batches ( each for a different pair ) can be out at once, for every API key
+batch_senders = 4
+# If more than 0, Kraken cancels every open order this many seconds after the program stops checking in
+# ( it crashed, or lost its connection ). Has to be at least 15 if used.
+cancel_after_timeout = 0
+# Seconds before the first retry of a call that failed because Kraken was busy or the connection dropped.
+# It doubles with every retry after that, up to retry_max_delay, and each wait is a random part of it.
+retry_base_delay = 0.25
+retry_max_delay = 30
+
+# Where AssetPairs and the last ticker are kept between runs, so the program starts without waiting on them
+cache_dir = '.kraken_cache'
+# Seconds before they're too old to start from. Either way, they're downloaded again in the background on startup.
+asset_pairs_cache_age = 86400
+ticker_cache_age = 600
+
+# Port for the metrics page ( http://127.0.0.1:<port>/metrics ), 0 turns it off
+metrics_port = 0
+# Seconds between printed summaries of how the calls to Kraken are doing, 0 turns them off
+metrics_summary_interval = 300
+
+# How many price levels are kept on each side of the local order books
+book_depth = 25
 
 # GUI information
 verify_closing = True
@@ -0,0 +1,45 @@
+# Keeps public data that hardly changes ( AssetPairs, the last ticker ) on disk between runs.
+#
+# On a cold start everything has to be downloaded before the main window can be shown.
+# With a cache that's new enough, it can be shown straight away from what's on disk,
+# and the fresh data replaces it in the background as soon as it arrives.
+#
+# Every entry remembers when it was saved and which api_url it came from, so the stub's data
+# never gets used against the real API ( or the other way around ).
+import json
+import os
+import time
+from config import api_url, cache_dir
+
+
+def cache_path(the_name):
+    the_dir = cache_dir
+    if not os.path.isabs(the_dir):
+        the_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), the_dir)
+    return os.path.join(the_dir, f"{the_name}.json")
+
+
+# The saved data, or None if there isn't any, it's older than max_age seconds, or it's from a different api_url
+def load(the_name, max_age):
+    try:
+        with open(cache_path(the_name)) as the_file:
+            the_entry = json.load(the_file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(the_entry, dict) or the_entry.get('source') != api_url:
+        return None
+    if time.time() - the_entry.get('saved_at', 0) > max_age:
+        return None
+    return the_entry.get('data')
+
+
+# Written to a temporary file first, so a crash halfway through never leaves a broken cache behind
+def save(the_name, the_data):
+    the_path = cache_path(the_name)
+    try:
+        os.makedirs(os.path.dirname(the_path), exist_ok=True)
+        with open(the_path + '.tmp', 'w') as the_file:
+            json.dump({'source': api_url, 'saved_at': time.time(), 'data': the_data}, the_file)
+        os.replace(the_path + '.tmp', the_path)
+    except OSError as e:
+        print(f"Couldn't save {the_name} to the cache: {str(e)}")
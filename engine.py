@@ -0,0 +1,699 @@
+# The trading engine. Runs order schedules without needing Tk or a display.
+#
+# A schedule is plain data, the same information the new order screen asks for:
+#   {"pair": "XXBTZUSD", "direction": "buy", "limit_price": "23000", "total_amount": "100",
+#    "interval": 60, "trade_type": "fixed", "trade_size": "4"}
+# start.py is one client of this module. It can also be run on its own:
+#   python engine.py schedules.json
+# where schedules.json is a list of schedules like the one above.
+# Every schedule is journaled ( see journal.py ), and ones that hadn't finished are picked up again on the next start,
+# with or without a schedules file.
+# trade_type "pov" places trade_size ( 0.1 is 10% ) of the volume that trades on the pair, every interval seconds,
+# until total_amount has been placed. See next_pov_order_size.
+import argparse
+import decimal
+import itertools
+import json
+import sys
+import threading
+import time
+import kraken_api
+from config import scheduler_workers
+from kraken_api import find_pair_name
+from scheduler import Scheduler
+from batcher import OrderBatcher, OrderError
+from cancel_pipeline import CancelPipeline
+from event_bus import bus
+from metrics import metrics
+from journal import journal
+
+# https://support.kraken.com/hc/en-us/articles/205893708-Minimum-order-size-volume-for-trading
+# Last pulled 2023-02-02
+# ---
+# To turn each string value to float or int, the following is how to do that:
+# minimum_order_sizes is a in this: .. [float(a[x]) if str(float(a[x])) == a[x] else int(a[x]) for x in a]
+# ---
+# These are the minimum order sizes for the "base currency". The "base currency" is the left currency in each pair.
+# If the order is smaller than this, there'll be a volume error.
+minimum_order_sizes = {'1INCH': 10, 'AAVE': 0.15, 'ACA': 50, 'ACH': 500, 'ADA': 15, 'ADX': 40, 'AGLD': 20, 'AIR': 700,
+                       'AKT': 20, 'ALCX': 0.3, 'ALGO': 20, 'ALICE': 5, 'ALPHA': 50, 'ANKR': 200, 'ANT': 2.5, 'APE': 2,
+                       'API3': 3.5, 'APT': 1.25, 'ARPA': 200, 'ASTR': 125, 'ATLAS': 2000, 'ATOM': 0.5, 'AUDIO': 30,
+                       'AVAX': 0.4, 'AXS': 0.65, 'BADGER': 2, 'BAL': 1, 'BAND': 3, 'BAT': 20, 'BCH': 0.05, 'BICO': 17.5,
+                       'BIT': 17.5, 'BLZ': 85, 'BNC': 50, 'BNT': 15, 'BOBA': 25, 'BOND': 1.5, 'BSX': 60000,
+                       'BTC': 0.0001, 'BTT': 7500000, 'C98': 20, 'CELR': 500, 'CFG': 25, 'CHR': 40, 'CHZ': 25,
+                       'COMP': 0.2, 'COTI': 65, 'CQT': 50, 'CRV': 10, 'CSM': 1250, 'CTSI': 50, 'CVC': 50, 'CVX': 1.2,
+                       'DAI': 5, 'DASH': 0.13, 'DENT': 7000, 'DOGE': 60, 'DOT': 1, 'DYDX': 2.5, 'EGLD': 0.15, 'ENJ': 15,
+                       'ENS': 0.4, 'EOS': 5, 'ETC': 0.25, 'ETH': 0.01, 'ETH2.S': 0.001, 'ETHW': 1.5, 'EUL': 1,
+                       'EWT': 1.25, 'FARM': 0.15, 'FET': 75, 'FIDA': 10, 'FIL': 1.25, 'FIS': 15, 'FLOW': 5, 'FLR': 5,
+                       'FORTH': 1.5, 'FTM': 25, 'FXS': 1, 'GAL': 2.5, 'GALA': 200, 'GARI': 150, 'GHST': 5, 'GLMR': 15,
+                       'GMT': 12.5, 'GNO': 0.06, 'GRT': 80, 'GST': 200, 'GTC': 3, 'HDX': 10, 'HFT': 8.5, 'ICP': 1.5,
+                       'ICX': 30, 'IDEX': 100, 'IMX': 12, 'INJ': 3, 'INTR': 250, 'JASMY': 1250, 'JUNO': 2.5,
+                       'KAR': 22.5, 'KAVA': 5, 'KEEP': 75, 'KEY': 1500, 'KILT': 12, 'KIN': 500000, 'KINT': 6.5,
+                       'KNC': 10, 'KP3R': 0.065, 'KSM': 0.2, 'LCX': 125, 'LDO': 5, 'LINK': 0.8, 'LPT': 0.65, 'LRC': 20,
+                       'LSK': 7.5, 'LTC': 0.06, 'LUNA': 30000, 'LUNA2': 3, 'MANA': 12.5, 'MASK': 2, 'MATIC': 6,
+                       'MC': 12, 'MINA': 10, 'MIR': 35, 'MKR': 0.0075, 'MLN': 0.25, 'MNGO': 250, 'MOVR': 0.65,
+                       'MSOL': 0.35, 'MULTI': 1.5, 'MV': 25, 'MXC': 150, 'NANO': 8, 'NEAR': 3, 'NMR': 0.5, 'NODL': 2000,
+                       'NYM': 25, 'OCEAN': 35, 'OGN': 50, 'OMG': 5, 'ORCA': 10, 'OXT': 75, 'OXY': 600, 'PARA': 350,
+                       'PAXG': 0.003, 'PERP': 12.5, 'PHA': 35, 'PLA': 25, 'POLIS': 30, 'POLS': 15, 'POND': 600,
+                       'POWR': 30, 'PSTAKE': 65, 'QNT': 0.05, 'QTUM': 2.5, 'RAD': 3, 'RARE': 35, 'RARI': 2, 'RAY': 25,
+                       'RBC': 150, 'REN': 60, 'REP': 1.5, 'REPV2': 1, 'REQ': 50, 'RLC': 6.5, 'RNDR': 10, 'ROOK': 0.35,
+                       'RPL': 0.25, 'RUNE': 5, 'SAMO': 2000, 'SAND': 8.5, 'SBR': 5000, 'SC': 2000, 'SCRT': 10,
+                       'SDN': 17.5, 'SGB': 400, 'SHIB': 500000, 'SNX': 3, 'SOL': 0.35, 'SPELL': 7500, 'SRM': 20,
+                       'STEP': 500, 'STG': 12, 'STORJ': 15, 'STX': 20, 'SUPER': 50, 'SUSHI': 5, 'SYN': 8, 'T': 250,
+                       'TBTC': 0.0001, 'TEER': 15, 'TLM': 350, 'TOKE': 5, 'TRIBE': 25, 'TRU': 100, 'TRX': 100,
+                       'TVK': 175, 'UMA': 3, 'UNFI': 1.5, 'UNI': 1, 'USDC': 5, 'USDT': 5, 'UST': 250, 'WAVES': 2.5,
+                       'WAXL': 5, 'WBTC': 0.0001, 'WOO': 50, 'XCN': 100, 'XLM': 60, 'XMR': 0.05, 'XRP': 12.5, 'XRT': 2,
+                       'XTZ': 5, 'YFI': 0.002, 'YGG': 25, 'ZEC': 0.15, 'ZRX': 25,
+                       # These additional ones were provided from the following URL:
+                       # https://support.kraken.com/hc/en-us/articles/360001185506-How-to-interpret-asset-codes
+                       'ETH2': 0.001, 'WAVE': 2.5, 'XETC': 0.25, 'XETH': 0.01, 'XLTC': 0.06, 'XMLN': 0.25, 'XREP': 1.5,
+                       'XREPV2': 1, 'XXBT': 0.0001, 'XXDG': 60, 'XXLM': 60, 'XXMR': 0.05, 'xxrp': 12.5, 'XXTZ': 5,
+                       'XZEC': 0.15, 'ZAUD': 10, 'ZEUR': 5, 'ZUSD': 5}
+
+
+# Every schedule that's been started, by its id
+schedules = {}
+schedule_ids = itertools.count(1)
+# Functions called with ( event, txid ) whenever an order changes.
+# event is 'new', 'partially_filled', 'filled' or 'cancelled', as worked out by kraken_api.order_tracker.
+# They're called on whatever thread saw the change. The GUI uses the 'orders' topic on the event bus instead,
+# which gets {txid: (event, Order)} on the Tk thread without the engine knowing about Tk.
+order_listeners = []
+# txid -> the schedule that placed it, until it's filled or cancelled
+order_owners = {}
+
+
+def notify_order_listeners(the_event, txid, the_order=None):
+    if the_event in ('filled', 'cancelled') and txid in order_owners:
+        record_order_end(the_event, txid)
+    bus.publish('orders', txid, (the_event, the_order))
+    for each_listener in order_listeners:
+        each_listener(the_event, txid)
+
+
+for each_tracker in kraken_api.order_trackers():
+    each_tracker.add_listener(notify_order_listeners)
+
+
+# Orders are polled for as often as possible while any schedule has orders out, and less and less often otherwise
+def schedules_have_orders():
+    return bool(order_owners)
+
+
+for each_tracker in kraken_api.order_trackers():
+    each_tracker.add_activity_check(schedules_have_orders)
+
+
+def check_existence_of_all_vars(the_pair, limit_price, the_total_amount,
+                                the_interval, trade_type, the_trade_size_percent):
+    not_found = []
+    # trade_type is either fixed/volume and can't be blank
+    # if not the_trade_type:
+    # order_direction is either buy/sell and also can't be blank
+    # if not order_direction
+    if not the_pair:
+        not_found.append('coin pair symbol')
+    if not limit_price:
+        not_found.append('limit price')
+    if not the_total_amount:
+        not_found.append('total amount')
+    if not the_interval:
+        not_found.append('second inbetween trades')
+    if not the_trade_size_percent:
+        if trade_type == 'fixed':
+            not_found.append('order size')
+        elif trade_type == 'volume':
+            not_found.append('volume percent')
+        elif trade_type == 'pov':
+            not_found.append('share of volume')
+    if len(not_found) >= 3:
+        not_found[-1] = f'and {not_found[-1]}'
+    return not_found
+
+
+# Returns the minimum order size and the base currency it's in
+def find_minimum_order_size(the_coin_pair):
+    if the_coin_pair:
+        the_minimum, the_coin = kraken_api.pair_index.minimum_order(the_coin_pair)
+        if the_minimum is not None:
+            return the_minimum, the_coin
+        # AssetPairs didn't have an ordermin for it, so use the table
+        if the_coin in minimum_order_sizes:
+            return minimum_order_sizes[the_coin], the_coin
+    return None, None
+
+
+def calculate_order_sizes(trade_type, total_amount_var, trade_size_percent_var):
+    if trade_type == 'fixed':
+        how_many_each_order = decimal.Decimal(total_amount_var) / decimal.Decimal(trade_size_percent_var)
+        return str(how_many_each_order)
+    elif trade_type == 'volume':
+        how_many_each_order = decimal.Decimal(total_amount_var) * decimal.Decimal(trade_size_percent_var)
+        return str(how_many_each_order)
+    # POV orders are sized as they go, from what's trading at the time
+    return None
+
+
+# The price to place an order at. If there's a local order book for the pair and the_volume is given,
+# this is the deepest level the order needs to fill completely. Otherwise it's the best bid / ask * 0.999.
+def get_current_ask_and_buy(the_pair, order_direction, limit_price, the_volume=None):
+    limit_price = decimal.Decimal(limit_price)
+    the_fill = None
+    if the_volume is not None:
+        the_fill = kraken_api.order_books.fill_price(the_pair, order_direction, the_volume)
+    if the_fill is not None:
+        # A sell takes the bids, so it needs to go as low as the last bid it uses. A buy, as high as the last ask.
+        book_price = decimal.Decimal(str(the_fill['worst_price']))
+        if order_direction == 'sell':
+            return max([limit_price, book_price])
+        else:
+            return min([limit_price, book_price])
+    current_ask = kraken_api.ticker_information[the_pair].ask
+    current_bid = kraken_api.ticker_information[the_pair].bid
+    if order_direction == 'sell':
+        order_sell = current_ask * decimal.Decimal(0.999)
+        the_price = max([limit_price, order_sell])
+        return the_price
+    else:
+        order_buy = current_bid * decimal.Decimal(0.999)
+        the_price = min([limit_price, order_buy])
+        return the_price
+
+
+# https://docs.kraken.com/rest/#tag/User-Trading/operation/addOrder
+# Used to generate buy or sell orders. Returns the txid of the new order.
+# Raises OrderError if Kraken turned it down, or it still didn't go through once its retries were used up.
+# Goes through the batcher like every schedule's order, so an order whose answer got lost is looked up
+# instead of being sent twice ( OrderError's kind is 'unknown' if that couldn't be found out ).
+def generate_order(order_direction: str, volume: str, pair: str, price: str):
+    try:
+        the_txid = batcher.submit(order_direction, volume, pair, str(price)).result()
+    except OrderError as e:
+        print(f"There was an issue in the order: {e.errors}")
+        raise
+    print(f'Order placed: {the_txid}')
+    # Known right away so it can be cancelled, the rest of its information is fetched by the tracker
+    kraken_api.order_tracker.add_submitted(the_txid, order_direction, volume, pair, price)
+    return the_txid
+
+
+# Every cancel goes through here, so cancels that are asked for at the same time go out together.
+# Each key has its own, cancel_pipeline is the main key's.
+cancel_pipelines = {each_key.name: CancelPipeline(each_key.request, each_key.order_tracker, find_pair_name,
+                                                  the_limiter=each_key.limiter, the_retry_policy=each_key.retry_policy)
+                    for each_key in kraken_api.key_pool}
+cancel_pipeline = cancel_pipelines[kraken_api.key_pool.main.name]
+
+
+# Cancels these orders in the background, each with the key that placed it.
+# Returns a Future for each txid, whose result is True if it was cancelled.
+def cancel_orders(txids):
+    the_futures = {}
+    by_key = {}
+    for each_txid in txids:
+        by_key.setdefault(kraken_api.key_for_order(each_txid).name, []).append(each_txid)
+    for each_name in by_key:
+        the_futures.update(zip(by_key[each_name], cancel_pipelines[each_name].cancel(by_key[each_name])))
+    return [the_futures[each_txid] for each_txid in txids]
+
+
+def cancel_all_orders():
+    return [each_future for each_name in cancel_pipelines for each_future in cancel_pipelines[each_name].cancel_all()]
+
+
+# Used to close an order and wait for the answer. Returns True if the order was cancelled.
+def close_this_order(txid):
+    return cancel_orders([txid])[0].result()
+
+
+# The seconds between a schedule's steps as a float. Raises ValueError unless it's a number more than 0:
+# 0 or less would place every order at once, and NaN never compares as more than 0.
+def check_interval(interval):
+    try:
+        the_interval = float(interval)
+    except (TypeError, ValueError):
+        raise ValueError(f"The interval has to be a number of seconds, not {interval!r}")
+    if not 0 < the_interval < float('inf'):
+        raise ValueError(f"The interval has to be more than 0 seconds, not {interval!r}")
+    return the_interval
+
+
+# Turns what the new order screen ( or a schedules file ) asks for into a schedule
+# trade_size is the amount of orders for "fixed", the volume percent for "volume" and the share of volume for "pov"
+# Raises ValueError if the interval isn't more than 0 seconds.
+def create_schedule(pair, direction, limit_price, total_amount, interval, trade_type, trade_size):
+    interval = check_interval(interval)
+    # Ids carry on from the schedules in the journal
+    open_journal()
+    return {'id': next(schedule_ids),
+            'total_orders': int(decimal.Decimal(trade_size)) if trade_type != 'pov' else 0,
+            'order_sizes': calculate_order_sizes(trade_type, total_amount, trade_size),
+            'pair': pair,
+            'limit_price': decimal.Decimal(limit_price),
+            'total_amount': total_amount,
+            'interval': interval,
+            'trade_type': trade_type,
+            'trade_size': trade_size,
+            'direction': direction,
+            'orders': {},
+            # The name of the API key its orders are placed with, picked when it starts
+            'key': None,
+            'orders_in_flight': 0,
+            # Orders it's sent to Kraken, placed or not. Each one's seq is its number in this.
+            'orders_sent': 0,
+            'volume_in_flight': decimal.Decimal(0),
+            # POV only: volume that's the schedule's share of what traded, but hasn't been placed yet
+            'pov_owed': decimal.Decimal(0),
+            'pov_last_step': None,
+            'errors': [],
+            'orders_placed': 0,
+            'volume_placed': decimal.Decimal(0),
+            'last_order_at': None,
+            'status': 'not_started'}
+
+
+# Child orders from every schedule go through here, so ones for the same pair can share an AddOrderBatch.
+# Each key has its own, so orders for different keys go out side by side. batcher is the main key's.
+batchers = {each_key.name: OrderBatcher(each_key.request, the_retry_policy=each_key.retry_policy)
+            for each_key in kraken_api.key_pool}
+batcher = batchers[kraken_api.key_pool.main.name]
+# Held while a schedule's counters are changed, since batch results come back on the batcher's thread
+schedule_lock = threading.Lock()
+# Schedules from the journal that hadn't finished, until they're resumed
+to_resume = []
+# Fields of a schedule that are Decimal, and come back from the journal as strings
+decimal_fields = ('limit_price', 'volume_in_flight', 'pov_owed', 'volume_placed')
+
+
+# Everything that changes a schedule once it's started is a record, see journal.py.
+# The same function changes the schedule while it runs and when it's read back from the journal after a restart,
+# so both always end up the same. Must be called with schedule_lock held.
+def apply_record(schedule, the_record):
+    the_type = the_record['type']
+    the_volume = decimal.Decimal(the_record.get('volume', 0))
+    if the_type == 'status':
+        schedule['status'] = the_record['status']
+    elif the_type == 'submit':
+        if schedule['trade_type'] == 'pov':
+            schedule['pov_owed'] = decimal.Decimal(the_record['pov_owed'])
+        else:
+            schedule['total_orders'] -= 1
+        schedule['orders_sent'] = the_record['seq']
+        schedule['orders_in_flight'] += 1
+        schedule['volume_in_flight'] += the_volume
+    elif the_type in ('placed', 'failed', 'lost'):
+        the_count = the_record.get('orders', 1)
+        schedule['orders_in_flight'] -= the_count
+        schedule['volume_in_flight'] -= the_volume
+        if the_type == 'failed':
+            # The order wasn't placed, so it's put back to be tried again on the schedule's next step.
+            # Unless it never could be ( insufficient funds, invalid arguments ), which fails the schedule instead.
+            if the_record.get('kind') != 'permanent':
+                if schedule['trade_type'] == 'pov':
+                    schedule['pov_owed'] += the_volume
+                else:
+                    schedule['total_orders'] += 1
+            schedule['errors'].append({'time': the_record['time'], 'error': the_record['error'],
+                                       'kind': the_record.get('kind'), **the_record['order']})
+        else:
+            schedule['orders_placed'] += the_count
+            schedule['volume_placed'] += the_volume
+            schedule['last_order_at'] = the_record['time']
+            if the_type == 'placed':
+                schedule['orders'][the_record['txid']] = the_record['order']
+    elif the_type == 'end':
+        the_order = schedule['orders'].get(the_record['txid'])
+        if the_order is not None:
+            the_order['ended'] = the_record['event']
+            if the_record['event'] == 'filled':
+                the_order['filled_at'] = the_record['time']
+
+
+# Changes the schedule and adds the change to the journal. Returns a Future that resolves once it's on disk.
+# Must be called with schedule_lock held, so a snapshot never has half of a change.
+def record(schedule, the_record):
+    the_record = {'id': schedule['id'], 'time': time.time(), **the_record}
+    apply_record(schedule, the_record)
+    return journal.append(the_record)
+
+
+# A schedule as plain JSON, for the journal
+def schedule_to_json(schedule):
+    return json.loads(json.dumps(schedule, default=str))
+
+
+# Turns a schedule from the journal back into one that can run
+def schedule_from_json(the_data):
+    schedule = dict(the_data)
+    for each_field in decimal_fields:
+        schedule[each_field] = decimal.Decimal(schedule[each_field])
+    schedule['pov_last_step'] = None
+    return schedule
+
+
+# What the journal's snapshot has: every schedule that's been started. Called on the journal's thread.
+def journal_state():
+    with schedule_lock:
+        the_state = [schedule_to_json(each_schedule) for each_schedule in schedules.values()
+                     if each_schedule['status'] != 'not_started']
+        journal.rotate()
+    return the_state
+
+
+# Reads the journal back into schedules and starts writing to it. Only does anything the first time.
+# Schedules that were finished ( or cancelled ) and have no orders left open are forgotten.
+# The ones that were running or paused wait in to_resume until resume_schedules().
+def open_journal():
+    global schedule_ids
+    with schedule_lock:
+        if journal.thread is not None:
+            return
+        the_state, the_records = journal.load()
+        restored = {each_data['id']: schedule_from_json(each_data) for each_data in the_state or []}
+        for each_record in the_records:
+            if each_record['type'] == 'start':
+                restored[each_record['id']] = schedule_from_json(each_record['schedule'])
+            elif each_record['id'] in restored:
+                apply_record(restored[each_record['id']], each_record)
+        journal.state_function = journal_state
+        journal.start()
+        if restored:
+            schedule_ids = itertools.count(max(max(restored) + 1, next(schedule_ids)))
+        for each_schedule in restored.values():
+            open_txids = [each_txid for each_txid in each_schedule['orders']
+                          if not each_schedule['orders'][each_txid].get('ended')]
+            if each_schedule['status'] not in ('running', 'paused') and not open_txids:
+                continue
+            schedules[each_schedule['id']] = each_schedule
+            # Orders that were sent but never answered might have been placed. They're counted as placed,
+            # since placing them again could go over total_amount.
+            if each_schedule['orders_in_flight']:
+                print(f"Schedule {each_schedule['id']}: {each_schedule['orders_in_flight']} order(s) for "
+                      f"{each_schedule['volume_in_flight']} were sent before stopping but never answered, "
+                      f"they're counted as placed")
+                record(each_schedule, {'type': 'lost', 'orders': each_schedule['orders_in_flight'],
+                                       'volume': each_schedule['volume_in_flight']})
+            for each_txid in open_txids:
+                order_owners[each_txid] = each_schedule
+            if each_schedule['status'] in ('running', 'paused'):
+                to_resume.append(each_schedule)
+
+
+# On startup: picks every schedule up where it stopped. Orders they placed before are looked up by the tracker,
+# so fills that happened in the meantime still count. Returns how many schedules were resumed.
+def resume_schedules():
+    open_journal()
+    unfinished = list(to_resume)
+    del to_resume[:]
+    for each_schedule in list(schedules.values()):
+        for each_txid in each_schedule['orders']:
+            the_order = each_schedule['orders'][each_txid]
+            if not the_order.get('ended'):
+                kraken_api.key_pool.get(each_schedule['key']).order_tracker.add_submitted(
+                    each_txid, each_schedule['direction'], the_order['volume'], each_schedule['pair'], the_order['price'])
+    for each_schedule in unfinished:
+        print(f"Resuming schedule {each_schedule['id']}: {each_schedule['orders_placed']} order(s) placed, "
+              f"{each_schedule['volume_placed']} of {each_schedule['total_amount']} {each_schedule['pair']}")
+        run_schedule(each_schedule)
+        if each_schedule['status'] == 'paused':
+            scheduler.pause(each_schedule['id'])
+    return len(unfinished)
+
+
+# Fill latency is recorded per schedule, for metrics and in the schedule's own order information
+def record_order_end(the_event, txid):
+    schedule = order_owners.pop(txid, None)
+    if schedule is None:
+        return
+    with schedule_lock:
+        record(schedule, {'type': 'end', 'txid': txid, 'event': the_event})
+        the_order = schedule['orders'].get(txid)
+    if the_event == 'filled' and the_order is not None and the_order.get('placed_at'):
+        metrics.observe('order_fill_seconds', (('schedule', str(schedule['id'])),),
+                        the_order['filled_at'] - the_order['placed_at'])
+
+
+# Called on the batcher's thread once Kraken has answered for one of the schedule's orders.
+# An order that failed is put back for the schedule's next step, unless the failure was permanent: then the schedule
+# is 'failed', and the error is published to 'schedule_errors' on the event bus for the GUI to show.
+def order_result(schedule, the_order, the_future):
+    try:
+        the_txid = the_future.result()
+    except OrderError as e:
+        if e.kind == 'unknown':
+            # Kraken might have placed it, so it's counted as placed rather than risk placing it twice
+            print(f"Schedule {schedule['id']}: couldn't find out if the order for {the_order['volume']} "
+                  f"{schedule['pair']} was placed ( {str(e)} ), it's counted as placed")
+            with schedule_lock:
+                record(schedule, {'type': 'lost', 'seq': the_order['seq'], 'volume': the_order['volume']})
+            return
+        print(f"Schedule {schedule['id']}: order for {the_order['volume']} {schedule['pair']} failed: {str(e)}")
+        with schedule_lock:
+            record(schedule, {'type': 'failed', 'seq': the_order['seq'], 'volume': the_order['volume'],
+                              'error': str(e), 'kind': e.kind, 'order': the_order})
+            # Sending it again would only get the same answer every interval, so the schedule stops here
+            the_schedule_failed = e.kind == 'permanent' and schedule['status'] in ('running', 'paused')
+            if the_schedule_failed:
+                record(schedule, {'type': 'status', 'status': 'failed'})
+        if the_schedule_failed:
+            scheduler.cancel(schedule['id'])
+            the_message = (f"Schedule {schedule['id']} ( {schedule['direction']} {schedule['pair']} ) stopped, "
+                           f"Kraken turned down its order for {the_order['volume']}: {str(e)}")
+            print(the_message)
+            bus.publish('schedule_errors', schedule['id'], the_message)
+        return
+    print(f"Schedule {schedule['id']}: placed order {the_txid}")
+    the_order['placed_at'] = time.time()
+    metrics.observe('order_submit_seconds', (('schedule', str(schedule['id'])),),
+                    the_order['placed_at'] - the_order['submitted_at'])
+    with schedule_lock:
+        record(schedule, {'type': 'placed', 'seq': the_order['seq'], 'txid': the_txid, 'volume': the_order['volume'],
+                          'order': the_order})
+    order_owners[the_txid] = schedule
+    # Known right away so it can be cancelled, the rest of its information is fetched by the tracker
+    kraken_api.key_pool.get(schedule['key']).order_tracker.add_submitted(the_txid, schedule['direction'],
+                                                                         the_order['volume'], schedule['pair'],
+                                                                         the_order['price'])
+
+
+# What's left of a POV schedule's total_amount that isn't placed or on its way
+def pov_volume_left(schedule):
+    return decimal.Decimal(schedule['total_amount']) - schedule['volume_placed'] - schedule['volume_in_flight']
+
+
+# POV schedules place their share ( trade_size ) of the volume that trades on the pair.
+# Every step adds the share of what traded since the step before to what's owed, going by how fast the last
+# pov_window seconds of public trades went. Once what's owed is at least the pair's minimum order, it's placed.
+# So orders get bigger when the market is busy and smaller when it's quiet.
+# Returns the order size, or None if there's nothing to place this step.
+def next_pov_order_size(schedule):
+    pair = schedule['pair']
+    now = time.time()
+    the_rate = kraken_api.trade_flow.volume_rate(pair)
+    with schedule_lock:
+        if the_rate is not None:
+            if schedule['pov_last_step'] is not None:
+                schedule['pov_owed'] += (decimal.Decimal(schedule['trade_size']) * the_rate
+                                         * decimal.Decimal(now - schedule['pov_last_step']))
+            schedule['pov_last_step'] = now
+        the_size = min(schedule['pov_owed'], pov_volume_left(schedule))
+    the_size = kraken_api.pair_index.round_volume(pair, the_size)
+    the_minimum, _ = kraken_api.pair_index.minimum_order(pair)
+    if the_size <= 0 or (the_minimum is not None and the_size < the_minimum):
+        return None
+    return str(the_size)
+
+
+# True while the schedule still has something to place
+def orders_left(schedule):
+    if schedule['trade_type'] != 'pov':
+        return schedule["total_orders"] >= 1
+    the_minimum, _ = kraken_api.pair_index.minimum_order(schedule['pair'])
+    return pov_volume_left(schedule) >= (the_minimum or decimal.Decimal('1e-8'))
+
+
+# One step of a schedule: queues its next order if the price is good.
+# Returns the seconds until the next step, or None once there are no orders left.
+# This is ran by the scheduler's worker threads. It doesn't wait for Kraken to answer, order_result() does that.
+def process_next_order(schedule):
+    if kraken_api.last_updates['kill'] or schedule['status'] != 'running':
+        return None
+    limit_price = schedule["limit_price"]
+    order_direction = schedule['direction']
+    pair = schedule["pair"]
+    if schedule['trade_type'] == 'pov':
+        the_order_size = next_pov_order_size(schedule)
+    elif schedule["total_orders"] >= 1:
+        the_order_size = str(kraken_api.pair_index.round_volume(pair, schedule["order_sizes"]))
+    else:
+        the_order_size = None
+    # If there's an order to place and get_current_ask_and_buy() is good, ORDER. Otherwise, wait for interval
+    if the_order_size is not None:
+        the_price = get_current_ask_and_buy(pair, order_direction, limit_price, the_order_size)
+        # Round toward the limit price's side, so rounding never makes the price worse than the limit
+        the_price = kraken_api.pair_index.round_price(pair, the_price, decimal.ROUND_UP if order_direction == 'sell'
+                                                      else decimal.ROUND_DOWN)
+        if the_price >= limit_price:
+            the_fill = kraken_api.order_books.fill_price(pair, order_direction, the_order_size)
+            the_order = {'price': str(the_price), 'volume': the_order_size,
+                         'expected_vwap': the_fill['vwap'] if the_fill else None,
+                         'expected_slippage': the_fill['slippage'] if the_fill else None,
+                         'submitted_at': time.time()}
+            with schedule_lock:
+                the_order['seq'] = schedule['orders_sent'] + 1
+                the_written = record(schedule, {'type': 'submit', 'seq': the_order['seq'], 'volume': the_order_size,
+                                                'price': the_order['price'],
+                                                'pov_owed': schedule['pov_owed'] - decimal.Decimal(the_order_size)})
+            # Write-ahead: after a crash, the journal always knows about every order that might have been sent
+            the_written.result()
+            the_future = batchers[schedule['key']].submit(order_direction, the_order_size, pair, str(the_price))
+            the_future.add_done_callback(lambda done_future: order_result(schedule, the_order, done_future))
+        elif schedule['trade_type'] == 'pov':
+            # Volume that traded while the price was past the limit isn't caught up on later
+            with schedule_lock:
+                schedule['pov_owed'] = decimal.Decimal(0)
+    # How many orders are left? A schedule isn't finished while orders it sent could still come back as failed.
+    with schedule_lock:
+        if not orders_left(schedule) and schedule['orders_in_flight'] == 0:
+            if schedule['status'] == 'running':
+                record(schedule, {'type': 'status', 'status': 'finished'})
+            return None
+    return float(schedule["interval"])
+
+
+# Every schedule shares these threads
+scheduler = Scheduler(process_next_order, scheduler_workers, "schedules")
+
+
+# Goes to the key with the fewest schedules that are still going, unless it already has a key in the pool
+def assign_key(schedule):
+    if schedule.get('key') in kraken_api.key_pool.keys:
+        return
+    the_loads = {}
+    for each_schedule in list(schedules.values()):
+        if each_schedule['status'] in ('running', 'paused') and each_schedule.get('key'):
+            the_loads[each_schedule['key']] = the_loads.get(each_schedule['key'], 0) + 1
+    schedule['key'] = kraken_api.key_pool.assign(the_loads)
+
+
+def start_schedule(schedule):
+    open_journal()
+    assign_key(schedule)
+    with schedule_lock:
+        schedules[schedule['id']] = schedule
+        schedule['status'] = 'running'
+        journal.append({'type': 'start', 'id': schedule['id'], 'time': time.time(),
+                        'schedule': schedule_to_json(schedule)})
+    run_schedule(schedule)
+    return schedule['id']
+
+
+def run_schedule(schedule):
+    kraken_api.stream_pairs([schedule['pair']])
+    kraken_api.track_order_book(schedule['pair'])
+    if schedule['trade_type'] == 'pov':
+        kraken_api.track_trades(schedule['pair'])
+    scheduler.add(schedule['id'], schedule)
+
+
+def set_status(schedule_id, from_statuses, the_status):
+    with schedule_lock:
+        if schedules[schedule_id]['status'] not in from_statuses:
+            return False
+        if schedules[schedule_id]['status'] == 'not_started':
+            schedules[schedule_id]['status'] = the_status
+        else:
+            record(schedules[schedule_id], {'type': 'status', 'status': the_status})
+        return True
+
+
+def pause_schedule(schedule_id):
+    if set_status(schedule_id, ('running',), 'paused'):
+        scheduler.pause(schedule_id)
+
+
+def resume_schedule(schedule_id):
+    if set_status(schedule_id, ('paused',), 'running'):
+        scheduler.resume(schedule_id)
+
+
+# Stops placing new orders for the schedule. Orders it already placed stay open.
+def cancel_schedule(schedule_id):
+    if set_status(schedule_id, ('not_started', 'running', 'paused'), 'cancelled'):
+        scheduler.cancel(schedule_id)
+
+
+# True while any schedule still has orders left to place
+def schedules_active():
+    return any(schedules[each_id]['status'] in ('running', 'paused') for each_id in list(schedules))
+
+
+def stop():
+    scheduler.stop()
+    for each_name in batchers:
+        batchers[each_name].stop()
+    for each_name in cancel_pipelines:
+        cancel_pipelines[each_name].stop()
+    journal.stop()
+    kraken_api.stop_updates()
+
+
+# Reads a schedules file. Schedules with something missing are skipped.
+def load_schedules(the_path):
+    with open(the_path) as the_file:
+        the_data = json.load(the_file)
+    loaded_schedules = []
+    for each_schedule in the_data:
+        these_werent_found = check_existence_of_all_vars(each_schedule.get('pair'), each_schedule.get('limit_price'),
+                                                         each_schedule.get('total_amount'),
+                                                         each_schedule.get('interval'),
+                                                         each_schedule.get('trade_type'),
+                                                         each_schedule.get('trade_size'))
+        if these_werent_found or each_schedule.get('direction') not in ('buy', 'sell'):
+            print(f"Skipping schedule {each_schedule}, it's missing: {', '.join(these_werent_found) or 'direction'}")
+            continue
+        the_trade_type = each_schedule.get('trade_type', 'fixed')
+        if the_trade_type not in ('fixed', 'volume', 'pov'):
+            print(f"Skipping schedule {each_schedule}, its trade_type has to be fixed, volume or pov")
+            continue
+        # Amounts that aren't numbers fail in create_schedule like a bad interval does
+        try:
+            loaded_schedules.append(create_schedule(each_schedule['pair'], each_schedule['direction'],
+                                                    str(each_schedule['limit_price']),
+                                                    str(each_schedule['total_amount']), each_schedule['interval'],
+                                                    the_trade_type, str(each_schedule['trade_size'])))
+        except (KeyError, decimal.InvalidOperation, ValueError) as e:
+            print(f"Skipping schedule {each_schedule}: {e!r}")
+    return loaded_schedules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Kraken order schedules without the GUI")
+    parser.add_argument('schedules_file', nargs='?',
+                        help="JSON file with a list of schedules. Without one, only the schedules in the journal "
+                             "that hadn't finished are run.")
+    arguments = parser.parse_args()
+    # Read before any new schedule is made, so their ids carry on from the journal's
+    open_journal()
+    loaded_schedules = load_schedules(arguments.schedules_file) if arguments.schedules_file else []
+    if not loaded_schedules and not any(schedules[each_id]['status'] in ('running', 'paused') for each_id in schedules):
+        print("No schedules to run.")
+        return 1
+    kraken_api.start_updates()
+    print("Loading.. one moment!")
+    kraken_api.wait_until_ready()
+    resume_schedules()
+    for each_schedule in loaded_schedules:
+        start_schedule(each_schedule)
+    try:
+        while schedules_active():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    print("Killing threads, one moment..")
+    stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
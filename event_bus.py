@@ -0,0 +1,58 @@
+# Hands changes from the background threads to the Tk main loop.
+#
+# Tk isn't thread-safe, so background threads shouldn't touch widgets. Instead they publish(), which only
+# stores the change, and the Tk thread drains everything that's been published every drain_interval ms
+# with after(). Changes are kept per ( topic, key ), latest one wins, so 100 updates to orders between
+# two drains turn into one call to the 'orders' subscribers with all of them in it ( and one redraw ).
+#
+# Doesn't import tkinter: attach() only needs something with an after() method, so headless code can
+# publish to it all the same and nothing is ever drained.
+import threading
+
+# Milliseconds between drains
+drain_interval = 100
+
+
+class EventBus:
+    def __init__(self):
+        # topic -> {key: latest value}
+        self.pending = {}
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    # Safe to call from any thread
+    def publish(self, the_topic, the_key, the_value):
+        with self.lock:
+            self.pending.setdefault(the_topic, {})[the_key] = the_value
+
+    # the_function is called on the Tk thread with {key: latest value} for everything published to the_topic
+    # since the last drain
+    def subscribe(self, the_topic, the_function):
+        self.subscribers.setdefault(the_topic, []).append(the_function)
+
+    # Everything published since the last time, and starts over
+    def take(self):
+        with self.lock:
+            the_pending, self.pending = self.pending, {}
+        return the_pending
+
+    def drain(self):
+        the_pending = self.take()
+        for each_topic in the_pending:
+            for each_subscriber in self.subscribers.get(each_topic, []):
+                # One broken subscriber shouldn't stop the others, or the next drain
+                try:
+                    each_subscriber(the_pending[each_topic])
+                except Exception as e:
+                    print(f"Event bus: subscriber for {each_topic} failed: {str(e)}")
+
+    # Starts draining on the_widget's thread ( the Tk main loop ), every interval_ms
+    def attach(self, the_widget, interval_ms=drain_interval):
+        def drain_and_reschedule():
+            self.drain()
+            the_widget.after(interval_ms, drain_and_reschedule)
+        the_widget.after(interval_ms, drain_and_reschedule)
+
+
+# The bus every part of the program shares
+bus = EventBus()
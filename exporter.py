@@ -0,0 +1,275 @@
+# Exports the account's trades, closed orders and ledger entries to files, for reconciliation.
+# https://docs.kraken.com/rest/#tag/User-Data/operation/getTradeHistory
+# https://docs.kraken.com/rest/#tag/User-Data/operation/getClosedOrders
+# https://docs.kraken.com/rest/#tag/User-Data/operation/getLedgers
+#
+# Example: python exporter.py                      ( everything, to CSV files in export_dir )
+#          python exporter.py trades --key second   ( one kind, for one of extra_api_keys )
+#          python exporter.py ledgers --format parquet
+#
+# Kraken hands these out 50 rows at a time, newest first, with "ofs" picking the page. Going through a year of
+# history one page after another means waiting on one round trip after another. Here the end of the export is
+# fixed when it starts, so the pages can't move while it runs, and the first page's "count" says how many there are.
+# The rest are fetched by export_workers threads at once, oldest first. Only a few pages are ever held:
+# each one is written as soon as every page before it has been, so rows go out oldest to newest.
+# Every call asks the key's limiter to leave export_reserve credits on the API counter after it ( checked and
+# charged in one go, see RateLimiter.acquire ), so the program's own order checks never have to wait on an export.
+# TradesHistory and Ledgers cost 2 credits a call, so a long export is paced by the limits, not by round trips.
+#
+# Exports carry on from where the last one stopped: the time of the last row written, and which rows had that time,
+# are saved after every page. A CSV that was cut off halfway through a page is cut back to the last saved page.
+# A Parquet file ( needs pyarrow ) is only complete once it's closed, so every export writes a new one,
+# and one that was cut off is started over.
+import argparse
+import collections
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import export_dir, export_workers, export_reserve
+from retry_policy import RequestFailed
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# How many rows Kraken hands out in one call
+page_size = 50
+# What each kind of export calls, where the rows are in the result, which field is the row's time,
+# and the columns written ( descr.pair is 'pair' in the order's 'descr' ). Every file also starts with the row's id.
+datasets = {'trades': {'path': '/0/private/TradesHistory', 'result': 'trades', 'time': 'time', 'data': {},
+                       'columns': ('ordertxid', 'postxid', 'pair', 'time', 'type', 'ordertype', 'price', 'cost', 'fee',
+                                   'vol', 'margin', 'misc', 'ledgers')},
+            'orders': {'path': '/0/private/ClosedOrders', 'result': 'closed', 'time': 'closetm',
+                       'data': {'closetime': 'close'},
+                       'columns': ('refid', 'userref', 'status', 'reason', 'opentm', 'starttm', 'expiretm', 'closetm',
+                                   'descr.pair', 'descr.type', 'descr.ordertype', 'descr.price', 'descr.price2',
+                                   'descr.leverage', 'vol', 'vol_exec', 'cost', 'fee', 'price', 'stopprice',
+                                   'limitprice', 'misc', 'oflags')},
+            'ledgers': {'path': '/0/private/Ledgers', 'result': 'ledger', 'time': 'time', 'data': {},
+                        'columns': ('refid', 'time', 'type', 'subtype', 'aclass', 'asset', 'amount', 'fee',
+                                    'balance')}}
+
+
+# the_row's value for the_column, as a string
+def cell(the_row, the_column):
+    the_value = the_row
+    for each_part in the_column.split('.'):
+        the_value = the_value.get(each_part, '') if isinstance(the_value, dict) else ''
+    if isinstance(the_value, list):
+        return ','.join(str(each_value) for each_value in the_value)
+    return '' if the_value is None else str(the_value)
+
+
+# Writes rows to <name>.csv, which every export adds to
+class CsvOutput:
+    def __init__(self, the_path, the_columns, the_size):
+        self.path = the_path
+        self.file = open(the_path, 'a+', newline='')
+        # Anything after the last page that was saved is from an export that was cut off
+        the_size = min(the_size, os.path.getsize(the_path))
+        self.file.truncate(the_size)
+        self.file.seek(the_size)
+        self.writer = csv.writer(self.file)
+        if the_size == 0:
+            self.writer.writerow(the_columns)
+
+    def write(self, the_rows):
+        self.writer.writerows(the_rows)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    # How far into the file the rows written so far go
+    def size(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+    # The export was cut off. What's been written stays, the next export carries on after it.
+    def abandon(self):
+        self.file.close()
+
+
+# Writes rows to a new <name>.<time>.parquet, one row group per page. Every column is a string, like they are in
+# Kraken's answers. The file has a .part name until it's closed.
+class ParquetOutput:
+    def __init__(self, the_path, the_columns):
+        self.path = the_path
+        self.columns = the_columns
+        self.schema = pyarrow.schema([(each_column, pyarrow.string()) for each_column in the_columns])
+        self.writer = pyarrow.parquet.ParquetWriter(the_path + '.part', self.schema)
+
+    def write(self, the_rows):
+        self.writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array([each_row[the_index] for each_row in the_rows], pyarrow.string())
+             for the_index in range(len(self.columns))], schema=self.schema))
+
+    def size(self):
+        return None
+
+    def close(self):
+        self.writer.close()
+        os.replace(self.path + '.part', self.path)
+
+    # The export was cut off, and the next one writes a new file
+    def abandon(self):
+        self.writer.close()
+        os.remove(self.path + '.part')
+
+
+class Exporter:
+    # the_key is the ApiKey ( see key_pool.py ) whose account is exported
+    def __init__(self, the_key, the_dir=export_dir, workers=export_workers, reserve=export_reserve):
+        if not os.path.isabs(the_dir):
+            the_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), the_dir)
+        # Every key's files go to their own folder
+        self.dir = os.path.join(the_dir, the_key.name)
+        self.key = the_key
+        self.workers = workers
+        self.reserve = reserve
+
+    def state_path(self):
+        return os.path.join(self.dir, 'state.json')
+
+    # Where each kind of export stopped: {name: {'last_time': .., 'last_ids': [..], 'csv_size': ..}}
+    def load_state(self):
+        try:
+            with open(self.state_path()) as the_file:
+                return json.load(the_file)
+        except (OSError, ValueError):
+            return {}
+
+    # Written to a temporary file first, so a crash halfway through never loses where the export was
+    def save_state(self, the_state):
+        with open(self.state_path() + '.tmp', 'w') as the_file:
+            json.dump(the_state, the_file)
+            the_file.flush()
+            os.fsync(the_file.fileno())
+        os.replace(self.state_path() + '.tmp', self.state_path())
+
+    # One page of the_dataset's rows between the_start ( left out ) and the_end: ({id: row}, how many there are)
+    def fetch_page(self, the_dataset, the_start, the_end, the_offset):
+        the_result = self.key.retry_policy.send(self.key.request, the_dataset['path'],
+                                                {**the_dataset['data'], 'start': str(the_start),
+                                                 'end': str(the_end), 'ofs': str(the_offset)}, reserve=self.reserve)
+        return the_result.get(the_dataset['result']) or {}, int(the_result.get('count', 0))
+
+    # Exports every row of the_name ( a key of datasets ) since the last export, up to now. Returns how many were written.
+    # the_format is 'csv' or 'parquet'. the_start is where the first export of it starts ( a unix time ).
+    def export(self, the_name, the_format='csv', the_start=0):
+        if the_format == 'parquet' and pyarrow is None:
+            print("pyarrow is needed to export to Parquet, nothing was exported")
+            return 0
+        the_dataset = datasets[the_name]
+        os.makedirs(self.dir, exist_ok=True)
+        the_state = self.load_state()
+        the_progress = the_state.get(the_name, {'last_time': the_start, 'last_ids': [], 'csv_size': 0})
+        last_time = the_progress['last_time']
+        last_ids = set(the_progress['last_ids'])
+        # Kraken leaves out rows at exactly "start", and rows at last_time might not all have been written,
+        # so the pages start a little before it. Rows that were already written are left out below.
+        the_start = max(0, last_time - 1)
+        the_end = time.time()
+        start_time = time.perf_counter()
+        try:
+            first_page, the_count = self.fetch_page(the_dataset, the_start, the_end, 0)
+        except RequestFailed as e:
+            print(f"Couldn't export {the_name}: {', '.join(e.errors)}")
+            return 0
+        the_columns = ('id',) + the_dataset['columns']
+        if the_format == 'parquet':
+            the_output = ParquetOutput(os.path.join(self.dir, f'{the_name}.{int(the_end)}.parquet'), the_columns)
+        else:
+            the_output = CsvOutput(os.path.join(self.dir, f'{the_name}.csv'), the_columns,
+                                   the_progress.get('csv_size', 0))
+        the_offsets = list(range(page_size * ((the_count - 1) // page_size), 0, -page_size))
+        rows_written = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"export_{the_name}") as the_pool:
+            # Pages being fetched, oldest first. Never more than a few more than there are workers.
+            the_pages = collections.deque()
+            the_offsets = iter(the_offsets)
+
+            def fetch_next():
+                the_offset = next(the_offsets, None)
+                if the_offset is not None:
+                    the_pages.append(the_pool.submit(self.fetch_page, the_dataset, the_start, the_end, the_offset))
+            try:
+                for _ in range(self.workers * 2):
+                    fetch_next()
+                while True:
+                    if the_pages:
+                        the_rows, _ = the_pages.popleft().result()
+                        fetch_next()
+                    elif first_page is not None:
+                        the_rows, first_page = first_page, None
+                    else:
+                        break
+                    # Oldest first. Rows with the same time stay in the order Kraken had them.
+                    the_time = the_dataset['time']
+                    new_rows = []
+                    for each_id, each_row in sorted(reversed(list(the_rows.items())),
+                                                    key=lambda each_item: float(each_item[1].get(the_time, 0))):
+                        each_time = float(each_row.get(the_time, 0))
+                        if each_time < last_time or (each_time == last_time and each_id in last_ids):
+                            continue
+                        new_rows.append([each_id] + [cell(each_row, each_column)
+                                                     for each_column in the_dataset['columns']])
+                        if each_time > last_time:
+                            last_time = each_time
+                            last_ids = set()
+                        last_ids.add(each_id)
+                    if not new_rows:
+                        continue
+                    the_output.write(new_rows)
+                    rows_written += len(new_rows)
+                    # A Parquet file can't be carried on with, so its progress is only saved once it's closed
+                    if the_format == 'csv':
+                        the_state[the_name] = {'last_time': last_time, 'last_ids': sorted(last_ids),
+                                               'csv_size': the_output.size()}
+                        self.save_state(the_state)
+            except RequestFailed as e:
+                print(f"Couldn't finish exporting {the_name}, the next export carries on from here: "
+                      f"{', '.join(e.errors)}")
+                for each_page in the_pages:
+                    each_page.cancel()
+                the_output.abandon()
+                return rows_written
+        the_output.close()
+        if the_format == 'parquet':
+            the_state[the_name] = {'last_time': last_time, 'last_ids': sorted(last_ids),
+                                   'csv_size': the_progress.get('csv_size', 0)}
+            self.save_state(the_state)
+        print(f"Exported {rows_written} {the_name} row(s) to {the_output.path} "
+              f"in {time.perf_counter() - start_time:.1f} s")
+        return rows_written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export trades, closed orders and ledger entries from Kraken")
+    parser.add_argument('which', nargs='*', help=f"What to export ( {', '.join(datasets)} ), everything if not given")
+    parser.add_argument('--format', choices=('csv', 'parquet'), default='csv')
+    parser.add_argument('--key', default='main', help="Which key's account to export, by its name in extra_api_keys")
+    parser.add_argument('--start', type=float, default=0,
+                        help="Unix time the first export starts from. Later exports carry on from where the last stopped.")
+    arguments = parser.parse_args()
+    for each_name in arguments.which:
+        if each_name not in datasets:
+            print(f"Can't export {each_name}, it has to be one of: {', '.join(datasets)}")
+            return 1
+    import kraken_api
+    if arguments.key not in kraken_api.key_pool.keys:
+        print(f"There's no key called {arguments.key}, the keys are: {', '.join(kraken_api.key_pool.keys)}")
+        return 1
+    the_exporter = Exporter(kraken_api.key_pool.get(arguments.key))
+    for each_name in arguments.which or datasets:
+        the_exporter.export(each_name, arguments.format, arguments.start)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+# A write-ahead journal of every schedule, so they pick up where they stopped after a crash or a restart.
+#
+# Schedules only ever lived in memory. If the program died halfway through one, how much of it was placed
+# had to be worked out by hand from OpenOrders and the trade history.
+# Here the engine adds a record for everything that changes a schedule: it being started, paused or finished,
+# every order being sent ( before it's sent ), and every order being placed, failing, filling or being cancelled.
+#
+# Records are lines of JSON in journal_dir, only ever appended to. Writing them is grouped: one thread writes
+# everything that's come in over the last sync_interval seconds and fsyncs once for all of it, so many schedules
+# sending orders at once share one fsync instead of waiting for one each. Anyone who needs a record on disk
+# before going on ( an order is only sent once its record is ) waits on the Future append() hands back.
+#
+# Once snapshot_every records have been written, the state of every schedule is written to a snapshot and the
+# records before it are deleted, so reading the journal back on startup never has more than that to go through.
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from config import journal_dir, journal_sync_interval, journal_snapshot_every
+
+
+class Journal:
+    def __init__(self, the_dir=journal_dir, sync_interval=journal_sync_interval, snapshot_every=journal_snapshot_every):
+        if not os.path.isabs(the_dir):
+            the_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), the_dir)
+        self.dir = the_dir
+        self.sync_interval = sync_interval
+        self.snapshot_every = snapshot_every
+        # Returns the state to snapshot, and has to call rotate() while nothing can add records. Set by the engine.
+        self.state_function = None
+        # [(segment, line, future)] waiting to be written
+        self.waiting = []
+        self.condition = threading.Condition()
+        # Records go to segment files ( journal.<segment>.log ), a new one is started at every snapshot
+        self.segment = 0
+        self.written = 0
+        self.file = None
+        self.file_segment = None
+        self.killed = False
+        self.failed = False
+        self.thread = None
+
+    def segment_path(self, the_segment):
+        return os.path.join(self.dir, f'journal.{the_segment}.log')
+
+    def snapshot_path(self):
+        return os.path.join(self.dir, 'snapshot.json')
+
+    # Reads the journal back: (the snapshot's state or None, [records written after it]).
+    # A line that was only half written when the program died is the last one, and is left out.
+    def load(self):
+        the_state = None
+        the_segment = 0
+        try:
+            with open(self.snapshot_path()) as the_file:
+                the_snapshot = json.load(the_file)
+            the_state = the_snapshot['state']
+            the_segment = the_snapshot['segment']
+        except (OSError, ValueError, KeyError):
+            pass
+        the_records = []
+        the_segments = sorted(int(each_name.split('.')[1]) for each_name in self.segment_names())
+        for each_segment in the_segments:
+            if each_segment < the_segment:
+                continue
+            with open(self.segment_path(each_segment)) as the_file:
+                for each_line in the_file:
+                    try:
+                        the_records.append(json.loads(each_line))
+                    except ValueError:
+                        break
+        self.segment = max(the_segments + [the_segment]) + 1
+        self.written = len(the_records)
+        return the_state, the_records
+
+    def segment_names(self):
+        try:
+            return [each_name for each_name in os.listdir(self.dir)
+                    if each_name.startswith('journal.') and each_name.endswith('.log')]
+        except OSError:
+            return []
+
+    def start(self):
+        if self.thread is None:
+            os.makedirs(self.dir, exist_ok=True)
+            self.thread = threading.Thread(target=self.run, name="journal", daemon=True)
+            self.thread.start()
+
+    # Queues the_record to be written. The Future resolves once it's on disk ( or right away if the journal
+    # can't be written ). Decimals and anything else JSON doesn't know are written as strings.
+    def append(self, the_record):
+        the_future = Future()
+        the_line = json.dumps(the_record, default=str) + '\n'
+        with self.condition:
+            if self.killed or self.failed or self.thread is None:
+                the_future.set_result(False)
+                return the_future
+            self.waiting.append((self.segment, the_line, the_future))
+            self.condition.notify()
+        return the_future
+
+    # Records after this go to a new segment. Called from state_function, with the engine's lock held.
+    def rotate(self):
+        with self.condition:
+            self.segment += 1
+            return self.segment
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.waiting and not self.killed:
+                    self.condition.wait()
+                if not self.waiting and self.killed:
+                    break
+            # Lets the records that come in over the next moment go out with the same fsync
+            time.sleep(self.sync_interval)
+            with self.condition:
+                the_batch, self.waiting = self.waiting, []
+            self.write(the_batch)
+            if self.written >= self.snapshot_every and self.state_function is not None:
+                self.take_snapshot()
+        if self.file is not None:
+            self.file.close()
+
+    def write(self, the_batch):
+        try:
+            for each_segment, each_line, _ in the_batch:
+                if each_segment != self.file_segment:
+                    self.sync()
+                    if self.file is not None:
+                        self.file.close()
+                    self.file = open(self.segment_path(each_segment), 'a')
+                    self.file_segment = each_segment
+                self.file.write(each_line)
+            self.sync()
+        except OSError as e:
+            print(f"Couldn't write to the journal, schedules won't be resumed after a restart: {str(e)}")
+            self.failed = True
+        self.written += len(the_batch)
+        for _, _, each_future in the_batch:
+            each_future.set_result(not self.failed)
+
+    def sync(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    # Writes every schedule's state, then deletes the segments it covers
+    def take_snapshot(self):
+        the_state = self.state_function()
+        with self.condition:
+            the_segment = self.segment
+        temp_path = self.snapshot_path() + '.tmp'
+        try:
+            with open(temp_path, 'w') as the_file:
+                json.dump({'segment': the_segment, 'saved_at': time.time(), 'state': the_state}, the_file, default=str)
+                the_file.flush()
+                os.fsync(the_file.fileno())
+            os.replace(temp_path, self.snapshot_path())
+        except OSError as e:
+            print(f"Couldn't write a journal snapshot: {str(e)}")
+            return
+        self.written = 0
+        for each_name in self.segment_names():
+            if int(each_name.split('.')[1]) < the_segment:
+                try:
+                    os.remove(os.path.join(self.dir, each_name))
+                except OSError:
+                    pass
+
+    # Whatever was queued before this still gets written
+    def stop(self):
+        with self.condition:
+            self.killed = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+
+
+# The journal the engine writes to
+journal = Journal()
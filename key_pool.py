@@ -0,0 +1,86 @@
+# The API keys orders can be placed with: the one in config.py, and any in extra_api_keys ( other accounts or
+# sub-accounts ).
+#
+# One key's rate limits cap how many orders can go out, however many schedules there are. Kraken counts its limits
+# per key, so here every key has everything that's counted or ordered per key to itself:
+# - its own nonces ( and nonce file ), since Kraken only wants them to go up for the same key
+# - its own rate limiter and retry policy, so waiting on one key's counters never holds up another's calls
+# - its own transport, so one key's calls never wait on another's connections
+# - its own Signer, with its secret decoded once
+# Schedules are routed to a key when they start ( see assign ), and everything after that for the schedule's orders
+# ( the order batcher, the order tracker, cancels ) is per key too, so calls for different keys run side by side.
+import base64
+import functools
+from config import api_url, account_type, nonce_file, extra_api_keys
+from nonce import NonceGenerator
+from rate_limiter import RateLimiter
+from transport import Transport
+from retry_policy import RetryPolicy
+from signing import Signer
+
+
+class ApiKey:
+    def __init__(self, name, api_key, api_secret, the_nonces, the_limiter, the_transport, the_retry_policy=None):
+        self.name = name
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.signer = Signer(api_secret)
+        self.nonces = the_nonces
+        self.limiter = the_limiter
+        self.transport = the_transport
+        self.retry_policy = the_retry_policy or RetryPolicy(the_limiter)
+        # kraken_request for this key, set by KeyPool
+        self.request = None
+        # Set by kraken_api, every key has its own open orders
+        self.order_tracker = None
+
+    # From an entry of extra_api_keys: {'name': .., 'api_key_b': .., 'api_secret_b': .., 'account_type': ..}
+    @classmethod
+    def from_config(cls, the_entry):
+        the_name = the_entry['name']
+        return cls(the_name, base64.b64decode(the_entry['api_key_b'].encode()).decode(),
+                   base64.b64decode(the_entry['api_secret_b'].encode()).decode(),
+                   NonceGenerator(f'{nonce_file}.{the_name}'),
+                   RateLimiter(the_entry.get('account_type', account_type)),
+                   Transport(api_url))
+
+    def __repr__(self):
+        return f"ApiKey({self.name})"
+
+
+class KeyPool:
+    # the_keys are ApiKeys, the first one is the main key ( config.py's ). request_function is kraken_request,
+    # which every key gets its own copy of through the_key.
+    # Keys are found by name ( the journal keeps which one a schedule's on ), so a key with a name that's already
+    # taken, the main key's included, is left out rather than taking the other one's place.
+    def __init__(self, the_keys, request_function):
+        self.keys = {}
+        self.main = the_keys[0]
+        for each_key in the_keys:
+            if each_key.name in self.keys:
+                print(f"Leaving out API key {each_key.name!r} from extra_api_keys, there's already a key with that "
+                      f"name ( {self.main.name!r} is the one in config.py )")
+                continue
+            each_key.request = functools.partial(request_function, the_key=each_key)
+            self.keys[each_key.name] = each_key
+
+    def __iter__(self):
+        return iter(list(self.keys.values()))
+
+    def __len__(self):
+        return len(self.keys)
+
+    # The key with this name, or the main key for None or a name that isn't in the pool
+    def get(self, the_name):
+        return self.keys.get(the_name, self.main)
+
+    # The name of the key a new schedule should go to: the one with the fewest schedules on it.
+    # the_loads is key name -> how many running schedules it has.
+    def assign(self, the_loads):
+        return min(self.keys, key=lambda each_name: the_loads.get(each_name, 0))
+
+
+# The extra keys from config.py. The main key is made by kraken_api, from the nonces, limiter and transport
+# everything else already shares.
+def extra_keys():
+    return [ApiKey.from_config(each_entry) for each_entry in extra_api_keys]
@@ -0,0 +1,315 @@
+# Everything that talks to the Kraken REST API, and what's been retrieved from it.
+# Doesn't need Tk, so it can be used by start.py ( the GUI ) as well as engine.py ( headless ).
+#
+# The retrieved information is kept as module attributes ( kraken_api.open_orders, kraken_api.current_balance, .. ).
+# They get replaced with new dicts when they're updated, so always read them as kraken_api.<name>
+# instead of importing the dicts themselves.
+# Other threads keep changing them, so code that isn't on an update thread ( the GUI ) should use snapshot() instead.
+import base64
+import decimal
+import hashlib
+import hmac
+import json
+import threading
+import time
+import urllib.parse
+from concurrent.futures import Future, wait
+from types import MappingProxyType
+import requests
+import disk_cache
+from config import api_key_b, api_secret_b, ticker_poll_interval, asset_pairs_cache_age, ticker_cache_age, \
+    balance_refresh_interval
+from transport import transport
+from rate_limiter import limiter
+from nonce import nonces
+from market_feed import MarketFeed
+from pair_index import PairIndex
+from order_book import OrderBooks
+from order_tracker import OrderTracker
+from event_bus import bus
+from metrics import metrics
+from responses import body, tickers_from_kraken
+from poller import Poller
+from trade_flow import TradeFlow
+from retry_policy import retry_policy, RequestFailed
+from key_pool import ApiKey, KeyPool, extra_keys
+from signing import FilledBody
+
+# How many times a request turned down for its nonce is sent again
+nonce_attempts = 3
+# Seconds until the balance is asked for again after it couldn't be retrieved
+balance_retry_interval = 30
+
+api_key = base64.b64decode(api_key_b.encode()).decode()
+api_secret = base64.b64decode(api_secret_b.encode()).decode()
+
+current_balance = {'error': None}
+last_updates = {'kill': False}
+available_pairs = {}
+pair_index = PairIndex({})
+ticker_information = {'error': None}
+market_feed = MarketFeed(ticker_information)
+order_books = OrderBooks(market_feed)
+
+
+# Taken from https://docs.kraken.com/rest/#section/Authentication/Headers-and-Signature
+# post_data is the exact body that gets sent. It's the url-encoded data unless it's given.
+# kraken_request signs with the key's Signer instead ( see signing.py ), this is the plain version of the same thing.
+def get_kraken_signature(urlpath, data, secret, post_data=None):
+    if post_data is None:
+        post_data = urllib.parse.urlencode(data)
+    encoded = (str(data['nonce']) + post_data).encode()
+    message = urlpath.encode() + hashlib.sha256(encoded).digest()
+    mac = hmac.new(base64.b64decode(secret), message, hashlib.sha512)
+    sig_digest = base64.b64encode(mac.digest())
+    return sig_digest.decode()
+
+
+# Attaches auth headers and returns results of a POST request
+# Waits for the rate limiter first. pair / trading_cost are only needed for calls that add to a pair's trading counter,
+# and reserve for calls that have to leave that many API credits for everything else ( see RateLimiter.acquire ).
+# The nonce is added here, after waiting, so nonces reach Kraken in the same order they were made.
+# Endpoints that take lists ( AddOrderBatch ) need the body as JSON instead, which is what as_json is for.
+# the_key is the ApiKey to send it with ( its nonces, limiter and connections ), the main key if it isn't given.
+# data is a dict, or a FilledBody from a BodyTemplate ( see signing.py ) that's already mostly encoded.
+# The body is encoded once, and the bytes that are signed are the bytes that are sent.
+def kraken_request(uri_path, data, pair=None, trading_cost=None, as_json=False, the_key=None, reserve=0):
+    the_key = the_key or key_pool.main
+    for each_attempt in range(nonce_attempts):
+        the_key.limiter.acquire(uri_path, pair, trading_cost, reserve)
+        the_nonce = the_key.nonces.next()
+        if as_json:
+            the_body = json.dumps({"nonce": the_nonce, **(data.as_dict() if isinstance(data, FilledBody) else data)}).encode()
+            the_type = 'application/json'
+        else:
+            the_body = data.encode(the_nonce) if isinstance(data, FilledBody) else \
+                urllib.parse.urlencode({"nonce": the_nonce, **data}).encode()
+            the_type = 'application/x-www-form-urlencoded; charset=utf-8'
+        headers = {'API-Key': the_key.api_key, 'Content-Type': the_type,
+                   'API-Sign': the_key.signer.sign(uri_path, the_nonce, the_body)}
+        start_time = time.perf_counter()
+        try:
+            req = the_key.transport.private_post(uri_path, headers, the_body)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            metrics.record_call(uri_path, time.perf_counter() - start_time, 'connection_error')
+            return None
+        # Parsed once here, everything after this reuses it
+        the_errors = (body(req).get('error') or []) if req.status_code == 200 else []
+        metrics.record_call(uri_path, time.perf_counter() - start_time, req.status_code, the_errors)
+        # Two threads' requests can still pass each other on the way, and then the one with the smaller nonce
+        # is turned down. Kraken didn't do anything with it, so it's safe to send again with a new nonce.
+        if each_attempt + 1 < nonce_attempts and 'EAPI:Invalid nonce' in the_errors:
+            metrics.record_retry(uri_path, 'nonce')
+            continue
+        return req
+
+
+# Every key orders can be placed with. The main one shares the nonces, limiter, transport and retry policy
+# that everything else uses.
+key_pool = KeyPool([ApiKey('main', api_key, api_secret, nonces, limiter, transport, retry_policy)] + extra_keys(),
+                   kraken_request)
+# Open orders are kept up to date by the tracker. open_orders is the tracker's dict and is never replaced.
+# Every other key has its own tracker for its own orders, see order_trackers().
+order_tracker = OrderTracker(kraken_request)
+open_orders = order_tracker.open_orders
+for each_key in key_pool:
+    each_key.order_tracker = order_tracker if each_key is key_pool.main else \
+        OrderTracker(each_key.request, the_retry_policy=each_key.retry_policy)
+
+
+# The order tracker of every key, the main one first
+def order_trackers():
+    return [each_key.order_tracker for each_key in key_pool]
+
+
+# The key that placed this order, going by whose tracker knows about it. The main key if no tracker does.
+def key_for_order(txid):
+    return next((each_key for each_key in key_pool if txid in each_key.order_tracker.open_orders), key_pool.main)
+
+# Runs every periodic refresh ( orders, balance, the first pairs and tickers, public trades )
+poller = Poller()
+trade_flow = TradeFlow()
+
+# Each one resolves as soon as its information is first there, from the cache or from Kraken.
+# Startup waits on just the ones it needs instead of checking on all of them every few seconds.
+startup = {'orders': order_tracker.ready, 'balances': Future(), 'pairs': Future(), 'tickers': Future()}
+
+
+def mark_ready(the_name):
+    if not startup[the_name].done():
+        startup[the_name].set_result(True)
+
+
+# https://docs.kraken.com/rest/#tag/Market-Data/operation/getTickerInformation
+# This gets volume as well as ask/bid
+# Is retrieved for every pair once at the beginning of program start.
+# Afterwards, market_feed keeps the pairs that can be traded up to date over the WebSocket.
+# A job on the poller: returns None once it's worked, or the seconds until trying again.
+def get_24_hour_volume():
+    try:
+        all_ticker_pairs = body(transport.public_get('/0/public/Ticker'))['result']
+    # Anything at all, since a poller job that raises is dropped and never tried again
+    except Exception as e:
+        print(f"Couldn't get the tickers, trying again: {e!r}")
+        if ticker_information['error'] is None:
+            ticker_information['error'] = True
+            return 1
+        return ticker_poll_interval
+    ticker_information.update(tickers_from_kraken(all_ticker_pairs))
+    ticker_information['error'] = False
+    mark_ready('tickers')
+    disk_cache.save('ticker', all_ticker_pairs)
+    return None
+
+
+# Sets the pairs that can be traded. The index is set first, so it's always ready once available_pairs has something in it
+def set_available_pairs(the_pairs):
+    global available_pairs
+    global pair_index
+    pair_index = PairIndex(the_pairs)
+    available_pairs = the_pairs
+    mark_ready('pairs')
+
+
+# This gets all available pairs, and is only retrieved once -- at the start of the program.
+# A job on the poller, like get_24_hour_volume.
+def check_available_pairs():
+    try:
+        the_pairs = body(transport.public_get('/0/public/AssetPairs'))['result']
+    # Anything at all, like get_24_hour_volume
+    except Exception as e:
+        print(f"Couldn't get the asset pairs, trying again in 5 seconds: {e!r}")
+        return 5
+    set_available_pairs(the_pairs)
+    disk_cache.save('asset_pairs', the_pairs)
+    return None
+
+
+# The last pairs and tickers are cached, so the main window can be shown right away while the new ones download
+def load_cached():
+    cached_pairs = disk_cache.load('asset_pairs', asset_pairs_cache_age)
+    if cached_pairs:
+        set_available_pairs(cached_pairs)
+    cached_tickers = disk_cache.load('ticker', ticker_cache_age)
+    if cached_tickers:
+        ticker_information.update(tickers_from_kraken(cached_tickers))
+        ticker_information['error'] = False
+        mark_ready('tickers')
+
+
+# Open orders only have the altname of their pair ( XBTUSD instead of XXBTZUSD )
+def find_pair_name(the_altname):
+    return pair_index.name(the_altname)
+
+
+# Get account balance
+# Is retrieved at the beginning of program start, right after fills ( see refresh_balance_on_fill ),
+# and every balance_refresh_interval seconds for deposits and withdrawals.
+# A job on the poller: returns the seconds until the next time.
+def get_account_balance():
+    global current_balance
+    try:
+        json_result = retry_policy.send(kraken_request, "/0/private/Balance", {})
+    except RequestFailed:
+        current_balance['error'] = True
+        return balance_retry_interval
+    # Turned into Decimal once here instead of on every read
+    new_current_balance = {'error': False}
+    for each_item in json_result:
+        the_amount = decimal.Decimal(json_result[each_item])
+        if the_amount != 0:
+            new_current_balance[each_item] = the_amount
+    current_balance = new_current_balance
+    mark_ready('balances')
+    bus.publish('balances', 'all', snapshot('balances'))
+    return balance_refresh_interval
+
+
+# A fill changes the balance. Waits a second first, so a burst of fills turns into one refresh.
+def refresh_balance_on_fill(the_event, txid, the_order=None):
+    if the_event in ('filled', 'partially_filled'):
+        poller.refresh('balance', 1)
+
+
+order_tracker.add_listener(refresh_balance_on_fill)
+
+
+# A read-only copy of 'balances', 'tickers' or 'orders' as they are right now.
+# Copying a dict happens in one step as far as other threads are concerned, and the update threads always
+# put in new values instead of changing the ones that are there, so the copy never changes underneath the reader.
+# 'orders' has the open orders of every key, with 'error' from the main one.
+def snapshot(the_name):
+    if the_name == 'orders':
+        the_orders = {}
+        for each_tracker in reversed(order_trackers()):
+            the_orders.update(each_tracker.open_orders)
+        return MappingProxyType(the_orders)
+    the_dict = {'balances': current_balance, 'tickers': ticker_information}[the_name]
+    return MappingProxyType(dict(the_dict))
+
+
+# Starts every background update. Returns the threads so they can be kept track of.
+def start_updates():
+    metrics.start()
+    load_cached()
+    # Spare connections are opened alongside the first fetches instead of before them, so startup doesn't wait on it
+    the_threads = [threading.Thread(target=transport.prewarm, name="prewarm")]
+    the_threads[0].start()
+    poller.add('pairs', check_available_pairs)
+    poller.add('tickers', get_24_hour_volume)
+    poller.add('balance', get_account_balance, priority='normal', api_cost=1)
+    poller.add('orders', order_tracker.poll_step, priority='high', api_cost=1)
+    for each_key in key_pool:
+        if each_key is not key_pool.main:
+            poller.add(f'orders_{each_key.name}', each_key.order_tracker.poll_step, priority='high', api_cost=1,
+                       the_limiter=each_key.limiter)
+            each_key.order_tracker.start()
+    poller.add('trades', trade_flow.poll_step)
+    order_tracker.start()
+    the_threads += poller.scheduler.threads
+    if order_tracker.thread is not None:
+        the_threads.append(order_tracker.thread)
+    return the_threads
+
+
+# True once every background update has gotten its first result
+def updates_ready():
+    return all(startup[each_name].done() for each_name in startup)
+
+
+# Waits until these ( names in startup, all of them by default ) are ready. Returns False if timeout runs out first.
+def wait_until_ready(the_names=None, timeout=None):
+    the_futures = [startup[each_name] for each_name in (the_names or startup)]
+    return not wait(the_futures, timeout=timeout).not_done
+
+
+# Starts streaming prices for these pairs ( REST pair names )
+def stream_pairs(the_pairs):
+    market_feed.subscribe({each_pair: pair_index.pair(each_pair)['wsname']
+                           for each_pair in the_pairs if (pair_index.pair(each_pair) or {}).get('wsname')})
+    market_feed.start()
+
+
+# Keeps up with the public trades on this pair ( REST pair name ), for POV schedules. Fetched right away.
+def track_trades(the_pair):
+    trade_flow.track(the_pair)
+    poller.refresh('trades')
+
+
+# Keeps a local order book for this pair ( REST pair name ) from now on.
+# Doesn't wait for anything, it's called from the Tk thread. The WebSocket sends a snapshot when it subscribes,
+# and without one the first Depth is loaded in the background.
+def track_order_book(the_pair):
+    the_pair_info = pair_index.pair(the_pair) or {}
+    the_book = order_books.track(the_pair, the_pair_info.get('wsname'))
+    if not the_book.valid and not market_feed.connected:
+        threading.Thread(target=order_books.load_depth, args=(the_pair,), name="load_depth", daemon=True).start()
+
+
+def stop_updates():
+    last_updates['kill'] = True
+    poller.stop()
+    market_feed.stop()
+    for each_tracker in order_trackers():
+        each_tracker.stop()
+    metrics.stop()
@@ -0,0 +1,615 @@
+# A local stand-in for api.kraken.com and ws.kraken.com.
+# Answers the endpoints start.py uses so things can be measured without real keys or the internet.
+# Public data is canned. Private calls are checked like Kraken checks them and work on a made-up account
+# where orders stay open until they're cancelled ( or filled, see StubExchange ).
+#
+# Run it on its own with: python kraken_stub.py --port 8080 --ws-port 8081
+# and then point api_url in config.py to http://127.0.0.1:8080 and ws_url to ws://127.0.0.1:8081
+import argparse
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import random
+import socketserver
+import struct
+import threading
+import time
+import urllib.parse
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import api_key_b, api_secret_b
+
+stub_ticker = {'XXBTZUSD': {'a': ['23000.10000', '1', '1.000'], 'b': ['22999.90000', '2', '2.000'],
+                            'c': ['23000.00000', '0.01000000'], 'v': ['120.50000000', '2500.12345678'],
+                            'p': ['23010.12345', '22950.54321'], 't': [1200, 25000],
+                            'l': ['22800.00000', '22700.00000'], 'h': ['23100.00000', '23200.00000'],
+                            'o': '22900.00000'},
+               'XETHZUSD': {'a': ['1600.10000', '3', '3.000'], 'b': ['1599.90000', '4', '4.000'],
+                            'c': ['1600.00000', '0.10000000'], 'v': ['1500.50000000', '30000.12345678'],
+                            'p': ['1601.12345', '1598.54321'], 't': [1500, 31000],
+                            'l': ['1580.00000', '1570.00000'], 'h': ['1610.00000', '1620.00000'],
+                            'o': '1590.00000'}}
+stub_asset_pairs = {'XXBTZUSD': {'altname': 'XBTUSD', 'wsname': 'XBT/USD', 'base': 'XXBT', 'quote': 'ZUSD',
+                                 'pair_decimals': 1, 'lot_decimals': 8, 'ordermin': '0.0001', 'costmin': '0.5'},
+                    'XETHZUSD': {'altname': 'ETHUSD', 'wsname': 'ETH/USD', 'base': 'XETH', 'quote': 'ZUSD',
+                                 'pair_decimals': 2, 'lot_decimals': 8, 'ordermin': '0.01', 'costmin': '0.5'}}
+# These add to a pair's trading counter instead of the API counter, and their rate limit errors say so
+stub_trading_endpoints = ('/0/private/AddOrder', '/0/private/AddOrderBatch', '/0/private/CancelOrder',
+                          '/0/private/CancelOrderBatch', '/0/private/CancelAll', '/0/private/CancelAllOrdersAfter')
+# Every order the stub places gets its own txid
+stub_txids = itertools.count(1)
+stub_balance = {'ZUSD': '10000.0000', 'XXBT': '1.0000000000', 'XETH': '10.0000000000'}
+
+
+# 25 levels on each side, stepping away from the ticker's best bid / ask
+def make_stub_book(the_pair, depth=25):
+    the_decimals = stub_asset_pairs[the_pair]['pair_decimals']
+    best_ask, best_bid = float(stub_ticker[the_pair]['a'][0]), float(stub_ticker[the_pair]['b'][0])
+    the_step = 10 ** -the_decimals
+    asks = {f'{best_ask + the_index * the_step:.{the_decimals}f}': f'{0.5 + the_index * 0.25:.8f}' for the_index in range(depth)}
+    bids = {f'{best_bid - the_index * the_step:.{the_decimals}f}': f'{0.5 + the_index * 0.25:.8f}' for the_index in range(depth)}
+    return {'asks': asks, 'bids': bids}
+
+
+# Public trades since the_since ( seconds, or nanoseconds like the "last" Kraken sends back ): one every
+# second at the last price, for 0.5 of the base. At most 1000, like Kraken.
+def make_stub_trades(the_pair, the_since):
+    the_since = float(the_since) if the_since else time.time() - 60
+    if the_since > 1e12:
+        the_since /= 1e9
+    the_price = stub_ticker[the_pair]['c'][0]
+    the_times = range(int(the_since) + 1, min(int(time.time()), int(the_since) + 1000) + 1)
+    the_trades = [[the_price, '0.50000000', float(each_time), 'b', 'l', '', each_time] for each_time in the_times]
+    the_last = str(int((the_trades[-1][2] if the_trades else the_since) * 1e9))
+    return {the_pair: the_trades, 'last': the_last}
+
+
+# 1 minute candles after the_since ( the last 720 without it ), around the last price, with the one that's
+# still going at the end. "last" is the start of the last finished one, like Kraken.
+def make_stub_ohlc(the_pair, the_since):
+    this_minute = int(time.time()) // 60 * 60
+    first_minute = max(int(the_since) if the_since else 0, this_minute - 719 * 60)
+    the_price = float(stub_ticker[the_pair]['c'][0])
+    the_candles = []
+    for each_minute in range(first_minute, this_minute + 1, 60):
+        the_close = the_price * (1 + 0.001 * ((each_minute // 60) % 7 - 3))
+        the_candles.append([each_minute, f'{the_price:.5f}', f'{max(the_price, the_close):.5f}',
+                            f'{min(the_price, the_close):.5f}', f'{the_close:.5f}', f'{the_close:.5f}',
+                            '30.00000000', 60])
+    return {the_pair: the_candles, 'last': this_minute - 60}
+
+
+# https://docs.kraken.com/websockets/#book-checksum
+def stub_book_checksum(the_book):
+    the_string = ''
+    for each_side in ('asks', 'bids'):
+        for each_price in sorted(the_book[each_side], key=float, reverse=(each_side == 'bids'))[:10]:
+            the_string += each_price.replace('.', '').lstrip('0') + the_book[each_side][each_price].replace('.', '').lstrip('0')
+    return str(zlib.crc32(the_string.encode()))
+
+
+# The private side of the stand-in: one account, with orders that stay around between calls.
+# Requests are checked the way Kraken checks them ( API-Key, API-Sign, a nonce bigger than the last one ),
+# and some of Kraken's behaviour can be switched on to see how the program copes with it:
+# - rate_limit_every: every n-th private call is turned down with "Rate limit exceeded"
+# - fill_after: orders are half filled after half of this many seconds, and filled after all of it
+# - lose_answers: this many AddOrder / AddOrderBatch calls from now on place their orders, but answer
+#   "EService:Deadline elapsed" as if Kraken's answer was lost on the way
+class StubExchange:
+    def __init__(self, api_key=None, api_secret=None, rate_limit_every=0, fill_after=None):
+        self.api_key = base64.b64decode(api_key_b.encode()).decode() if api_key is None else api_key
+        self.api_secret = base64.b64decode(api_secret_b.encode()).decode() if api_secret is None else api_secret
+        self.rate_limit_every = rate_limit_every
+        self.fill_after = fill_after
+        self.lock = threading.Lock()
+        self.last_nonce = 0
+        self.private_calls = 0
+        self.orders = {}
+        self.trades = {}
+        self.trade_ids = itertools.count(1)
+        self.ledger = {}
+        self.ledger_ids = itertools.count(1)
+        self.cancel_at = None
+        self.lose_answers = 0
+        self.endpoints = {'/0/private/Balance': self.balance,
+                          '/0/private/OpenOrders': self.open_orders,
+                          '/0/private/ClosedOrders': self.closed_orders,
+                          '/0/private/QueryOrders': self.query_orders,
+                          '/0/private/TradesHistory': self.trades_history,
+                          '/0/private/Ledgers': self.ledgers,
+                          '/0/private/AddOrder': self.add_order,
+                          '/0/private/AddOrderBatch': self.add_order_batch,
+                          '/0/private/CancelOrder': self.cancel_order,
+                          '/0/private/CancelOrderBatch': self.cancel_order_batch,
+                          '/0/private/CancelAll': self.cancel_all,
+                          '/0/private/CancelAllOrdersAfter': self.cancel_all_after}
+
+    # The first error Kraken would give for this request, or None if it's fine
+    def check_request(self, the_path, the_headers, raw_body, the_body):
+        if the_headers.get('API-Key') != self.api_key:
+            return 'EAPI:Invalid key'
+        try:
+            the_nonce = int(the_body.get('nonce', 0))
+            encoded = (str(the_body['nonce']) + raw_body).encode()
+            message = the_path.encode() + hashlib.sha256(encoded).digest()
+            expected = base64.b64encode(hmac.new(base64.b64decode(self.api_secret), message, hashlib.sha512).digest())
+        except (KeyError, ValueError):
+            return 'EAPI:Invalid nonce'
+        if not hmac.compare_digest(expected.decode(), the_headers.get('API-Sign', '')):
+            return 'EAPI:Invalid signature'
+        with self.lock:
+            if the_nonce <= self.last_nonce:
+                return 'EAPI:Invalid nonce'
+            self.last_nonce = the_nonce
+            self.private_calls += 1
+            if self.rate_limit_every and self.private_calls % self.rate_limit_every == 0:
+                if the_path in stub_trading_endpoints:
+                    return 'EOrder:Rate limit exceeded'
+                return 'EAPI:Rate limit exceeded'
+        return None
+
+    # Fills and timed cancels happen here, whenever the account is looked at. Must be called with self.lock held.
+    def advance(self):
+        now = time.time()
+        if self.cancel_at is not None and now >= self.cancel_at:
+            self.cancel_at = None
+            for each_txid in self.open_txids():
+                self.close(each_txid, 'canceled')
+        if self.fill_after is None:
+            return
+        for each_txid in self.open_txids():
+            the_order = self.orders[each_txid]
+            the_age = now - the_order['opentm']
+            if the_age >= self.fill_after:
+                self.fill(each_txid, float(the_order['vol']) - float(the_order['vol_exec']))
+                self.close(each_txid, 'closed')
+            elif the_age >= self.fill_after / 2 and float(the_order['vol_exec']) == 0:
+                self.fill(each_txid, float(the_order['vol']) / 2)
+
+    def open_txids(self):
+        return [txid for txid in self.orders if self.orders[txid]['status'] in ('pending', 'open')]
+
+    def fill(self, txid, the_volume):
+        the_order = self.orders[txid]
+        the_price = float(the_order['descr']['price'])
+        the_order['vol_exec'] = f"{float(the_order['vol_exec']) + the_volume:.8f}"
+        the_order['cost'] = f"{float(the_order['cost']) + the_volume * the_price:.5f}"
+        the_order['price'] = the_order['descr']['price']
+        self.add_trade(txid, the_order['descr']['pair'], the_order['descr']['type'], the_price, the_volume, time.time())
+
+    # A trade, and the two ledger entries ( base and quote ) that go with it
+    def add_trade(self, txid, the_altname, the_direction, the_price, the_volume, the_time):
+        trade_id = f"TSTUB{next(self.trade_ids)}-AAAAA-BBBBBB"
+        the_pair = next(each_pair for each_pair in stub_asset_pairs
+                        if stub_asset_pairs[each_pair]['altname'] == the_altname)
+        the_sign = 1 if the_direction == 'buy' else -1
+        the_ledger_ids = []
+        for each_asset, each_amount in ((stub_asset_pairs[the_pair]['base'], the_sign * the_volume),
+                                        (stub_asset_pairs[the_pair]['quote'], -the_sign * the_volume * the_price)):
+            ledger_id = f"LSTUB{next(self.ledger_ids)}-AAAAA-BBBBBB"
+            self.ledger[ledger_id] = {'refid': trade_id, 'time': the_time, 'type': 'trade', 'subtype': '',
+                                      'aclass': 'currency', 'asset': each_asset, 'amount': f"{each_amount:.8f}",
+                                      'fee': '0.00000000', 'balance': stub_balance.get(each_asset, '0')}
+            the_ledger_ids.append(ledger_id)
+        self.trades[trade_id] = {'ordertxid': txid, 'pair': the_altname, 'time': the_time, 'type': the_direction,
+                                 'ordertype': 'limit', 'price': f"{the_price:.5f}", 'cost': f"{the_volume * the_price:.5f}",
+                                 'fee': '0.00000', 'vol': f"{the_volume:.8f}", 'ledgers': the_ledger_ids}
+
+    # Adds the_count filled orders ( with their trades and ledger entries ) spread over the last the_days days,
+    # for exports to page through
+    def add_history(self, the_count, the_days=365):
+        now = time.time()
+        with self.lock:
+            for each_index in range(the_count):
+                the_time = now - the_days * 86400 * (the_count - each_index) / the_count
+                txid = f"OSTUB{next(stub_txids)}-AAAAA-BBBBBB"
+                the_direction = random.choice(('buy', 'sell'))
+                the_price = round(random.uniform(20000, 25000), 1)
+                self.orders[txid] = {'status': 'closed', 'opentm': the_time - 60, 'closetm': the_time,
+                                     'vol': '0.01000000', 'vol_exec': '0.01000000', 'cost': f"{the_price * 0.01:.5f}",
+                                     'fee': '0.00000', 'price': f"{the_price:.1f}",
+                                     'descr': {'pair': 'XBTUSD', 'type': the_direction, 'ordertype': 'limit',
+                                               'price': f"{the_price:.1f}"}}
+                self.add_trade(txid, 'XBTUSD', the_direction, the_price, 0.01, the_time)
+
+    def close(self, txid, the_status):
+        self.orders[txid]['status'] = the_status
+        self.orders[txid]['closetm'] = time.time()
+
+    def balance(self, the_body):
+        return stub_balance
+
+    def open_orders(self, the_body):
+        with self.lock:
+            self.advance()
+            return {'open': {txid: dict(self.orders[txid]) for txid in self.open_txids()
+                             if self.has_userref(txid, the_body)}}
+
+    # The rows of the_rows ( id -> row ) with the_time after "start" and up to "end", newest first, 50 at a time
+    # from "ofs", like Kraken pages them: ({id: row}, how many there are in all)
+    def page(self, the_rows, the_time, the_body):
+        the_start = float(the_body.get('start', 0))
+        the_end = float(the_body.get('end') or 'inf')
+        the_offset = int(the_body.get('ofs', 0))
+        the_ids = sorted((each_id for each_id in the_rows if the_start < the_rows[each_id].get(the_time, 0) <= the_end),
+                         key=lambda each_id: the_rows[each_id][the_time], reverse=True)
+        return {each_id: dict(the_rows[each_id]) for each_id in the_ids[the_offset:the_offset + 50]}, len(the_ids)
+
+    def closed_orders(self, the_body):
+        with self.lock:
+            self.advance()
+            the_page, the_count = self.page({txid: self.orders[txid] for txid in self.orders
+                                             if self.has_userref(txid, the_body)}, 'closetm', the_body)
+            return {'closed': the_page, 'count': the_count}
+
+    # OpenOrders and ClosedOrders only have the orders with "userref", if it's given
+    def has_userref(self, txid, the_body):
+        return not the_body.get('userref') or self.orders[txid].get('userref') == int(the_body['userref'])
+
+    def query_orders(self, the_body):
+        with self.lock:
+            self.advance()
+            return {txid: dict(self.orders[txid]) for txid in str(the_body.get('txid', '')).split(',')
+                    if txid in self.orders}
+
+    def trades_history(self, the_body):
+        with self.lock:
+            self.advance()
+            the_page, the_count = self.page(self.trades, 'time', the_body)
+            return {'trades': the_page, 'count': the_count}
+
+    def ledgers(self, the_body):
+        with self.lock:
+            self.advance()
+            the_page, the_count = self.page(self.ledger, 'time', the_body)
+            return {'ledger': the_page, 'count': the_count}
+
+    # Kraken's error for the order, or None if it can be placed
+    def check_order(self, the_pair, the_order):
+        the_name = next((each_pair for each_pair in stub_asset_pairs
+                         if the_pair in (each_pair, stub_asset_pairs[each_pair]['altname'])), None)
+        if the_name is None:
+            return 'EQuery:Unknown asset pair'
+        try:
+            if float(the_order['volume']) < float(stub_asset_pairs[the_name]['ordermin']):
+                return 'EGeneral:Invalid arguments:volume minimum not met'
+            float(the_order['price'])
+        except (KeyError, ValueError):
+            return 'EGeneral:Invalid arguments'
+        return None
+
+    # Returns the new txid, or Kraken's error for the order
+    def place(self, the_pair, the_order):
+        the_error = self.check_order(the_pair, the_order)
+        if the_error is not None:
+            return the_error
+        the_name = next(each_pair for each_pair in stub_asset_pairs
+                        if the_pair in (each_pair, stub_asset_pairs[each_pair]['altname']))
+        txid = f"OSTUB{next(stub_txids)}-AAAAA-BBBBBB"
+        with self.lock:
+            self.orders[txid] = {'status': 'open', 'opentm': time.time(), 'vol': the_order['volume'],
+                                 'vol_exec': '0.00000000', 'cost': '0.00000', 'fee': '0.00000', 'price': '0.00000',
+                                 'descr': {'pair': stub_asset_pairs[the_name]['altname'], 'type': the_order['type'],
+                                           'ordertype': the_order.get('ordertype', 'limit'),
+                                           'price': the_order['price']}}
+            if the_order.get('userref'):
+                self.orders[txid]['userref'] = int(the_order['userref'])
+        return txid
+
+    # True if this placing call's answer should be lost, see lose_answers
+    def answer_lost(self):
+        with self.lock:
+            if self.lose_answers > 0:
+                self.lose_answers -= 1
+                return True
+        return False
+
+    def add_order(self, the_body):
+        txid = self.place(the_body.get('pair'), the_body)
+        if txid.startswith('E'):
+            return txid
+        if self.answer_lost():
+            return 'EService:Deadline elapsed'
+        return {'descr': {'order': f"{the_body['type']} {the_body['volume']} {the_body['pair']} @ limit "
+                                   f"{the_body['price']}"}, 'txid': [txid]}
+
+    # Like Kraken, one order that can't be placed turns the whole batch down, and none of them are placed
+    def add_order_batch(self, the_body):
+        for each_order in the_body.get('orders', []):
+            the_error = self.check_order(the_body.get('pair'), each_order)
+            if the_error is not None:
+                return the_error
+        the_results = []
+        for each_order in the_body.get('orders', []):
+            txid = self.place(the_body.get('pair'), each_order)
+            the_results.append({'error': txid} if txid.startswith('E') else
+                               {'txid': txid, 'descr': {'order': f"{each_order['type']} {each_order['volume']}"}})
+        if self.answer_lost():
+            return 'EService:Deadline elapsed'
+        return {'orders': the_results}
+
+    # How many of txids were open and are now cancelled
+    def cancel(self, txids):
+        with self.lock:
+            self.advance()
+            the_count = 0
+            for each_txid in txids:
+                if each_txid in self.orders and self.orders[each_txid]['status'] in ('pending', 'open'):
+                    self.close(each_txid, 'canceled')
+                    the_count += 1
+            return the_count
+
+    def cancel_order(self, the_body):
+        the_count = self.cancel([the_body.get('txid')])
+        return {'count': the_count} if the_count else 'EOrder:Unknown order'
+
+    def cancel_order_batch(self, the_body):
+        return {'count': self.cancel(the_body.get('orders', []))}
+
+    def cancel_all(self, the_body):
+        with self.lock:
+            txids = self.open_txids()
+        return {'count': self.cancel(txids)}
+
+    def cancel_all_after(self, the_body):
+        the_timeout = int(the_body.get('timeout', 0))
+        with self.lock:
+            self.cancel_at = time.time() + the_timeout if the_timeout else None
+        return {'currentTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'triggerTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.cancel_at)) if the_timeout else '0'}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so that keep-alive connections work the same way they do against the real API
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, so without this the client's delayed ACK adds ~40ms per response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, the_body, status=200):
+        encoded = json.dumps(the_body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        the_path = urllib.parse.urlparse(self.path).path
+        if the_path == '/0/public/Time':
+            now = int(time.time())
+            self.send_json({'error': [], 'result': {'unixtime': now, 'rfc1123': self.date_time_string(now)}})
+        elif the_path == '/0/public/Ticker':
+            the_pairs = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query).get('pair')
+            if the_pairs:
+                the_pairs = the_pairs[0].split(',')
+                self.send_json({'error': [], 'result': {each_pair: stub_ticker[each_pair]
+                                                        for each_pair in the_pairs if each_pair in stub_ticker}})
+            else:
+                self.send_json({'error': [], 'result': stub_ticker})
+        elif the_path == '/0/public/AssetPairs':
+            self.send_json({'error': [], 'result': stub_asset_pairs})
+        elif the_path == '/0/public/Depth':
+            the_query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            the_pair = the_query.get('pair', [''])[0]
+            if the_pair in stub_asset_pairs:
+                the_book = make_stub_book(the_pair, int(the_query.get('count', ['25'])[0]))
+                self.send_json({'error': [], 'result': {the_pair: {
+                    'asks': [[each_price, the_book['asks'][each_price], int(time.time())] for each_price in the_book['asks']],
+                    'bids': [[each_price, the_book['bids'][each_price], int(time.time())] for each_price in the_book['bids']]}}})
+            else:
+                self.send_json({'error': ['EQuery:Unknown asset pair'], 'result': {}})
+        elif the_path == '/0/public/Trades':
+            the_query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            the_pair = the_query.get('pair', [''])[0]
+            if the_pair in stub_asset_pairs:
+                self.send_json({'error': [], 'result': make_stub_trades(the_pair, the_query.get('since', [''])[0])})
+            else:
+                self.send_json({'error': ['EQuery:Unknown asset pair'], 'result': {}})
+        elif the_path == '/0/public/OHLC':
+            the_query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            the_pair = the_query.get('pair', [''])[0]
+            if the_pair in stub_asset_pairs:
+                self.send_json({'error': [], 'result': make_stub_ohlc(the_pair, the_query.get('since', [''])[0])})
+            else:
+                self.send_json({'error': ['EQuery:Unknown asset pair'], 'result': {}})
+        else:
+            self.send_json({'error': ['EGeneral:Unknown method'], 'result': {}}, status=404)
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        the_length = int(self.headers.get('Content-Length', 0))
+        raw_body = self.rfile.read(the_length).decode()
+        if self.headers.get('Content-Type') == 'application/json':
+            the_body = json.loads(raw_body)
+        else:
+            the_body = {each_key: each_value[0] for each_key, each_value in urllib.parse.parse_qs(raw_body).items()}
+        the_path = urllib.parse.urlparse(self.path).path
+        the_endpoint = self.server.exchange.endpoints.get(the_path)
+        if the_endpoint is None:
+            self.send_json({'error': ['EGeneral:Unknown method'], 'result': {}}, status=404)
+            return
+        the_error = self.server.exchange.check_request(the_path, self.headers, raw_body, the_body)
+        if the_error:
+            self.send_json({'error': [the_error]})
+            return
+        the_result = the_endpoint(the_body)
+        if isinstance(the_result, str):
+            self.send_json({'error': [the_result]})
+        else:
+            self.send_json({'error': [], 'result': the_result})
+
+
+# Just enough of RFC 6455 to stand in for wss://ws.kraken.com: text frames, ping, close
+# Subscribed pairs get a ticker and a spread message every push_interval seconds, and a heartbeat otherwise.
+class StubWebSocketHandler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.send_lock = threading.Lock()
+        self.subscriptions = set()
+        self.books = {}
+        self.open = True
+
+    def handle(self):
+        request_headers = {}
+        self.rfile.readline()
+        while True:
+            each_line = self.rfile.readline().decode().strip()
+            if not each_line:
+                break
+            the_name, the_value = each_line.split(':', 1)
+            request_headers[the_name.strip().lower()] = the_value.strip()
+        accept_key = base64.b64encode(hashlib.sha1((request_headers['sec-websocket-key'] +
+                                                    '258EAFA5-E914-47DA-95CA-C5AB0DC85B11').encode()).digest()).decode()
+        self.wfile.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                          f'Sec-WebSocket-Accept: {accept_key}\r\n\r\n').encode())
+        self.send_text({'connectionID': 1, 'event': 'systemStatus', 'status': 'online', 'version': 'stub'})
+        threading.Thread(target=self.push_updates, name="kraken_stub_ws_push", daemon=True).start()
+        while self.open:
+            the_frame = self.read_frame()
+            if the_frame is None:
+                break
+            the_opcode, the_payload = the_frame
+            if the_opcode == 0x8:
+                break
+            elif the_opcode == 0x9:
+                self.send_frame(0xA, the_payload)
+            elif the_opcode == 0x1:
+                self.handle_request(json.loads(the_payload.decode()))
+        self.open = False
+
+    def read_frame(self):
+        the_header = self.rfile.read(2)
+        if len(the_header) < 2:
+            return None
+        the_opcode = the_header[0] & 0x0F
+        the_length = the_header[1] & 0x7F
+        if the_length == 126:
+            the_length = struct.unpack('>H', self.rfile.read(2))[0]
+        elif the_length == 127:
+            the_length = struct.unpack('>Q', self.rfile.read(8))[0]
+        the_mask = self.rfile.read(4) if the_header[1] & 0x80 else b'\x00\x00\x00\x00'
+        the_payload = bytes(each_byte ^ the_mask[the_index % 4]
+                            for the_index, each_byte in enumerate(self.rfile.read(the_length)))
+        return the_opcode, the_payload
+
+    def send_frame(self, the_opcode, the_payload):
+        if len(the_payload) < 126:
+            the_header = struct.pack('>BB', 0x80 | the_opcode, len(the_payload))
+        elif len(the_payload) < 65536:
+            the_header = struct.pack('>BBH', 0x80 | the_opcode, 126, len(the_payload))
+        else:
+            the_header = struct.pack('>BBQ', 0x80 | the_opcode, 127, len(the_payload))
+        with self.send_lock:
+            try:
+                self.wfile.write(the_header + the_payload)
+            except OSError:
+                self.open = False
+
+    def send_text(self, the_body):
+        self.send_frame(0x1, json.dumps(the_body).encode())
+
+    def handle_request(self, the_request):
+        the_channel = the_request.get('subscription', {}).get('name')
+        ws_to_rest = {stub_asset_pairs[each_pair]['wsname']: each_pair for each_pair in stub_asset_pairs}
+        for each_pair in the_request.get('pair', []):
+            # A book subscription starts with a snapshot, then only sends what changes
+            if the_channel == 'book' and the_request.get('event') == 'subscribe' and each_pair in ws_to_rest:
+                the_depth = the_request['subscription'].get('depth', 10)
+                self.books[each_pair] = make_stub_book(ws_to_rest[each_pair], the_depth)
+                self.send_text([3, {'as': [[each_price, self.books[each_pair]['asks'][each_price], f'{time.time():.6f}']
+                                           for each_price in self.books[each_pair]['asks']],
+                                    'bs': [[each_price, self.books[each_pair]['bids'][each_price], f'{time.time():.6f}']
+                                           for each_price in self.books[each_pair]['bids']]},
+                                f'book-{the_depth}', each_pair])
+            if the_request.get('event') == 'subscribe':
+                self.subscriptions.add((the_channel, each_pair))
+            else:
+                self.subscriptions.discard((the_channel, each_pair))
+            self.send_text({'channelName': the_channel, 'event': 'subscriptionStatus', 'pair': each_pair,
+                            'status': f"{the_request.get('event')}d", 'subscription': {'name': the_channel}})
+
+    def push_updates(self):
+        ws_to_rest = {stub_asset_pairs[each_pair]['wsname']: each_pair for each_pair in stub_asset_pairs}
+        while self.open:
+            time.sleep(self.server.push_interval)
+            if not self.subscriptions:
+                self.send_text({'event': 'heartbeat'})
+            for the_channel, the_pair in list(self.subscriptions):
+                the_ticker = stub_ticker.get(ws_to_rest.get(the_pair))
+                if the_ticker is None:
+                    continue
+                # Move the price around a little so every update is different
+                the_bid = float(the_ticker['b'][0]) * (1 + random.uniform(-0.0005, 0.0005))
+                the_ask = the_bid + float(the_ticker['a'][0]) - float(the_ticker['b'][0])
+                if the_channel == 'ticker':
+                    new_ticker = dict(the_ticker)
+                    new_ticker['a'] = [f'{the_ask:.5f}'] + the_ticker['a'][1:]
+                    new_ticker['b'] = [f'{the_bid:.5f}'] + the_ticker['b'][1:]
+                    self.send_text([1, new_ticker, 'ticker', the_pair])
+                elif the_channel == 'spread':
+                    self.send_text([2, [f'{the_bid:.5f}', f'{the_ask:.5f}', f'{time.time():.6f}', '1.0', '1.0'],
+                                    'spread', the_pair])
+                elif the_channel == 'book' and the_pair in self.books:
+                    # Change the volume of one existing level
+                    the_book = self.books[the_pair]
+                    the_side = random.choice(['asks', 'bids'])
+                    the_price = random.choice(list(the_book[the_side]))
+                    the_book[the_side][the_price] = f'{random.uniform(0.1, 5):.8f}'
+                    self.send_text([3, {the_side[0]: [[the_price, the_book[the_side][the_price], f'{time.time():.6f}']],
+                                        'c': stub_book_checksum(the_book)},
+                                    f'book-{len(the_book["asks"])}', the_pair])
+
+
+class StubWebSocketServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+# Starts the stand-in on a background thread. port=0 picks any free port.
+# The other arguments go to StubExchange. the_server.exchange is there to look at what was ordered.
+def start_stub(port=0, latency=0.0, rate_limit_every=0, fill_after=None):
+    the_server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    the_server.daemon_threads = True
+    the_server.latency = latency
+    the_server.exchange = StubExchange(rate_limit_every=rate_limit_every, fill_after=fill_after)
+    threading.Thread(target=the_server.serve_forever, name="kraken_stub", daemon=True).start()
+    return the_server
+
+
+# Same as start_stub(), but for the WebSocket stand-in
+def start_ws_stub(port=0, push_interval=0.1):
+    the_server = StubWebSocketServer(('127.0.0.1', port), StubWebSocketHandler)
+    the_server.push_interval = push_interval
+    threading.Thread(target=the_server.serve_forever, name="kraken_stub_ws", daemon=True).start()
+    return the_server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stand-in for the Kraken REST API")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--ws-port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument('--push-interval', type=float, default=0.1, help="Seconds between WebSocket updates")
+    parser.add_argument('--rate-limit-every', type=int, default=0,
+                        help="Turn down every n-th private call with a rate limit error ( 0 never does )")
+    parser.add_argument('--fill-after', type=float, default=None,
+                        help="Seconds until orders are filled ( half of them in half the time ). Never, if not given.")
+    arguments = parser.parse_args()
+    stub_server = start_stub(arguments.port, arguments.latency, arguments.rate_limit_every, arguments.fill_after)
+    ws_stub_server = start_ws_stub(arguments.ws_port, arguments.push_interval)
+    print(f"Kraken stand-in listening on http://127.0.0.1:{stub_server.server_address[1]}"
+          f" and ws://127.0.0.1:{ws_stub_server.server_address[1]}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub_server.shutdown()
+        ws_stub_server.shutdown()
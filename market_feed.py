@@ -0,0 +1,201 @@
+# Streaming market data from Kraken's WebSocket API
+# https://docs.kraken.com/websockets/
+#
+# Instead of downloading the entire /0/public/Ticker payload every 6~ seconds,
+# this subscribes to the ticker / spread channels for only the pairs that are needed
+# and writes each update into ticker_information as soon as it arrives.
+# If the connection drops it reconnects and resubscribes on its own,
+# and while it's down ( or if websocket-client isn't installed ) it falls back to polling Ticker over REST.
+import decimal
+import json
+import threading
+import time
+import requests
+from config import ws_url, ticker_poll_interval
+from transport import transport
+from responses import body, loads, Ticker, tickers_from_kraken
+
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+# Kraken sends a heartbeat every second when nothing else is happening,
+# so a much longer silence than that means the connection is dead
+receive_timeout = 10
+max_reconnect_wait = 30
+
+
+class MarketFeed:
+    def __init__(self, ticker_information, the_ws_url=ws_url, channels=('ticker', 'spread')):
+        self.ticker_information = ticker_information
+        self.ws_url = the_ws_url
+        # The channels subscribe() uses when it isn't told which ones
+        self.channels = channels
+        # REST pair name ( XXBTZUSD ) -> WebSocket pair name ( XBT/USD ), and the other way around
+        self.ws_names = {}
+        self.rest_names = {}
+        # Channel name -> REST pair names subscribed to it
+        self.channel_pairs = {}
+        # Extra subscription settings for a channel, like {'book': {'depth': 25}}
+        self.channel_options = {}
+        # Other channels ( like book ) can be listened to by adding a function here: channel name -> [functions]
+        # Each function is called with ( rest_pair_name, payload )
+        self.listeners = {}
+        self.lock = threading.Lock()
+        self.connection = None
+        self.connected = False
+        self.killed = False
+        self.thread = None
+        self.last_message = 0
+
+    # pairs is {rest_pair_name: ws_pair_name}, which is 'wsname' in the AssetPairs response
+    def subscribe(self, pairs, channels=None):
+        for each_channel in channels or self.channels:
+            with self.lock:
+                subscribed = self.channel_pairs.setdefault(each_channel, set())
+                new_pairs = [each_pair for each_pair in pairs if each_pair not in subscribed]
+                for each_pair in new_pairs:
+                    subscribed.add(each_pair)
+                    self.ws_names[each_pair] = pairs[each_pair]
+                    self.rest_names[pairs[each_pair]] = each_pair
+            if new_pairs and self.connected:
+                self.send_subscription('subscribe', each_channel, [pairs[each_pair] for each_pair in new_pairs])
+
+    # pairs is a list of REST pair names
+    def unsubscribe(self, pairs, channels=None):
+        for each_channel in channels or self.channels:
+            with self.lock:
+                subscribed = self.channel_pairs.setdefault(each_channel, set())
+                old_pairs = [each_pair for each_pair in pairs if each_pair in subscribed]
+                for each_pair in old_pairs:
+                    subscribed.discard(each_pair)
+            if old_pairs and self.connected:
+                self.send_subscription('unsubscribe', each_channel, [self.ws_names[each_pair] for each_pair in old_pairs])
+
+    # Unsubscribes and subscribes again, so Kraken sends a fresh snapshot ( for book, say ). pairs are REST pair names.
+    # If it isn't connected, the subscriptions are all sent again when it is anyway.
+    def resubscribe(self, pairs, channels=None):
+        for each_channel in channels or self.channels:
+            with self.lock:
+                the_pairs = [self.ws_names[each_pair] for each_pair in pairs
+                             if each_pair in self.channel_pairs.get(each_channel, set())]
+            if the_pairs and self.connected:
+                self.send_subscription('unsubscribe', each_channel, the_pairs)
+                self.send_subscription('subscribe', each_channel, the_pairs)
+
+    def add_listener(self, channel, the_function, options=None):
+        self.listeners.setdefault(channel, []).append(the_function)
+        if options:
+            self.channel_options[channel] = options
+
+    def send_subscription(self, the_event, the_channel, ws_pair_names):
+        try:
+            self.connection.send(json.dumps({'event': the_event, 'pair': ws_pair_names,
+                                             'subscription': {'name': the_channel,
+                                                              **self.channel_options.get(the_channel, {})}}))
+        except (websocket.WebSocketException, OSError, AttributeError):
+            # The receive loop notices the broken connection and reconnects
+            pass
+
+    # Only ever starts one thread, no matter how many times it's called
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="market_feed", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.killed = True
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except (websocket.WebSocketException, OSError):
+                pass
+
+    # Connects, subscribes and reads until the connection fails, then polls REST until the reconnect
+    def run(self):
+        reconnect_wait = 1
+        while not self.killed:
+            if websocket is not None:
+                try:
+                    self.connection = websocket.create_connection(self.ws_url, timeout=receive_timeout)
+                except (websocket.WebSocketException, OSError) as e:
+                    print(f"Market feed couldn't connect: {str(e)}")
+                else:
+                    self.connected = True
+                    reconnect_wait = 1
+                    with self.lock:
+                        all_subscriptions = {each_channel: [self.ws_names[each_pair]
+                                                            for each_pair in self.channel_pairs[each_channel]]
+                                             for each_channel in self.channel_pairs}
+                    for each_channel in all_subscriptions:
+                        if all_subscriptions[each_channel]:
+                            self.send_subscription('subscribe', each_channel, all_subscriptions[each_channel])
+                    self.receive_loop()
+                    self.connected = False
+            if self.killed:
+                break
+            # Poll over REST while waiting to reconnect so prices don't go stale
+            reconnect_at = time.monotonic() + (reconnect_wait if websocket is not None else ticker_poll_interval)
+            while not self.killed and time.monotonic() < reconnect_at:
+                self.poll_rest()
+                time.sleep(min(ticker_poll_interval, max(0.0, reconnect_at - time.monotonic())))
+            reconnect_wait = min(reconnect_wait * 2, max_reconnect_wait)
+
+    def receive_loop(self):
+        while not self.killed:
+            try:
+                the_message = self.connection.recv()
+            except (websocket.WebSocketException, OSError):
+                break
+            if not the_message:
+                break
+            self.last_message = time.time()
+            self.handle_message(loads(the_message))
+        try:
+            self.connection.close()
+        except (websocket.WebSocketException, OSError):
+            pass
+
+    # Channel messages are lists: [channelID, payload, channel name, pair]
+    # Everything else ( heartbeat, systemStatus, subscriptionStatus ) is a dict
+    def handle_message(self, the_message):
+        if isinstance(the_message, dict):
+            if the_message.get('event') == 'subscriptionStatus' and the_message.get('status') == 'error':
+                print(f"Market feed subscription error: {the_message.get('errorMessage')}")
+            return
+        channel_name = the_message[-2]
+        the_pair = self.rest_names.get(the_message[-1])
+        if the_pair is None:
+            return
+        if channel_name == 'ticker':
+            try:
+                self.ticker_information[the_pair] = Ticker.from_kraken(the_message[1])
+            except (KeyError, IndexError, TypeError, decimal.InvalidOperation):
+                pass
+        elif channel_name == 'spread':
+            # [bid, ask, timestamp, bidVolume, askVolume]
+            bid, ask = the_message[1][0], the_message[1][1]
+            current_ticker = self.ticker_information.get(the_pair)
+            if isinstance(current_ticker, Ticker):
+                # Swap in a copy so other threads never see a half-updated ticker
+                self.ticker_information[the_pair] = current_ticker.with_spread(decimal.Decimal(bid), decimal.Decimal(ask))
+        # Book messages can have more than one payload: [channelID, asks, bids, "book-10", pair]
+        base_channel = channel_name.split('-')[0]
+        for each_listener in self.listeners.get(base_channel, []):
+            for each_payload in the_message[1:-2]:
+                each_listener(the_pair, each_payload)
+
+    # REST fallback. Only asks for the subscribed pairs instead of every pair on the exchange.
+    def poll_rest(self):
+        with self.lock:
+            the_pairs = list(self.channel_pairs.get('ticker', []))
+        if not the_pairs:
+            return
+        try:
+            all_ticker_pairs = body(transport.public_get('/0/public/Ticker', {'pair': ','.join(the_pairs)}))['result']
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            self.ticker_information['error'] = True
+        else:
+            self.ticker_information.update(tickers_from_kraken(all_ticker_pairs))
+            self.ticker_information['error'] = False
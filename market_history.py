@@ -0,0 +1,230 @@
+# Recent trades and 1 minute OHLC for the pairs asked for, and rolling statistics from them.
+#
+# ticker_information only ever has the latest snapshot, so anything that wanted to know how a pair has been
+# trading had to ask Kraken again. Here every tracked pair keeps:
+# - its public trades ( time, price, volume ), handed over by trade_flow after each of its fetches, so this
+#   costs no calls of its own
+# - its 1 minute OHLC candles, fetched from /0/public/OHLC with the "since" cursor Kraken sent back the last time
+# in fixed-size ring buffers of numpy columns. The statistics ( VWAP, volatility, volume over the last n seconds )
+# are a binary search for the start of the window and a few vectorized sums, so reading them takes microseconds.
+# Rows that fall out of a ring buffer go to a bigger one in a memory-mapped file in history_dir ( started over
+# every run ), and are still read from there when a window reaches back that far. A spill file never grows past
+# history_spill_megabytes, whatever history_spill_rows says.
+#
+# Keeping history costs a Trades and an OHLC fetch for every pair, and nothing in the program reads the statistics
+# yet ( schedules price from the order book and size POV orders from trade_flow ), so kraken_api doesn't keep one.
+# Whatever needs it makes a MarketHistory, hands it trade_flow's trades with trade_flow.add_listener(add_trades)
+# and runs poll_step for the candles, the way benchmark.py's history run does.
+#
+# numpy is needed for this. Without it, tracking does nothing and every statistic is None.
+import os
+import threading
+import time
+import requests
+from config import history_trade_rows, history_ohlc_rows, history_spill_rows, history_spill_megabytes, history_dir, \
+    ohlc_fetch_interval
+from transport import transport
+from responses import body
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+trade_columns = ('time', 'price', 'volume')
+# https://docs.kraken.com/rest/#tag/Market-Data/operation/getOHLCData
+ohlc_columns = ('time', 'open', 'high', 'low', 'close', 'vwap', 'volume', 'count')
+
+
+# size rows of float columns. Every row is written twice, at its place and size places after it,
+# so the last size rows are always one slice of the array and reading them never copies.
+# With a path, the array is a memory-mapped file instead of memory.
+class RingBuffer:
+    def __init__(self, columns, size, path=None, spill=None):
+        self.columns = columns
+        self.size = size
+        if path is None:
+            self.data = numpy.zeros((len(columns), size * 2))
+        else:
+            self.data = numpy.memmap(path, dtype=numpy.float64, mode='w+', shape=(len(columns), size * 2))
+        # Rows ever appended
+        self.count = 0
+        # Where rows go once they fall out of this one, if anywhere
+        self.spill = spill
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    # Every row that's kept, oldest first, as columns. A view, so it's only good until the next append.
+    def view(self):
+        the_length = len(self)
+        the_start = (self.count - the_length) % self.size
+        return self.data[:, the_start:the_start + the_length]
+
+    def column(self, the_name):
+        return self.view()[self.columns.index(the_name)]
+
+    # the_rows is a list of rows, or a 2D array, in the order of self.columns
+    def append(self, the_rows):
+        the_rows = numpy.asarray(the_rows, dtype=numpy.float64).reshape(-1, len(self.columns))
+        if not len(the_rows):
+            return
+        pushed_out = max(0, len(self) + len(the_rows) - self.size)
+        if self.spill is not None and pushed_out:
+            the_old = min(pushed_out, len(self))
+            self.spill.append(self.view()[:, :the_old].T)
+            if pushed_out > the_old:
+                self.spill.append(the_rows[:pushed_out - the_old])
+        the_rows = the_rows[-self.size:]
+        the_places = (self.count + numpy.arange(len(the_rows))) % self.size
+        self.data[:, the_places] = the_rows.T
+        self.data[:, the_places + self.size] = the_rows.T
+        self.count += len(the_rows)
+
+    # Writes over the newest row, for a candle that was still going the last time it was fetched
+    def replace_last(self, the_row):
+        the_place = (self.count - 1) % self.size
+        self.data[:, the_place] = the_row
+        self.data[:, the_place + self.size] = the_row
+
+    # The rows from the_start ( a time, in the first column ) on, as columns.
+    # Reaches into the spill file if the rows kept here don't go back that far.
+    def since(self, the_start):
+        the_view = self.view()
+        the_times = the_view[0]
+        if self.spill is not None and len(self.spill) and (not len(the_times) or the_times[0] > the_start):
+            the_older = self.spill.since(the_start)
+            return numpy.concatenate((the_older, the_view), axis=1)
+        return the_view[:, numpy.searchsorted(the_times, the_start):]
+
+
+class MarketHistory:
+    def __init__(self, trade_rows=history_trade_rows, ohlc_rows=history_ohlc_rows, spill_rows=history_spill_rows,
+                 the_dir=history_dir, spill_megabytes=history_spill_megabytes):
+        self.trade_rows = trade_rows
+        self.ohlc_rows = ohlc_rows
+        self.spill_rows = spill_rows
+        self.spill_bytes = spill_megabytes * 1024 * 1024
+        self.dir = the_dir
+        # pair -> {'trades': RingBuffer, 'ohlc': RingBuffer, 'since': OHLC cursor}
+        self.pairs = {}
+        self.lock = threading.Lock()
+        self.warned = False
+
+    # Starts keeping history for this pair ( REST pair name ). Its trades come from trade_flow, see add_trades.
+    def track(self, the_pair):
+        if numpy is None:
+            if not self.warned:
+                print("numpy isn't installed, so no market history is kept")
+                self.warned = True
+            return
+        with self.lock:
+            if the_pair in self.pairs:
+                return
+            self.pairs[the_pair] = {'trades': self.ring(the_pair, 'trades', trade_columns, self.trade_rows),
+                                    'ohlc': self.ring(the_pair, 'ohlc', ohlc_columns, self.ohlc_rows),
+                                    'since': None}
+
+    # How many rows a spill file with the_columns has room for. Every row is 8 bytes a column, and kept twice.
+    def spill_size(self, the_columns):
+        return min(self.spill_rows, int(self.spill_bytes) // (len(the_columns) * 8 * 2))
+
+    def ring(self, the_pair, the_kind, the_columns, the_rows):
+        the_spill = None
+        spill_rows = self.spill_size(the_columns)
+        if spill_rows > 0:
+            try:
+                os.makedirs(self.dir, exist_ok=True)
+                the_spill = RingBuffer(the_columns, spill_rows, os.path.join(self.dir, f'{the_pair}_{the_kind}.bin'))
+            except OSError as e:
+                print(f"Couldn't open the {the_kind} history file for {the_pair}, older rows are dropped: {str(e)}")
+        return RingBuffer(the_columns, the_rows, spill=the_spill)
+
+    def untrack(self, the_pair):
+        with self.lock:
+            self.pairs.pop(the_pair, None)
+
+    # A trade_flow listener. the_trades are [price, volume, time, buy / sell, market / limit, miscellaneous, id]
+    def add_trades(self, the_pair, the_trades):
+        with self.lock:
+            the_history = self.pairs.get(the_pair)
+            if the_history is None:
+                return
+            the_history['trades'].append([(float(each_trade[2]), float(each_trade[0]), float(each_trade[1]))
+                                          for each_trade in the_trades])
+
+    # One OHLC fetch for every tracked pair. A job on the poller, so it returns the seconds until the next one.
+    def poll_step(self):
+        with self.lock:
+            the_pairs = {each_pair: self.pairs[each_pair]['since'] for each_pair in self.pairs}
+        for each_pair in the_pairs:
+            self.fetch_ohlc(each_pair, the_pairs[each_pair])
+        return ohlc_fetch_interval
+
+    def fetch_ohlc(self, the_pair, the_since):
+        the_query = {'pair': the_pair, 'interval': 1}
+        if the_since is not None:
+            the_query['since'] = the_since
+        try:
+            the_result = body(transport.public_get('/0/public/OHLC', the_query))['result']
+        except (requests.exceptions.RequestException, KeyError):
+            return
+        the_candles = next((the_result[each_key] for each_key in the_result if each_key != 'last'), [])
+        with self.lock:
+            the_history = self.pairs.get(the_pair)
+            if the_history is None:
+                return
+            the_ohlc = the_history['ohlc']
+            last_time = the_ohlc.view()[0][-1] if len(the_ohlc) else None
+            new_rows = []
+            for each_candle in the_candles:
+                the_row = [float(each_value) for each_value in each_candle]
+                # The newest candle is still going, so the one after it comes back again, with more in it
+                if last_time is not None and the_row[0] == last_time and not new_rows:
+                    the_ohlc.replace_last(the_row)
+                elif last_time is None or the_row[0] > last_time:
+                    new_rows.append(the_row)
+            the_ohlc.append(new_rows)
+            the_history['since'] = the_result.get('last', the_since)
+
+    # The rows of the_kind ( 'trades' or 'ohlc' ) from the last the_seconds, as columns, or None if the pair
+    # isn't tracked. Must be called with self.lock held.
+    def recent(self, the_pair, the_kind, the_seconds, now):
+        the_history = self.pairs.get(the_pair)
+        if the_history is None:
+            return None
+        return the_history[the_kind].since(now - the_seconds)
+
+    # The statistics are over the the_seconds before now ( the current time by default ).
+    # Volume-weighted average price of the trades in the window, None without any
+    def vwap(self, the_pair, the_seconds, now=None):
+        with self.lock:
+            the_trades = self.recent(the_pair, 'trades', the_seconds, now or time.time())
+            if the_trades is None or not len(the_trades[0]):
+                return None
+            the_volume = the_trades[2].sum()
+            if not the_volume:
+                return None
+            return float(numpy.dot(the_trades[1], the_trades[2]) / the_volume)
+
+    # Volume traded in the window, None if the pair isn't tracked
+    def volume(self, the_pair, the_seconds, now=None):
+        with self.lock:
+            the_trades = self.recent(the_pair, 'trades', the_seconds, now or time.time())
+            if the_trades is None:
+                return None
+            return float(the_trades[2].sum())
+
+    # Standard deviation of the 1 minute log returns of the candles in the window ( not annualized ),
+    # None with fewer than 3 candles
+    def volatility(self, the_pair, the_seconds, now=None):
+        with self.lock:
+            the_candles = self.recent(the_pair, 'ohlc', the_seconds, now or time.time())
+            if the_candles is None or len(the_candles[0]) < 3:
+                return None
+            return float(numpy.std(numpy.diff(numpy.log(the_candles[4])), ddof=1))
+
+    # All of the statistics at once
+    def stats(self, the_pair, the_seconds, now=None):
+        return {'vwap': self.vwap(the_pair, the_seconds, now), 'volume': self.volume(the_pair, the_seconds, now),
+                'volatility': self.volatility(the_pair, the_seconds, now)}
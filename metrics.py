@@ -0,0 +1,175 @@
+# Counters and latency histograms for every call to Kraken, cheap enough to always leave on.
+#
+# Everything is kept in memory as plain numbers: a counter is one float and a histogram is a fixed list of
+# bucket counts, so recording something is a dict lookup and an addition under a lock.
+# They can be read two ways:
+# - pulled, in Prometheus' text format, from http://127.0.0.1:<metrics_port>/metrics ( if metrics_port isn't 0 )
+# - a summary printed every metrics_summary_interval seconds ( if that isn't 0 )
+#
+# What's recorded:
+#   kraken_request_seconds{endpoint}                 how long each call took, public and private
+#   kraken_responses_total{endpoint, status}         HTTP status codes, or "connection_error"
+#   kraken_errors_total{endpoint, error}             Kraken's error strings ( EAPI:Invalid nonce, .. )
+#   kraken_retries_total{endpoint, reason}           calls that were sent again
+#   rate_limit_credits_total{endpoint, counter}      credits spent on the API counter / trading counters
+#   rate_limit_wait_seconds{endpoint}                time spent waiting on the rate limiter
+#   order_submit_seconds{schedule}                   from an order being queued to it having a txid
+#   order_fill_seconds{schedule}                     from an order having a txid to it being filled
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import metrics_port, metrics_summary_interval
+
+# Upper bounds of the histogram buckets, in seconds. Anything bigger goes in +Inf.
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, labels) -> value. labels is a tuple of (label, value) pairs.
+        self.counters = {}
+        # (name, labels) -> {'buckets': [count per bucket, + the +Inf one], 'sum': .., 'count': ..}
+        self.histograms = {}
+        self.server = None
+        self.summary_thread = None
+        self.killed = False
+
+    def count(self, the_name, the_labels, amount=1):
+        with self.lock:
+            self.counters[(the_name, the_labels)] = self.counters.get((the_name, the_labels), 0) + amount
+
+    def observe(self, the_name, the_labels, the_value):
+        the_bucket = bisect.bisect_left(latency_buckets, the_value)
+        with self.lock:
+            the_histogram = self.histograms.get((the_name, the_labels))
+            if the_histogram is None:
+                the_histogram = {'buckets': [0] * (len(latency_buckets) + 1), 'sum': 0.0, 'count': 0}
+                self.histograms[(the_name, the_labels)] = the_histogram
+            the_histogram['buckets'][the_bucket] += 1
+            the_histogram['sum'] += the_value
+            the_histogram['count'] += 1
+
+    # One finished call to Kraken. errors is Kraken's error list, if there was a response to get it from.
+    def record_call(self, endpoint, seconds, status, errors=()):
+        the_labels = (('endpoint', endpoint),)
+        self.observe('kraken_request_seconds', the_labels, seconds)
+        self.count('kraken_responses_total', the_labels + (('status', str(status)),))
+        for each_error in errors:
+            self.count('kraken_errors_total', the_labels + (('error', each_error),))
+
+    def record_retry(self, endpoint, reason):
+        self.count('kraken_retries_total', (('endpoint', endpoint), ('reason', reason)))
+
+    # Copies of everything, so reading doesn't hold the lock
+    def snapshot(self):
+        with self.lock:
+            return (dict(self.counters),
+                    {the_key: {'buckets': list(the_value['buckets']), 'sum': the_value['sum'],
+                               'count': the_value['count']}
+                     for the_key, the_value in self.histograms.items()})
+
+    # https://prometheus.io/docs/instrumenting/exposition_formats/
+    def render(self):
+        the_counters, the_histograms = self.snapshot()
+        the_lines = []
+        for the_name in sorted({each_key[0] for each_key in the_counters}):
+            the_lines.append(f"# TYPE {the_name} counter")
+            for (each_name, each_labels), each_value in sorted(the_counters.items()):
+                if each_name == the_name:
+                    the_lines.append(f"{the_name}{format_labels(each_labels)} {each_value:g}")
+        for the_name in sorted({each_key[0] for each_key in the_histograms}):
+            the_lines.append(f"# TYPE {the_name} histogram")
+            for (each_name, each_labels), each_value in sorted(the_histograms.items()):
+                if each_name != the_name:
+                    continue
+                cumulative = 0
+                for each_bound, each_count in zip(latency_buckets + ('+Inf',), each_value['buckets']):
+                    cumulative += each_count
+                    the_lines.append(f"{the_name}_bucket{format_labels(each_labels + (('le', str(each_bound)),))} "
+                                     f"{cumulative}")
+                the_lines.append(f"{the_name}_sum{format_labels(each_labels)} {each_value['sum']:g}")
+                the_lines.append(f"{the_name}_count{format_labels(each_labels)} {each_value['count']}")
+        return '\n'.join(the_lines) + '\n'
+
+    # Request count, mean / p50 / p99 latency ( from the buckets ) and errors for every endpoint
+    def summary(self):
+        the_counters, the_histograms = self.snapshot()
+        the_lines = []
+        for (the_name, the_labels), the_histogram in sorted(the_histograms.items()):
+            if the_name != 'kraken_request_seconds' or not the_histogram['count']:
+                continue
+            errors = sum(each_value for (each_name, each_labels), each_value in the_counters.items()
+                         if each_name == 'kraken_errors_total' and each_labels[0] == the_labels[0])
+            retries = sum(each_value for (each_name, each_labels), each_value in the_counters.items()
+                          if each_name == 'kraken_retries_total' and each_labels[0] == the_labels[0])
+            the_lines.append(f"{the_labels[0][1]:<32} n={the_histogram['count']:<6} "
+                             f"mean={the_histogram['sum'] / the_histogram['count'] * 1000:8.1f} ms  "
+                             f"p50<={bucket_quantile(the_histogram, 0.5)}  p99<={bucket_quantile(the_histogram, 0.99)}  "
+                             f"errors={errors:g}  retries={retries:g}")
+        return '\n'.join(the_lines)
+
+    def start(self, the_port=metrics_port, the_interval=metrics_summary_interval):
+        if the_port and self.server is None:
+            self.server = ThreadingHTTPServer(('127.0.0.1', the_port), MetricsHandler)
+            self.server.daemon_threads = True
+            self.server.metrics = self
+            threading.Thread(target=self.server.serve_forever, name="metrics_server", daemon=True).start()
+        if the_interval and self.summary_thread is None:
+            self.summary_thread = threading.Thread(target=self.print_summaries, args=(the_interval,),
+                                                   name="metrics_summary", daemon=True)
+            self.summary_thread.start()
+
+    def print_summaries(self, the_interval):
+        while not self.killed:
+            time.sleep(the_interval)
+            the_summary = self.summary()
+            if the_summary:
+                print(f"Kraken calls so far:\n{the_summary}")
+
+    def stop(self):
+        self.killed = True
+        if self.server is not None:
+            self.server.shutdown()
+
+
+def format_labels(the_labels):
+    if not the_labels:
+        return ''
+    return '{' + ','.join(f'{each_label}="{escape_label(each_value)}"' for each_label, each_value in the_labels) + '}'
+
+
+def escape_label(the_value):
+    return str(the_value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# The upper bound of the bucket the quantile falls in, as text
+def bucket_quantile(the_histogram, the_quantile):
+    the_target = the_quantile * the_histogram['count']
+    cumulative = 0
+    for each_bound, each_count in zip(latency_buckets, the_histogram['buckets']):
+        cumulative += each_count
+        if cumulative >= the_target:
+            return f"{each_bound * 1000:g} ms"
+    return f"> {latency_buckets[-1]:g} s"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        encoded = self.server.metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+
+# The metrics every part of the program records to
+metrics = Metrics()
@@ -0,0 +1,57 @@
+# One nonce source for every private call.
+#
+# Kraken rejects any nonce that isn't bigger than the last one it saw for the key.
+# str(int(time.time()) * 1000) only changes once a second, so two calls in the same second
+# ( or two threads at the same time ) collided with each other.
+# These nonces are in microseconds, always go up by at least 1, and are safe to use from any thread.
+#
+# To survive a restart, a "reservation" a little ahead of the current nonce is written to nonce_file.
+# Nonces are handed out freely up to the reservation, and on startup counting continues from past it,
+# so the file only has to be written once every reserve_seconds instead of on every call.
+import os
+import threading
+import time
+from config import nonce_file
+
+reserve_seconds = 10
+
+
+class NonceGenerator:
+    def __init__(self, the_nonce_file=nonce_file):
+        if not os.path.isabs(the_nonce_file):
+            the_nonce_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), the_nonce_file)
+        self.nonce_file = the_nonce_file
+        self.lock = threading.Lock()
+        self.last_nonce = 0
+        self.reserved = 0
+        # Without the file ( the first run ) nonces start from the clock. The file is replaced in one step,
+        # so it's only ever unreadable if something else wrote to it, and then the clock is all there is to go on too.
+        try:
+            with open(self.nonce_file) as the_file:
+                self.last_nonce = self.reserved = int(the_file.read().strip() or 0)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Couldn't read the nonce file {self.nonce_file}, nonces start from the clock: {str(e)}")
+
+    def reserve(self, up_to):
+        temp_file = self.nonce_file + '.tmp'
+        with open(temp_file, 'w') as the_file:
+            the_file.write(str(up_to))
+            the_file.flush()
+            os.fsync(the_file.fileno())
+        os.replace(temp_file, self.nonce_file)
+        self.reserved = up_to
+
+    # Returns the next nonce as a string, which is what the API expects
+    def next(self):
+        with self.lock:
+            the_nonce = max(time.time_ns() // 1000, self.last_nonce + 1)
+            if the_nonce >= self.reserved:
+                self.reserve(the_nonce + reserve_seconds * 1000000)
+            self.last_nonce = the_nonce
+            return str(the_nonce)
+
+
+# The nonces for the key in config.py
+nonces = NonceGenerator()
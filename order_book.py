@@ -0,0 +1,191 @@
+# Local L2 order books, and what a given order size would actually fill at.
+#
+# Pricing every order at best bid / ask * 0.999 ignores how much is available at that price.
+# A bigger order walks down ( or up ) the book, so here the volume-weighted fill price and the slippage
+# are worked out from the levels themselves.
+#
+# Books are kept up to date from the WebSocket book channel: one snapshot when subscribing,
+# then only the levels that changed ( https://docs.kraken.com/websockets/#message-book ).
+# Every update carries a checksum of the top 10 levels, and if the local book stops matching it,
+# it's thrown out and the book channel is subscribed to again for a fresh snapshot. Depth from REST isn't
+# spliced in there: it's a different moment of the book, and the updates after it wouldn't line up.
+# If the WebSocket isn't connected, /0/public/Depth is polled instead.
+import threading
+import time
+import zlib
+import requests
+from config import book_depth
+from transport import transport
+from responses import body
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# A book older than this ( in seconds ) is loaded again from Depth before it's used, when there's no WebSocket
+rest_book_max_age = 5
+
+
+# Kraken's checksum format for a price or volume: no decimal point, no leading zeros
+def checksum_format(the_value):
+    return the_value.replace('.', '').lstrip('0')
+
+
+class OrderBook:
+    def __init__(self, depth=book_depth):
+        self.depth = depth
+        # price string -> volume string, the way Kraken sends them, so the checksum can be worked out
+        self.levels = {'asks': {}, 'bids': {}}
+        # [(prices, volumes)] sorted best-first. Only sorted again after something changes.
+        self.sorted_levels = {'asks': None, 'bids': None}
+        self.lock = threading.Lock()
+        self.last_update = 0
+        self.valid = False
+
+    def load_snapshot(self, asks, bids):
+        with self.lock:
+            self.levels = {'asks': {each_level[0]: each_level[1] for each_level in asks},
+                           'bids': {each_level[0]: each_level[1] for each_level in bids}}
+            self.sorted_levels = {'asks': None, 'bids': None}
+            self.last_update = time.time()
+            self.valid = True
+
+    # Applies changed levels. A volume of 0 means the level is gone.
+    def apply_update(self, the_side, the_levels):
+        with self.lock:
+            for each_level in the_levels:
+                if float(each_level[1]) == 0:
+                    self.levels[the_side].pop(each_level[0], None)
+                else:
+                    self.levels[the_side][each_level[0]] = each_level[1]
+            # Levels pushed out past the subscribed depth aren't sent as deletes, so they're dropped here
+            if len(self.levels[the_side]) > self.depth:
+                for each_price in self.sorted_prices(the_side)[self.depth:]:
+                    del self.levels[the_side][each_price]
+            self.sorted_levels[the_side] = None
+            self.last_update = time.time()
+
+    # Must be called with self.lock held
+    def sorted_prices(self, the_side):
+        return sorted(self.levels[the_side], key=float, reverse=(the_side == 'bids'))
+
+    def checksum(self):
+        with self.lock:
+            the_string = ''
+            for each_side in ('asks', 'bids'):
+                for each_price in self.sorted_prices(each_side)[:10]:
+                    the_string += checksum_format(each_price) + checksum_format(self.levels[each_side][each_price])
+        return zlib.crc32(the_string.encode())
+
+    # (prices, volumes) best-first
+    def side(self, the_side):
+        with self.lock:
+            if self.sorted_levels[the_side] is None:
+                the_prices = self.sorted_prices(the_side)
+                the_volumes = [float(self.levels[the_side][each_price]) for each_price in the_prices]
+                the_prices = [float(each_price) for each_price in the_prices]
+                if numpy is not None:
+                    the_prices, the_volumes = numpy.array(the_prices), numpy.array(the_volumes)
+                self.sorted_levels[the_side] = (the_prices, the_volumes)
+            return self.sorted_levels[the_side]
+
+    # What buying ( takes the asks ) or selling ( takes the bids ) the_volume would fill at right now.
+    # Returns {'vwap', 'worst_price', 'best_price', 'filled', 'slippage'}, or None if the book is empty.
+    # slippage is how much worse than the best price the vwap is, as a fraction ( 0.001 is 0.1% ).
+    def fill_price(self, order_direction, the_volume):
+        the_prices, the_volumes = self.side('asks' if order_direction == 'buy' else 'bids')
+        if len(the_prices) == 0:
+            return None
+        the_volume = float(the_volume)
+        if numpy is not None:
+            cumulative = numpy.cumsum(the_volumes)
+            # The first level where everything up to and including it covers the order
+            last_level = min(int(numpy.searchsorted(cumulative, the_volume)), len(the_prices) - 1)
+            taken = the_volumes[:last_level + 1].copy()
+            taken[-1] -= max(0.0, cumulative[last_level] - the_volume)
+            filled = float(min(the_volume, cumulative[last_level]))
+            vwap = float(numpy.dot(the_prices[:last_level + 1], taken) / filled) if filled else float(the_prices[0])
+        else:
+            filled, cost, last_level = 0.0, 0.0, 0
+            for last_level in range(len(the_prices)):
+                taken = min(the_volumes[last_level], the_volume - filled)
+                filled += taken
+                cost += taken * the_prices[last_level]
+                if filled >= the_volume:
+                    break
+            vwap = cost / filled if filled else the_prices[0]
+        best_price = float(the_prices[0])
+        if order_direction == 'buy':
+            slippage = max(0.0, (vwap - best_price) / best_price)
+        else:
+            slippage = max(0.0, (best_price - vwap) / best_price)
+        return {'vwap': vwap, 'worst_price': float(the_prices[last_level]), 'best_price': best_price,
+                'filled': filled, 'slippage': slippage}
+
+
+class OrderBooks:
+    def __init__(self, the_market_feed):
+        self.market_feed = the_market_feed
+        self.books = {}
+        self.lock = threading.Lock()
+        the_market_feed.add_listener('book', self.on_book_message, {'depth': book_depth})
+
+    # Starts keeping a book for the pair ( REST pair name ). wsname is needed for the WebSocket subscription.
+    def track(self, the_pair, wsname=None):
+        with self.lock:
+            if the_pair in self.books:
+                return self.books[the_pair]
+            self.books[the_pair] = OrderBook()
+        if wsname:
+            self.market_feed.subscribe({the_pair: wsname}, channels=('book',))
+            self.market_feed.start()
+        return self.books[the_pair]
+
+    def untrack(self, the_pair):
+        with self.lock:
+            self.books.pop(the_pair, None)
+        self.market_feed.unsubscribe([the_pair], channels=('book',))
+
+    # https://docs.kraken.com/rest/#tag/Market-Data/operation/getOrderBook
+    def load_depth(self, the_pair):
+        the_book = self.books.get(the_pair)
+        if the_book is None:
+            return
+        try:
+            the_result = body(transport.public_get('/0/public/Depth', {'pair': the_pair, 'count': book_depth}))['result']
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            return
+        for each_pair in the_result:
+            the_book.load_snapshot(the_result[each_pair]['asks'], the_result[each_pair]['bids'])
+
+    # Snapshot: {"as": [...], "bs": [...]}. Update: {"a": [...]} and / or {"b": [...]}, the last one has "c".
+    def on_book_message(self, the_pair, the_payload):
+        the_book = self.books.get(the_pair)
+        if the_book is None or not isinstance(the_payload, dict):
+            return
+        if 'as' in the_payload or 'bs' in the_payload:
+            the_book.load_snapshot(the_payload.get('as', []), the_payload.get('bs', []))
+            return
+        if not the_book.valid:
+            # Waiting for the snapshot, updates to the thrown out book would only be wrong
+            return
+        if 'a' in the_payload:
+            the_book.apply_update('asks', the_payload['a'])
+        if 'b' in the_payload:
+            the_book.apply_update('bids', the_payload['b'])
+        if 'c' in the_payload and the_book.checksum() != int(the_payload['c']):
+            print(f"Order book for {the_pair} is out of sync, subscribing to it again")
+            the_book.valid = False
+            self.market_feed.resubscribe([the_pair], channels=('book',))
+
+    # The fill estimate for the pair, or None if there's no usable book for it
+    def fill_price(self, the_pair, order_direction, the_volume):
+        the_book = self.books.get(the_pair)
+        if the_book is None:
+            return None
+        if not self.market_feed.connected and time.time() - the_book.last_update > rest_book_max_age:
+            self.load_depth(the_pair)
+        if not the_book.valid:
+            return None
+        return the_book.fill_price(order_direction, the_volume)
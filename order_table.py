@@ -0,0 +1,234 @@
+# The open orders table on the main screen.
+#
+# The main screen used to have a Listbox of bare txids, and every change to any order deleted and re-inserted all
+# of them. With thousands of orders out, that's thousands of Tk items redrawn every time one of them fills.
+# Here the orders are kept in OrderRows, sorted, outside of Tk. The Treeview only ever has as many items as it has
+# visible rows, and scrolling just changes which orders those items show. When orders change, only the items whose
+# text would be different are written to, so a fill off screen doesn't touch Tk at all.
+#
+# Clicking a column's heading sorts by it, clicking it again sorts the other way. Selections are kept by txid,
+# so they follow their orders through scrolling, sorting and other orders coming and going.
+import bisect
+import decimal
+import time
+from tkinter import ttk, VERTICAL, N, S, E, W
+
+# (name, heading, width in pixels)
+columns = (('pair', "Pair", 75), ('side', "Side", 40), ('price', "Price", 80), ('volume', "Volume", 85),
+           ('filled', "Filled", 85), ('age', "Age", 50))
+# Milliseconds between updates of the Age column
+age_interval = 1000
+
+
+# How long ago the_time was, short enough for a narrow column
+def format_age(the_time):
+    the_seconds = max(0, int(time.time() - the_time))
+    if the_seconds < 60:
+        return f"{the_seconds}s"
+    if the_seconds < 3600:
+        return f"{the_seconds // 60}m"
+    if the_seconds < 86400:
+        return f"{the_seconds // 3600}h"
+    return f"{the_seconds // 86400}d"
+
+
+# Every open order, in the order they're shown. Doesn't need Tk.
+class OrderRows:
+    def __init__(self, sort_column='age', descending=False):
+        # txid -> Order ( see responses.py )
+        self.orders = {}
+        # [(sort key, txid)], always sorted, smallest first
+        self.sorted = []
+        # txid -> its sort key, to find it in self.sorted again
+        self.keys = {}
+        self.sort_column = sort_column
+        self.descending = descending
+
+    def __len__(self):
+        return len(self.sorted)
+
+    # What the_order is sorted by in the_column. Age sorts newest first.
+    @staticmethod
+    def sort_key(the_order, the_column):
+        if the_column == 'pair':
+            return the_order.pair or ''
+        if the_column == 'side':
+            return the_order.type or ''
+        if the_column == 'price':
+            return the_order.price or decimal.Decimal(0)
+        if the_column == 'volume':
+            return the_order.vol
+        if the_column == 'filled':
+            return the_order.vol_exec
+        return -the_order.opentm
+
+    # Applies {txid: (event, Order)} from the event bus. Each order is only moved if its sort key changed.
+    # Returns True if anything about the rows changed.
+    def apply(self, the_changes):
+        changed = False
+        for each_txid, (each_event, each_order) in the_changes.items():
+            if each_event in ('filled', 'cancelled') or each_order is None:
+                if each_txid in self.orders:
+                    self.remove(each_txid)
+                    changed = True
+                continue
+            the_key = self.sort_key(each_order, self.sort_column)
+            if each_txid in self.orders:
+                if self.keys[each_txid] != the_key:
+                    self.remove(each_txid)
+                    self.insert(each_txid, each_order, the_key)
+                else:
+                    self.orders[each_txid] = each_order
+            else:
+                self.insert(each_txid, each_order, the_key)
+            changed = True
+        return changed
+
+    def insert(self, txid, the_order, the_key):
+        self.orders[txid] = the_order
+        self.keys[txid] = the_key
+        bisect.insort(self.sorted, (the_key, txid))
+
+    def remove(self, txid):
+        the_entry = (self.keys.pop(txid), txid)
+        del self.sorted[bisect.bisect_left(self.sorted, the_entry)]
+        del self.orders[txid]
+
+    # Sorts by the_column, or the other way if it already is
+    def sort_by(self, the_column):
+        if the_column == self.sort_column:
+            self.descending = not self.descending
+            return
+        self.sort_column = the_column
+        self.descending = False
+        self.keys = {txid: self.sort_key(self.orders[txid], the_column) for txid in self.orders}
+        self.sorted = sorted((self.keys[txid], txid) for txid in self.keys)
+
+    # The txids of the_count rows from row the_first on
+    def txids(self, the_first, the_count):
+        if self.descending:
+            the_end = len(self.sorted) - the_first
+            the_slice = self.sorted[max(0, the_end - the_count):max(0, the_end)][::-1]
+        else:
+            the_slice = self.sorted[the_first:the_first + the_count]
+        return [txid for _, txid in the_slice]
+
+    # The text of txid's row, one value for each of the columns
+    def values(self, txid):
+        the_order = self.orders[txid]
+        return (the_order.pair or '', the_order.type or '', str(the_order.price or ''), str(the_order.vol),
+                str(the_order.vol_exec), format_age(the_order.opentm))
+
+
+class OrderTable(ttk.Frame):
+    # height is how many rows are visible at once
+    def __init__(self, the_parent, height=10):
+        super().__init__(the_parent)
+        self.rows = OrderRows()
+        self.height = height
+        # The row shown at the top
+        self.first = 0
+        self.selected = set()
+        # Item -> (txid, values) it's showing right now
+        self.shown = {}
+        self.tree = ttk.Treeview(self, columns=[each_name for each_name, _, _ in columns], show='headings',
+                                 height=height, selectmode='extended')
+        for each_name, each_heading, each_width in columns:
+            self.tree.heading(each_name, command=lambda the_name=each_name: self.sort_by(the_name))
+            self.tree.column(each_name, width=each_width, minwidth=each_width, stretch=False,
+                             anchor=W if each_name in ('pair', 'side') else E)
+        self.scrollbar = ttk.Scrollbar(self, orient=VERTICAL, command=self.scroll)
+        self.tree.grid(row=0, column=0, sticky=N + S + E + W)
+        self.scrollbar.grid(row=0, column=1, sticky=N + S)
+        self.tree.bind('<<TreeviewSelect>>', self.selection_changed)
+        self.tree.bind('<MouseWheel>', self.mouse_wheel)
+        self.tree.bind('<Button-4>', lambda event: self.scroll('scroll', -1, 'units'))
+        self.tree.bind('<Button-5>', lambda event: self.scroll('scroll', 1, 'units'))
+        self.show_headings()
+        self.after(age_interval, self.update_ages)
+
+    def __len__(self):
+        return len(self.rows)
+
+    # Subscribed to 'orders' on the event bus: {txid: (event, Order)} for every order that changed
+    def apply_changes(self, the_changes):
+        if self.rows.apply(the_changes):
+            self.render()
+
+    def sort_by(self, the_column):
+        self.rows.sort_by(the_column)
+        self.show_headings()
+        self.render()
+
+    # The sorted column's heading has an arrow for which way it's sorted
+    def show_headings(self):
+        for each_name, each_heading, _ in columns:
+            if each_name == self.rows.sort_column:
+                each_heading += " ▼" if self.rows.descending else " ▲"
+            self.tree.heading(each_name, text=each_heading)
+
+    # Points the items at the rows from self.first on, and only writes to the ones that show something new
+    def render(self):
+        self.first = max(0, min(self.first, len(self.rows) - self.height))
+        the_txids = self.rows.txids(self.first, self.height)
+        the_items = self.tree.get_children()
+        if len(the_items) > len(the_txids):
+            self.tree.delete(*the_items[len(the_txids):])
+            for each_item in the_items[len(the_txids):]:
+                self.shown.pop(each_item, None)
+        for the_index, each_txid in enumerate(the_txids):
+            the_values = self.rows.values(each_txid)
+            if the_index < len(the_items):
+                the_item = the_items[the_index]
+                if self.shown.get(the_item) != (each_txid, the_values):
+                    self.tree.item(the_item, values=the_values)
+            else:
+                the_item = self.tree.insert('', 'end', values=the_values)
+            self.shown[the_item] = (each_txid, the_values)
+        the_selection = [each_item for each_item in self.tree.get_children() if self.shown[each_item][0] in self.selected]
+        if set(the_selection) != set(self.tree.selection()):
+            self.tree.selection_set(the_selection)
+        if self.rows:
+            self.scrollbar.set(self.first / len(self.rows), min(1.0, (self.first + self.height) / len(self.rows)))
+        else:
+            self.scrollbar.set(0, 1)
+
+    # The scrollbar's command: ('moveto', fraction) or ('scroll', how many, 'units' or 'pages')
+    def scroll(self, the_action, the_amount, the_unit=None):
+        if the_action == 'moveto':
+            self.first = int(float(the_amount) * len(self.rows))
+        elif the_unit == 'pages':
+            self.first += int(the_amount) * self.height
+        else:
+            self.first += int(the_amount)
+        self.render()
+
+    def mouse_wheel(self, event):
+        self.scroll('scroll', -1 if event.delta > 0 else 1, 'units')
+        return 'break'
+
+    # Selected orders that are scrolled out of view stay selected
+    def selection_changed(self, event):
+        visible_txids = {self.shown[each_item][0] for each_item in self.tree.get_children()}
+        self.selected = (self.selected - visible_txids) | {self.shown[each_item][0] for each_item in self.tree.selection()}
+
+    # Only the visible rows have an age that's shown, so only they are updated
+    def update_ages(self):
+        if self.rows:
+            self.render()
+        self.after(age_interval, self.update_ages)
+
+    # The txids of every selected order that's still open
+    def selected_txids(self):
+        return [txid for txid in self.selected if txid in self.rows.orders]
+
+    # The txid of the row at y ( in pixels from the top of the table ), or None
+    def txid_at(self, y):
+        the_item = self.tree.identify_row(y)
+        return self.shown[the_item][0] if the_item in self.shown else None
+
+    def order(self, txid):
+        return self.rows.orders.get(txid)
+
+    def bind_double_click(self, the_function):
+        self.tree.bind('<Double-Button-1>', the_function)
@@ -0,0 +1,293 @@
+# Keeps track of open orders by applying only what changed, instead of downloading every open order
+# ( and all of their trades ) every 5 seconds.
+#
+# When websocket-client is installed, the private openOrders stream is used, on its own thread:
+# it sends every open order once, then only the fields that change ( https://docs.kraken.com/websockets/#message-openOrders ).
+# Otherwise, or while the stream is down, REST is polled for changes only, by poll_step() running on the poller:
+# - ClosedOrders with a "start" cursor, for orders that were filled / cancelled since the last poll
+# - TradesHistory with a "start" cursor, for orders that got partially filled since the last time.
+#   This costs 2 API credits, so it's only done every trades_poll_interval seconds.
+# - QueryOrders for just the orders those touched, and for orders this program just placed
+# and OpenOrders is only downloaded in full every order_resync_interval seconds, to pick up orders placed elsewhere.
+# Polls come every order_poll_interval seconds while something is going on ( see add_activity_check ),
+# and further and further apart while nothing is.
+#
+# Every change is sent to the listeners as ( event, txid, order ), where event is one of
+# 'new', 'partially_filled', 'filled' and 'cancelled'.
+import decimal
+import json
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from config import ws_auth_url, order_poll_interval, order_idle_poll_interval, order_resync_interval, \
+    trades_poll_interval
+from retry_policy import retry_policy, RequestFailed
+from responses import loads, Order
+
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+receive_timeout = 10
+max_reconnect_wait = 30
+# QueryOrders takes at most 50 txids at once
+query_orders_limit = 50
+
+
+class OrderTracker:
+    # request_function is kraken_request ( for one key ), passed in so this doesn't have to import kraken_api
+    def __init__(self, request_function, the_retry_policy=retry_policy):
+        self.kraken_request = request_function
+        self.retry_policy = the_retry_policy
+        # txid -> order information, only the ones that are still open. 'error' works the same as it always has:
+        # None until the first load, then True / False depending on if the last update worked.
+        self.open_orders = {'error': None}
+        # Resolves once every open order has been loaded for the first time
+        self.ready = Future()
+        self.listeners = []
+        self.lock = threading.Lock()
+        # txids that were placed here and need their full information fetched
+        self.pending = set()
+        self.closed_cursor = None
+        self.trades_cursor = None
+        self.last_resync = 0
+        self.last_trades_poll = 0
+        # Goes up by one for every change, so a poll can tell if it found anything
+        self.changes = 0
+        self.idle_interval = order_poll_interval
+        self.activity_checks = []
+        self.connection = None
+        self.stream_connected = False
+        self.killed = False
+        self.thread = None
+
+    def add_listener(self, the_function):
+        self.listeners.append(the_function)
+
+    # the_function returns True while orders are expected to change soon ( schedules are running ),
+    # which keeps polling at order_poll_interval
+    def add_activity_check(self, the_function):
+        self.activity_checks.append(the_function)
+
+    def active(self):
+        return bool(self.pending) or any(each_check() for each_check in self.activity_checks)
+
+    def notify(self, the_event, txid, the_order):
+        self.changes += 1
+        for each_listener in self.listeners:
+            each_listener(the_event, txid, the_order)
+
+    # Merges new information about an order into what's known and tells the listeners what changed
+    def apply_order(self, txid, the_fields):
+        with self.lock:
+            old_order = self.open_orders.get(txid)
+            if not isinstance(old_order, Order):
+                old_order = None
+            the_order = (old_order or Order()).updated(the_fields)
+            the_status = the_order.status
+            if the_status in ('closed', 'canceled', 'expired'):
+                self.open_orders.pop(txid, None)
+                self.pending.discard(txid)
+                # Already gone, or never seen open ( placed and closed somewhere else between polls )
+                if old_order is None:
+                    return
+            else:
+                self.open_orders[txid] = the_order
+                # Kraken has answered for it, so it doesn't need looking up anymore
+                if the_status != 'pending':
+                    self.pending.discard(txid)
+        if the_status == 'closed':
+            self.notify('filled', txid, the_order)
+        elif the_status in ('canceled', 'expired'):
+            self.notify('cancelled', txid, the_order)
+        elif old_order is None:
+            self.notify('new', txid, the_order)
+        elif the_order.vol_exec > old_order.vol_exec:
+            self.notify('partially_filled', txid, the_order)
+
+    # Called right after AddOrder works. The full information is fetched on the next poll
+    # ( or arrives over the stream ), but this is enough for cancelling it in the meantime.
+    def add_submitted(self, txid, order_direction, the_volume, the_pair, the_price):
+        self.apply_order(txid, {'status': 'pending', 'opentm': time.time(), 'vol': str(the_volume), 'vol_exec': '0',
+                                'descr': {'pair': the_pair, 'type': order_direction, 'ordertype': 'limit',
+                                          'price': str(the_price)}})
+        with self.lock:
+            if txid in self.open_orders:
+                self.pending.add(txid)
+
+    # Starts the stream, if websocket-client is installed. Polling is started by adding poll_step to the poller.
+    def start(self):
+        if self.thread is None and websocket is not None:
+            self.thread = threading.Thread(target=self.run, name="order_tracker", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.killed = True
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except (websocket.WebSocketException, OSError):
+                pass
+
+    # Keeps the stream connected. The REST load always comes first, so the cursors are set for when the stream drops.
+    def run(self):
+        reconnect_wait = 1
+        while not self.killed:
+            try:
+                self.ready.result(timeout=1)
+            except FutureTimeout:
+                continue
+            if self.stream():
+                reconnect_wait = 1
+            if self.killed:
+                break
+            # poll_step() polls REST while waiting to reconnect
+            time.sleep(reconnect_wait)
+            reconnect_wait = min(reconnect_wait * 2, max_reconnect_wait)
+
+    # One refresh over REST, for the poller. Returns the seconds until the next one.
+    def poll_step(self):
+        changes_before = self.changes
+        if not self.ready.done() or time.time() - self.last_resync >= order_resync_interval:
+            self.resync()
+        elif not self.stream_connected:
+            self.poll_changes()
+        # While streaming nothing is polled, but it's checked on this often so polling starts soon after a drop
+        if self.stream_connected or not self.ready.done() or self.active() or self.changes != changes_before:
+            self.idle_interval = order_poll_interval
+            return order_poll_interval
+        self.idle_interval = min(self.idle_interval * 2, order_idle_poll_interval)
+        return self.idle_interval
+
+    # Returns the json result of a private call, or None if it didn't work within its retries
+    def private_result(self, uri_path, data):
+        try:
+            return self.retry_policy.send(self.kraken_request, uri_path, data)
+        except RequestFailed as e:
+            print(f"{uri_path} failed: {e.errors}")
+            return None
+
+    # https://docs.kraken.com/rest/#tag/User-Data/operation/getOpenOrders
+    # Downloads every open order. Orders that disappeared since the last time were closed or cancelled somewhere else.
+    def resync(self):
+        resync_started = time.time()
+        the_result = self.private_result("/0/private/OpenOrders", {})
+        if the_result is None:
+            self.open_orders['error'] = True
+            return
+        json_result_open = the_result['open']
+        with self.lock:
+            gone = [txid for txid in self.open_orders if txid != 'error' and txid not in json_result_open
+                    and txid not in self.pending]
+        for each_open_order in json_result_open:
+            self.apply_order(each_open_order, json_result_open[each_open_order])
+        if gone:
+            self.query_orders(gone)
+        if self.closed_cursor is None:
+            self.closed_cursor = self.trades_cursor = resync_started
+        self.last_resync = resync_started
+        self.open_orders['error'] = False
+        if not self.ready.done():
+            self.ready.set_result(True)
+
+    # Fetches the current state of just these orders
+    def query_orders(self, txids):
+        txids = list(txids)
+        for the_index in range(0, len(txids), query_orders_limit):
+            the_result = self.private_result("/0/private/QueryOrders",
+                                             {'txid': ','.join(txids[the_index:the_index + query_orders_limit])})
+            if the_result is None:
+                return False
+            for each_txid in the_result:
+                self.apply_order(each_txid, the_result[each_txid])
+        return True
+
+    # One REST poll, which only gets back what changed since the last one
+    def poll_changes(self):
+        if self.closed_cursor is None:
+            return
+        worked = True
+        # https://docs.kraken.com/rest/#tag/User-Data/operation/getClosedOrders
+        the_offset = 0
+        newest_close = self.closed_cursor
+        while True:
+            the_result = self.private_result("/0/private/ClosedOrders", {'start': str(self.closed_cursor),
+                                                                        'ofs': str(the_offset)})
+            if the_result is None:
+                worked = False
+                break
+            for each_txid in the_result['closed']:
+                self.apply_order(each_txid, the_result['closed'][each_txid])
+                newest_close = max(newest_close, float(the_result['closed'][each_txid].get('closetm', 0)))
+            the_offset += len(the_result['closed'])
+            if not the_result['closed'] or the_offset >= int(the_result.get('count', 0)):
+                break
+        if worked:
+            self.closed_cursor = newest_close
+        # https://docs.kraken.com/rest/#tag/User-Data/operation/getTradeHistory
+        touched = set()
+        if len(self.open_orders) > 1 and time.time() - self.last_trades_poll >= trades_poll_interval:
+            the_result = self.private_result("/0/private/TradesHistory", {'start': str(self.trades_cursor)})
+            if the_result is None:
+                worked = False
+            else:
+                self.last_trades_poll = time.time()
+                for each_trade in the_result['trades'].values():
+                    self.trades_cursor = max(self.trades_cursor, float(each_trade['time']))
+                    if each_trade['ordertxid'] in self.open_orders:
+                        touched.add(each_trade['ordertxid'])
+        with self.lock:
+            touched |= self.pending
+        if touched and not self.query_orders(touched):
+            worked = False
+        self.open_orders['error'] = not worked
+
+    # https://docs.kraken.com/rest/#tag/Websocket-Authentication
+    def stream(self):
+        the_result = self.private_result("/0/private/GetWebSocketsToken", {})
+        if the_result is None:
+            return False
+        try:
+            self.connection = websocket.create_connection(ws_auth_url, timeout=receive_timeout)
+            self.connection.send(json.dumps({'event': 'subscribe',
+                                             'subscription': {'name': 'openOrders', 'token': the_result['token']}}))
+        except (websocket.WebSocketException, OSError) as e:
+            print(f"Order stream couldn't connect: {str(e)}")
+            return False
+        self.stream_connected = True
+        # The first message is every open order. Anything known that isn't in it was closed while disconnected.
+        snapshot_received = False
+        while not self.killed:
+            try:
+                the_message = self.connection.recv()
+            except (websocket.WebSocketException, OSError):
+                break
+            if not the_message:
+                break
+            # One message that can't be read is skipped, it doesn't stop the stream ( the next poll catches up )
+            try:
+                the_message = loads(the_message)
+                # [[{txid: {fields}}, ..], "openOrders", {"sequence": n}]. Everything else is a dict.
+                if not (isinstance(the_message, list) and len(the_message) > 1 and the_message[1] == 'openOrders'):
+                    continue
+                for each_update in the_message[0]:
+                    for each_txid in each_update:
+                        self.apply_order(each_txid, each_update[each_txid])
+                if not snapshot_received:
+                    snapshot_received = True
+                    in_snapshot = {each_txid for each_update in the_message[0] for each_txid in each_update}
+                    with self.lock:
+                        gone = [txid for txid in self.open_orders if txid != 'error' and txid not in in_snapshot]
+                    if gone:
+                        self.query_orders(gone)
+                self.open_orders['error'] = False
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError, decimal.InvalidOperation) as e:
+                print(f"Skipping an order stream message that couldn't be read: {e!r}")
+        self.stream_connected = False
+        try:
+            self.connection.close()
+        except (websocket.WebSocketException, OSError):
+            pass
+        return True
@@ -0,0 +1,69 @@
+# Lookups for pairs and assets, built once from the /0/public/AssetPairs response
+# https://docs.kraken.com/rest/#tag/Market-Data/operation/getTradableAssetPairs
+#
+# Matching pair names against asset codes with startswith / endswith gets things wrong
+# ( 'T' is the start of a lot of pairs ) and has to go through every pair every time.
+# AssetPairs already says exactly what the base and quote of every pair are, so everything here is a dict lookup.
+import decimal
+
+
+class PairIndex:
+    def __init__(self, asset_pairs):
+        # Pair name ( XXBTZUSD ) -> what's needed about it
+        self.pairs = {}
+        # Pair name, altname ( XBTUSD ) or wsname ( XBT/USD ) -> pair name
+        self.names = {}
+        # Asset ( XXBT ) -> pair names that have it as their base / quote
+        self.pairs_by_base = {}
+        self.pairs_by_quote = {}
+        for each_pair in asset_pairs:
+            the_info = asset_pairs[each_pair]
+            self.pairs[each_pair] = {'base': the_info['base'],
+                                     'quote': the_info['quote'],
+                                     'altname': the_info.get('altname', each_pair),
+                                     'wsname': the_info.get('wsname'),
+                                     'ordermin': decimal.Decimal(the_info['ordermin']) if the_info.get('ordermin') else None,
+                                     'costmin': decimal.Decimal(the_info['costmin']) if the_info.get('costmin') else None,
+                                     'pair_decimals': the_info.get('pair_decimals'),
+                                     'lot_decimals': the_info.get('lot_decimals')}
+            self.names[each_pair] = each_pair
+            self.names[self.pairs[each_pair]['altname']] = each_pair
+            if self.pairs[each_pair]['wsname']:
+                self.names[self.pairs[each_pair]['wsname']] = each_pair
+            self.pairs_by_base.setdefault(the_info['base'], []).append(each_pair)
+            self.pairs_by_quote.setdefault(the_info['quote'], []).append(each_pair)
+
+    # Works with the pair name, altname or wsname. Returns the_name back if it isn't known.
+    def name(self, the_name):
+        return self.names.get(the_name, the_name)
+
+    def pair(self, the_name):
+        return self.pairs.get(self.name(the_name))
+
+    # The minimum order size ( in the base currency ) of the pair and what that base currency is
+    def minimum_order(self, the_name):
+        the_pair = self.pair(the_name)
+        if the_pair is None:
+            return None, None
+        return the_pair['ordermin'], the_pair['base']
+
+    # Pairs that are bought with the_asset ( it's the quote ) and pairs that sell the_asset ( it's the base )
+    def buy_pairs(self, the_asset):
+        return self.pairs_by_quote.get(the_asset, [])
+
+    def sell_pairs(self, the_asset):
+        return self.pairs_by_base.get(the_asset, [])
+
+    # Kraken rejects prices and volumes with more decimals than the pair allows
+    def round_price(self, the_name, the_price, rounding=decimal.ROUND_DOWN):
+        the_pair = self.pair(the_name)
+        if the_pair is None or the_pair['pair_decimals'] is None:
+            return decimal.Decimal(the_price)
+        return decimal.Decimal(the_price).quantize(decimal.Decimal(1).scaleb(-the_pair['pair_decimals']), rounding)
+
+    def round_volume(self, the_name, the_volume):
+        the_pair = self.pair(the_name)
+        if the_pair is None or the_pair['lot_decimals'] is None:
+            return decimal.Decimal(the_volume)
+        return decimal.Decimal(the_volume).quantize(decimal.Decimal(1).scaleb(-the_pair['lot_decimals']),
+                                                    decimal.ROUND_DOWN)
@@ -0,0 +1,43 @@
+# Every periodic refresh from Kraken ( open orders, balance, the first tickers and pairs ), run by one Scheduler.
+#
+# Each of these used to have its own thread with a while loop, a timestamp in last_updates and 1 second sleeps.
+# Here each one is a job: a function that does one refresh and returns how many seconds until the next one
+# ( or None once it never has to run again ). That lets every job pick its own interval from what's going on,
+# like polling orders faster while schedules have orders out, and lets anything ask for a refresh right away
+# with refresh(), like the balance after a fill.
+#
+# Jobs that spend API credits have a priority. A job only runs if, after it, the API counter would still have
+# its priority's reserve left over; otherwise it waits until the counter has decayed that far.
+# That keeps the credits for what matters most: a balance refresh never holds up the next order poll.
+from rate_limiter import limiter
+from scheduler import Scheduler
+
+# API credits that have to be left over after a job of each priority runs
+priority_reserves = {'high': 0, 'normal': 3}
+
+
+class Poller:
+    def __init__(self, the_limiter=limiter, workers=4):
+        self.limiter = the_limiter
+        self.scheduler = Scheduler(self.run_job, workers=workers, name="poller")
+
+    # the_function does one refresh and returns the seconds until the next one, or None when it's done for good.
+    # api_cost is about how many API credits one refresh spends, from the_limiter's counter ( the poller's by default ).
+    def add(self, the_name, the_function, priority='normal', api_cost=0, delay=0, the_limiter=None):
+        self.scheduler.add(the_name, {'name': the_name, 'function': the_function, 'priority': priority,
+                                      'api_cost': api_cost, 'limiter': the_limiter or self.limiter}, delay)
+
+    # Runs the job after delay seconds instead of when it was going to. Refreshes asked for close together
+    # push it back each time, so a burst of them turns into one refresh.
+    def refresh(self, the_name, delay=0):
+        self.scheduler.run_now(the_name, delay)
+
+    def run_job(self, the_job):
+        if the_job['api_cost']:
+            wait_time = the_job['limiter'].api_wait(the_job['api_cost'] + priority_reserves[the_job['priority']])
+            if wait_time > 0:
+                return wait_time
+        return the_job['function']()
+
+    def stop(self):
+        self.scheduler.stop()
@@ -0,0 +1,142 @@
+# Keeps private calls under Kraken's rate limits instead of finding them by hitting "EAPI:Rate limit exceeded".
+#
+# Kraken has two kinds of counters, and both work like a token bucket running backwards:
+# every call adds to a counter, the counter goes down by "decay" every second,
+# and once the counter would go over "amount" the call is rejected.
+# - The API counter is shared by every private REST call except the trading ones.
+# - The trading counter is per pair, and is what AddOrder / EditOrder / CancelOrder add to.
+import threading
+import time
+from config import account_type
+from metrics import metrics
+
+# https://support.kraken.com/hc/en-us/articles/206548367 for all rate-limits
+# The REST API counter. Trading calls don't add to this one.
+api_limits = {'starter': {'amount': 15, 'decay': 0.33},
+              'intermediate': {'amount': 20, 'decay': 0.5},
+              'pro': {'amount': 20, 'decay': 1}}
+# Total credits to specific account types and the amount that those credits come back every second
+# These are the trading counters, one for each pair
+account_limits = {'starter': {'amount': 60, 'decay': 1},
+                  'intermediate': {'amount': 125, 'decay': 2.34},
+                  'pro': {'amount': 180, 'decay': 3.75}}
+# Edit / Cancel are not 5/10/15/etc. seconds
+# They're all less than the specified amount, other than 301 which is greater-than 300
+# These rate-limits are also not expecting you to use anything else to interact with the API
+# ---
+# https://support.kraken.com/hc/en-us/articles/360045239571 for trading rate-limits
+rate_limits = {'place_order': 1,
+               'edit': {5: 6, 10: 5, 15: 4, 45: 3, 90: 2, 300: 0, 301: 0},
+               'cancel': {5: 8, 10: 6, 15: 5, 45: 4, 90: 2, 300: 1, 301: 0}}
+# What each private endpoint adds to the API counter. Anything not listed here adds 1.
+api_costs = {'/0/private/Ledgers': 2,
+             '/0/private/QueryLedgers': 2,
+             '/0/private/TradesHistory': 2,
+             '/0/private/AddOrder': 0,
+             '/0/private/AddOrderBatch': 0,
+             '/0/private/EditOrder': 0,
+             '/0/private/CancelOrder': 0,
+             '/0/private/CancelOrderBatch': 0,
+             '/0/private/CancelAll': 0,
+             '/0/private/CancelAllOrdersAfter': 0}
+
+
+# How much cancelling or editing ( the_action ) an order that is order_age seconds old adds to the trading counter
+def order_age_penalty(the_action, order_age):
+    for each_age in rate_limits[the_action]:
+        if each_age == 301 or order_age < each_age:
+            return rate_limits[the_action][each_age]
+    return 0
+
+
+class RateLimiter:
+    def __init__(self, the_account_type=account_type):
+        self.account_type = the_account_type
+        self.api_max = api_limits[the_account_type]['amount']
+        self.api_decay = api_limits[the_account_type]['decay']
+        self.trading_max = account_limits[the_account_type]['amount']
+        self.trading_decay = account_limits[the_account_type]['decay']
+        self.api_count = 0.0
+        self.trading_counts = {}
+        self.last_decay = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Takes off whatever has decayed since the last time. Must be called with self.lock held.
+    def decay(self):
+        now = time.monotonic()
+        elapsed = now - self.last_decay
+        self.last_decay = now
+        self.api_count = max(0.0, self.api_count - elapsed * self.api_decay)
+        for each_pair in list(self.trading_counts):
+            self.trading_counts[each_pair] = max(0.0, self.trading_counts[each_pair] - elapsed * self.trading_decay)
+            if self.trading_counts[each_pair] == 0:
+                del self.trading_counts[each_pair]
+
+    # Blocks until the call fits under both counters, then charges it.
+    # trading_cost defaults to the cost of placing one order for AddOrder, and nothing for everything else.
+    # reserve is how many API credits have to be left over after the call, for calls that should never crowd out
+    # the rest ( exports ). It's checked and charged under the same lock, so two callers can't both squeeze in.
+    # Returns how many seconds were spent waiting.
+    def acquire(self, uri_path, pair=None, trading_cost=None, reserve=0):
+        api_cost = api_costs.get(uri_path, 1)
+        if trading_cost is None:
+            trading_cost = rate_limits['place_order'] if uri_path == '/0/private/AddOrder' else 0
+        # A reserve that leaves no room for the call at all would wait forever
+        reserve = max(0, min(reserve, self.api_max - api_cost))
+        waited = 0.0
+        while True:
+            with self.lock:
+                self.decay()
+                wait_time = 0.0
+                if api_cost and self.api_count + api_cost + reserve > self.api_max:
+                    wait_time = (self.api_count + api_cost + reserve - self.api_max) / self.api_decay
+                if trading_cost and pair is not None:
+                    trading_count = self.trading_counts.get(pair, 0.0)
+                    if trading_count + trading_cost > self.trading_max:
+                        wait_time = max(wait_time, (trading_count + trading_cost - self.trading_max) / self.trading_decay)
+                if wait_time == 0:
+                    self.api_count += api_cost
+                    if trading_cost and pair is not None:
+                        self.trading_counts[pair] = self.trading_counts.get(pair, 0.0) + trading_cost
+                    break
+            time.sleep(wait_time)
+            waited += wait_time
+        if api_cost:
+            metrics.count('rate_limit_credits_total', (('endpoint', uri_path), ('counter', 'api')), api_cost)
+        if trading_cost and pair is not None:
+            metrics.count('rate_limit_credits_total', (('endpoint', uri_path), ('counter', 'trading')), trading_cost)
+        metrics.observe('rate_limit_wait_seconds', (('endpoint', uri_path),), waited)
+        return waited
+
+    # Seconds until the_cost more credits would fit under the API counter. Doesn't charge anything.
+    def api_wait(self, the_cost):
+        with self.lock:
+            self.decay()
+            return max(0.0, (self.api_count + the_cost - self.api_max) / self.api_decay)
+
+    # Kraken said the limit was hit anyway ( something else is using the same key ), so treat the counter as full
+    def mark_full(self, uri_path, pair=None):
+        with self.lock:
+            self.decay()
+            if pair is not None and api_costs.get(uri_path, 1) == 0:
+                self.trading_counts[pair] = float(self.trading_max)
+            else:
+                self.api_count = float(self.api_max)
+
+    # Current credit usage and how much headroom is left
+    def usage(self):
+        with self.lock:
+            self.decay()
+            the_usage = {'account_type': self.account_type,
+                         'api': {'count': round(self.api_count, 2), 'max': self.api_max,
+                                 'headroom': round(self.api_max - self.api_count, 2)},
+                         'trading': {}}
+            for each_pair in self.trading_counts:
+                the_usage['trading'][each_pair] = {'count': round(self.trading_counts[each_pair], 2),
+                                                   'max': self.trading_max,
+                                                   'headroom': round(self.trading_max - self.trading_counts[each_pair], 2)}
+            return the_usage
+
+
+# The limiter for the key in config.py
+limiter = RateLimiter()
@@ -0,0 +1,141 @@
+# Parses each response from Kraken once, and turns what's read over and over into small records.
+#
+# Every caller used to call resp.json() itself, often three or four times for the same response, and tickers,
+# balances and orders were kept the way Kraken sends them: nested dicts and lists of strings, turned into
+# decimal.Decimal again on every read. Here:
+# - body() parses a response once and keeps the result on it, so everything after that reuses it.
+#   orjson is used for parsing if it's installed, the json module otherwise.
+# - Ticker and Order hold the values that get read, already as Decimal ( times as float ), in __slots__.
+#   They're never changed once made: an update makes a new one, so other threads never see one half-updated.
+# - Balances are a dict of asset -> Decimal, see kraken_api.get_account_balance.
+import decimal
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Parses JSON text ( str or bytes ) with orjson if it's there. Raises ValueError if it isn't JSON.
+def loads(the_text):
+    if orjson is not None:
+        return orjson.loads(the_text)
+    return json.loads(the_text)
+
+
+# The parsed JSON of a requests response, parsed the first time it's asked for. {} if it isn't JSON.
+def body(the_response):
+    the_body = getattr(the_response, 'parsed_body', None)
+    if the_body is None:
+        try:
+            the_body = loads(the_response.content)
+        except ValueError:
+            the_body = {}
+        if not isinstance(the_body, dict):
+            the_body = {}
+        the_response.parsed_body = the_body
+    return the_body
+
+
+# https://docs.kraken.com/rest/#tag/Market-Data/operation/getTickerInformation
+# The same fields come over the WebSocket ticker channel.
+class Ticker:
+    __slots__ = ('ask', 'bid', 'last', 'volume_today', 'volume_24h', 'vwap_24h', 'low_24h', 'high_24h')
+
+    def __init__(self, ask, bid, last, volume_today, volume_24h, vwap_24h, low_24h, high_24h):
+        self.ask = ask
+        self.bid = bid
+        self.last = last
+        self.volume_today = volume_today
+        self.volume_24h = volume_24h
+        self.vwap_24h = vwap_24h
+        self.low_24h = low_24h
+        self.high_24h = high_24h
+
+    # From Kraken's {"a": [price, whole lot volume, lot volume], "b": [..], "c": [price, lot volume],
+    # "v": [today, last 24 hours], "p": [..], "l": [..], "h": [..], ..}
+    @classmethod
+    def from_kraken(cls, the_ticker):
+        return cls(decimal.Decimal(the_ticker['a'][0]), decimal.Decimal(the_ticker['b'][0]),
+                   decimal.Decimal(the_ticker['c'][0]),
+                   decimal.Decimal(the_ticker['v'][0]), decimal.Decimal(the_ticker['v'][1]),
+                   decimal.Decimal(the_ticker['p'][1]),
+                   decimal.Decimal(the_ticker['l'][1]), decimal.Decimal(the_ticker['h'][1]))
+
+    # A copy with a new best bid and ask, from the spread channel
+    def with_spread(self, the_bid, the_ask):
+        return Ticker(the_ask, the_bid, self.last, self.volume_today, self.volume_24h, self.vwap_24h,
+                      self.low_24h, self.high_24h)
+
+    def __repr__(self):
+        return (f"Ticker(ask={self.ask}, bid={self.bid}, last={self.last}, volume_24h={self.volume_24h}, "
+                f"vwap_24h={self.vwap_24h})")
+
+
+# Every ticker in a Ticker result ( or the cache ), as records. Pairs that can't be read are left out.
+def tickers_from_kraken(the_result):
+    the_tickers = {}
+    for each_pair in the_result:
+        try:
+            the_tickers[each_pair] = Ticker.from_kraken(the_result[each_pair])
+        except (KeyError, IndexError, TypeError, decimal.InvalidOperation):
+            pass
+    return the_tickers
+
+
+# https://docs.kraken.com/rest/#tag/User-Data/operation/getOpenOrders
+# The fields that are read all the time have their own slot. Everything else Kraken sends is kept in details,
+# the way it came, so nothing is lost for showing an order's information.
+class Order:
+    __slots__ = ('status', 'opentm', 'vol', 'vol_exec', 'pair', 'type', 'ordertype', 'price', 'details')
+    # Fields of "descr" that have their own slot
+    descr_slots = ('pair', 'type', 'ordertype', 'price')
+
+    def __init__(self, status=None, opentm=0.0, vol=decimal.Decimal(0), vol_exec=decimal.Decimal(0), pair=None,
+                 type=None, ordertype=None, price=None, details=None):
+        self.status = status
+        self.opentm = opentm
+        self.vol = vol
+        self.vol_exec = vol_exec
+        self.pair = pair
+        self.type = type
+        self.ordertype = ordertype
+        self.price = price
+        self.details = details if details is not None else {}
+
+    # A new Order with the_fields ( all of an order, or just what changed, as Kraken sends them ) applied
+    def updated(self, the_fields):
+        the_values = {each_slot: getattr(self, each_slot) for each_slot in self.__slots__}
+        the_details = dict(self.details)
+        for each_field, each_value in the_fields.items():
+            if each_field == 'status':
+                the_values['status'] = each_value
+            elif each_field == 'opentm':
+                the_values['opentm'] = float(each_value)
+            elif each_field in ('vol', 'vol_exec'):
+                the_values[each_field] = decimal.Decimal(each_value)
+            elif each_field == 'descr' and isinstance(each_value, dict):
+                the_descr = dict(the_details.get('descr', {}))
+                for each_key, each_descr_value in each_value.items():
+                    if each_key == 'price':
+                        the_values['price'] = decimal.Decimal(each_descr_value)
+                    elif each_key in self.descr_slots:
+                        the_values[each_key] = each_descr_value
+                    else:
+                        the_descr[each_key] = each_descr_value
+                the_details['descr'] = the_descr
+            else:
+                the_details[each_field] = each_value
+        the_values['details'] = the_details
+        return Order(**the_values)
+
+    # Back to the shape Kraken sends it in
+    def as_kraken(self):
+        return {**self.details, 'status': self.status, 'opentm': self.opentm, 'vol': str(self.vol),
+                'vol_exec': str(self.vol_exec),
+                'descr': {**self.details.get('descr', {}), 'pair': self.pair, 'type': self.type,
+                          'ordertype': self.ordertype, 'price': str(self.price)}}
+
+    def __repr__(self):
+        return repr(self.as_kraken())
@@ -0,0 +1,136 @@
+# Decides what happens when a private call doesn't work, by what kind of failure it was.
+#
+# Every caller used to handle this on its own: AddOrder slept 5 seconds and tried again forever, whatever the error
+# ( so "EOrder:Insufficient funds" never stopped ), and cancels gave up after the first try.
+# Here every failure is sorted into a kind first:
+# - nonce:       another thread's request got there first. Sent again straight away with a new nonce.
+# - rate_limit:  something else used up the credits. The limiter is told its counter is full, so the next try
+#                waits exactly as long as the limiter thinks it has to.
+# - lockout:     Kraken locked the key out for going over the limits. Same as rate_limit, but also waits the longest backoff.
+# - unavailable: Kraken is busy or down, or the HTTP status says so. Waits with exponential backoff and jitter.
+# - connection:  no response at all. Same as unavailable.
+# - cancel_only: the market only takes cancels for now, which lasts minutes rather than seconds. Fails straight away,
+#                but Kraken didn't place anything, so a schedule's order is only put back for its next step.
+# - permanent:   anything else ( insufficient funds, invalid arguments, unknown order, .. ). Fails straight away,
+#                since sending the same thing again gets the same answer.
+# Each endpoint has a budget of how many times it's sent again before giving up.
+#
+# Placing orders is the exception. After a connection or unavailable failure, Kraken might have placed the order
+# anyway ( the answer is what got lost ), so sending it again could place it twice. Those are never sent again here,
+# RequestFailed is raised straight away and the batcher looks the order up before deciding anything ( see batcher.py ).
+# rate_limit and nonce failures mean Kraken didn't do anything with it, so they're still sent again.
+import random
+import time
+from config import retry_base_delay, retry_max_delay
+from rate_limiter import limiter, api_costs
+from metrics import metrics
+from responses import body
+
+# The kind of failure, by the start of Kraken's error string. Anything not listed here is permanent.
+# https://support.kraken.com/hc/en-us/articles/360001491786-API-error-messages
+error_kinds = (('EAPI:Invalid nonce', 'nonce'),
+               ('EAPI:Rate limit exceeded', 'rate_limit'),
+               ('EOrder:Rate limit exceeded', 'rate_limit'),
+               ('EGeneral:Too many requests', 'rate_limit'),
+               ('EGeneral:Temporary lockout', 'lockout'),
+               ('EService:Unavailable', 'unavailable'),
+               ('EService:Busy', 'unavailable'),
+               ('EService:Deadline elapsed', 'unavailable'),
+               ('EService:Market in cancel_only mode', 'cancel_only'),
+               ('EGeneral:Internal error', 'unavailable'))
+# Least to most serious, for picking one kind when Kraken gives more than one error
+kind_severity = ('nonce', 'unavailable', 'connection', 'rate_limit', 'lockout', 'cancel_only', 'permanent')
+# How many times a call to each endpoint is sent again before giving up. Anything not listed here gets default_budget.
+# Placing orders gets the most, since a schedule's order is lost otherwise ( only for failures that mean it wasn't
+# placed, see placement_endpoints ).
+retry_budgets = {'/0/private/AddOrder': 8,
+                 '/0/private/AddOrderBatch': 8,
+                 '/0/private/CancelOrder': 5,
+                 '/0/private/CancelOrderBatch': 5,
+                 '/0/private/CancelAll': 5,
+                 '/0/private/CancelAllOrdersAfter': 2}
+default_budget = 3
+# Endpoints that place orders, and the kinds of failure after which the order might have been placed all the same
+placement_endpoints = ('/0/private/AddOrder', '/0/private/AddOrderBatch')
+unsure_kinds = ('connection', 'unavailable')
+
+
+# The call didn't work and won't be tried again. kind is one of the kinds above and errors is Kraken's error list.
+class RequestFailed(Exception):
+    def __init__(self, uri_path, the_kind, errors):
+        super().__init__(f"{uri_path}: {', '.join(errors)}")
+        self.uri_path = uri_path
+        self.kind = the_kind
+        self.errors = errors
+
+
+# (kind, errors, json) for a response from kraken_request. kind is None if it worked.
+def classify(the_response):
+    if the_response is None:
+        return 'connection', ['Connection issue'], None
+    the_json = body(the_response)
+    the_errors = the_json.get('error') or []
+    if the_response.status_code != 200:
+        if the_response.status_code == 429:
+            the_kind = 'rate_limit'
+        elif the_response.status_code >= 500:
+            the_kind = 'unavailable'
+        else:
+            the_kind = 'permanent'
+        return the_kind, the_errors or [f"HTTP {the_response.status_code}"], the_json
+    if not the_errors:
+        return None, [], the_json
+    return error_kind(the_errors), the_errors, the_json
+
+
+# The kind of failure for a list of Kraken's error strings.
+# With more than one error, the worst one decides: any permanent error means it's never going to work.
+def error_kind(the_errors):
+    the_kinds = [next((each_kind for each_start, each_kind in error_kinds if each_error.startswith(each_start)),
+                      'permanent') for each_error in the_errors]
+    return max(the_kinds, key=kind_severity.index) if the_kinds else 'permanent'
+
+
+# Seconds to wait before the_attempt'th retry ( starting at 0 ): anywhere between 0 and the exponential backoff,
+# so threads that failed together don't all come back together
+def backoff_delay(the_attempt, base_delay=retry_base_delay, max_delay=retry_max_delay):
+    return random.uniform(0, min(max_delay, base_delay * 2 ** the_attempt))
+
+
+class RetryPolicy:
+    def __init__(self, the_limiter=limiter, budgets=None, base_delay=retry_base_delay, max_delay=retry_max_delay):
+        self.limiter = the_limiter
+        self.budgets = retry_budgets if budgets is None else budgets
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    # Sends the call with request_function ( kraken_request ) until it works or it's given up on.
+    # Returns Kraken's 'result', or raises RequestFailed.
+    def send(self, request_function, uri_path, data, pair=None, **request_options):
+        budget = self.budgets.get(uri_path, default_budget)
+        backoff_attempt = 0
+        for each_attempt in range(budget + 1):
+            the_response = request_function(uri_path, data, pair=pair, **request_options)
+            the_kind, the_errors, the_json = classify(the_response)
+            if the_kind is None:
+                return the_json.get('result')
+            if the_kind in ('permanent', 'cancel_only') or each_attempt == budget or \
+                    (uri_path in placement_endpoints and the_kind in unsure_kinds):
+                raise RequestFailed(uri_path, the_kind, the_errors)
+            metrics.record_retry(uri_path, the_kind)
+            # Trading calls without a pair ( cancels ) have no counter the limiter could wait on, so they back off instead
+            limited = the_kind in ('rate_limit', 'lockout') and (pair is not None or api_costs.get(uri_path, 1) != 0)
+            if limited:
+                print(f"{uri_path}: {', '.join(the_errors)}, waiting for the rate limiter")
+                self.limiter.mark_full(uri_path, pair)
+            if the_kind == 'lockout':
+                time.sleep(self.max_delay)
+            elif the_kind != 'nonce' and not limited:
+                the_delay = backoff_delay(backoff_attempt, self.base_delay, self.max_delay)
+                backoff_attempt += 1
+                print(f"{uri_path}: {', '.join(the_errors)}, trying again in {the_delay:.2f} seconds")
+                time.sleep(the_delay)
+
+
+# The policy every private call that should be retried goes through
+retry_policy = RetryPolicy()
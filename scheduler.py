@@ -0,0 +1,133 @@
+# Runs any amount of repeating jobs with a fixed amount of threads.
+#
+# Before this, every schedule got its own thread that slept for its interval, so 500 schedules meant 500 threads.
+# Here every job waits in a heap ordered by when it should run next. One timer thread sleeps until the
+# earliest one is due and hands it to a small pool of worker threads, so the thread count stays the same
+# no matter how many jobs there are.
+#
+# A job is any object plus a run_step function. run_step(job) does one step and returns how many seconds
+# until the next step, or None once the job is done.
+import heapq
+import itertools
+import queue
+import threading
+import time
+
+
+class Scheduler:
+    def __init__(self, run_step, workers=4, name="scheduler"):
+        self.run_step = run_step
+        self.name = name
+        # (run_at, sequence, key, token). sequence keeps the heap from ever comparing keys.
+        self.heap = []
+        self.sequence = itertools.count()
+        # key -> {'job': .., 'token': .., 'paused': ..}
+        # A heap entry only counts if its token matches, which is how pausing / cancelling / rescheduling
+        # gets rid of entries that are already in the heap without having to search it.
+        self.jobs = {}
+        self.condition = threading.Condition()
+        self.ready = queue.Queue()
+        self.killed = False
+        self.threads = [threading.Thread(target=self.timer_loop, name=f"{name}_timer", daemon=True)]
+        self.threads += [threading.Thread(target=self.worker_loop, name=f"{name}_worker", daemon=True)
+                         for _ in range(workers)]
+        for each_thread in self.threads:
+            each_thread.start()
+
+    # Must be called with self.condition held
+    def push(self, key, delay):
+        the_entry = self.jobs[key]
+        the_entry['token'] += 1
+        heapq.heappush(self.heap, (time.monotonic() + delay, next(self.sequence), key, the_entry['token']))
+        self.condition.notify()
+
+    def add(self, key, the_job, delay=0):
+        with self.condition:
+            self.jobs[key] = {'job': the_job, 'token': 0, 'paused': False, 'running': False, 'run_again': None}
+            self.push(key, delay)
+
+    def pause(self, key):
+        with self.condition:
+            if key in self.jobs:
+                self.jobs[key]['paused'] = True
+                # Throws away the entry that's in the heap
+                self.jobs[key]['token'] += 1
+
+    def resume(self, key, delay=0):
+        with self.condition:
+            if key in self.jobs and self.jobs[key]['paused']:
+                self.jobs[key]['paused'] = False
+                # If it's in the middle of a step, it gets rescheduled when that step finishes
+                if not self.jobs[key]['running']:
+                    self.push(key, delay)
+
+    def cancel(self, key):
+        with self.condition:
+            self.jobs.pop(key, None)
+
+    # Runs the job's next step now ( or in delay seconds ) instead of waiting for its timer
+    def run_now(self, key, delay=0):
+        with self.condition:
+            the_entry = self.jobs.get(key)
+            if the_entry is None or the_entry['paused']:
+                return
+            if the_entry['running']:
+                # The step that's running might have started too early for whatever this is for, so there's another
+                the_entry['run_again'] = delay
+            else:
+                self.push(key, delay)
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def timer_loop(self):
+        with self.condition:
+            while not self.killed:
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                run_at, _, key, token = self.heap[0]
+                wait_time = run_at - time.monotonic()
+                if wait_time > 0:
+                    self.condition.wait(wait_time)
+                    continue
+                heapq.heappop(self.heap)
+                the_entry = self.jobs.get(key)
+                if the_entry is None or the_entry['token'] != token or the_entry['paused']:
+                    continue
+                the_entry['running'] = True
+                self.ready.put(key)
+
+    def worker_loop(self):
+        while True:
+            key = self.ready.get()
+            if key is None:
+                break
+            with self.condition:
+                the_entry = self.jobs.get(key)
+            if the_entry is None:
+                continue
+            try:
+                next_delay = self.run_step(the_entry['job'])
+            # One broken job shouldn't take a worker thread down with it
+            except Exception as e:
+                print(f"{self.name}: step for {key} failed: {str(e)}")
+                next_delay = None
+            with self.condition:
+                the_entry['running'] = False
+                if self.jobs.get(key) is not the_entry:
+                    continue
+                if next_delay is None:
+                    del self.jobs[key]
+                elif not the_entry['paused']:
+                    if the_entry['run_again'] is not None:
+                        next_delay = min(next_delay, the_entry['run_again'])
+                        the_entry['run_again'] = None
+                    self.push(key, next_delay)
+
+    def stop(self):
+        with self.condition:
+            self.killed = True
+            self.condition.notify_all()
+        for _ in self.threads[1:]:
+            self.ready.put(None)
@@ -3,288 +3,26 @@
 # - You can't add funds via this program
 # - Keyboard shortcuts outside of tab don't exist,
 #   ( and even then tab doesn't work for File / Settings / Help )
-# - The account_limits / rate_limits aren't currently used
 # - Right-click menus don't exist
 #
 # If for whatever reason something doesn't work with the API,
 # https://docs.kraken.com/rest/#section/Changelog and https://status.kraken.com/
 # should be referenced to see if anything has changed or is broken.
-import base64
 import decimal
-import hashlib
-import hmac
 import queue
 import sys
-import threading
 import time
-import urllib.parse
-from tkinter import ttk, Tk, S, W, DoubleVar, StringVar, IntVar, Listbox, ACTIVE, E, Radiobutton, END, N
+from tkinter import ttk, Tk, S, W, DoubleVar, StringVar, IntVar, E, Radiobutton, N
 from tkinter import messagebox, Menu, Button, Toplevel, TclError, Entry
 from tkinter.ttk import Combobox
-from tkinter.messagebox import askokcancel, WARNING, showinfo
-import requests
-from config import api_key_b, api_secret_b, api_url, verify_closing
-
-api_key = base64.b64decode(api_key_b.encode()).decode()
-api_secret = base64.b64decode(api_secret_b.encode()).decode()
-
-# https://support.kraken.com/hc/en-us/articles/205893708-Minimum-order-size-volume-for-trading
-# Last pulled 2023-02-02
-# ---
-# To turn each string value to float or int, the following is how to do that:
-# minimum_order_sizes is a in this: .. [float(a[x]) if str(float(a[x])) == a[x] else int(a[x]) for x in a]
-# ---
-# These are the minimum order sizes for the "base currency". The "base currency" is the left currency in each pair.
-# If the order is smaller than this, there'll be a volume error.
-minimum_order_sizes = {'1INCH': 10, 'AAVE': 0.15, 'ACA': 50, 'ACH': 500, 'ADA': 15, 'ADX': 40, 'AGLD': 20, 'AIR': 700,
-                       'AKT': 20, 'ALCX': 0.3, 'ALGO': 20, 'ALICE': 5, 'ALPHA': 50, 'ANKR': 200, 'ANT': 2.5, 'APE': 2,
-                       'API3': 3.5, 'APT': 1.25, 'ARPA': 200, 'ASTR': 125, 'ATLAS': 2000, 'ATOM': 0.5, 'AUDIO': 30,
-                       'AVAX': 0.4, 'AXS': 0.65, 'BADGER': 2, 'BAL': 1, 'BAND': 3, 'BAT': 20, 'BCH': 0.05, 'BICO': 17.5,
-                       'BIT': 17.5, 'BLZ': 85, 'BNC': 50, 'BNT': 15, 'BOBA': 25, 'BOND': 1.5, 'BSX': 60000,
-                       'BTC': 0.0001, 'BTT': 7500000, 'C98': 20, 'CELR': 500, 'CFG': 25, 'CHR': 40, 'CHZ': 25,
-                       'COMP': 0.2, 'COTI': 65, 'CQT': 50, 'CRV': 10, 'CSM': 1250, 'CTSI': 50, 'CVC': 50, 'CVX': 1.2,
-                       'DAI': 5, 'DASH': 0.13, 'DENT': 7000, 'DOGE': 60, 'DOT': 1, 'DYDX': 2.5, 'EGLD': 0.15, 'ENJ': 15,
-                       'ENS': 0.4, 'EOS': 5, 'ETC': 0.25, 'ETH': 0.01, 'ETH2.S': 0.001, 'ETHW': 1.5, 'EUL': 1,
-                       'EWT': 1.25, 'FARM': 0.15, 'FET': 75, 'FIDA': 10, 'FIL': 1.25, 'FIS': 15, 'FLOW': 5, 'FLR': 5,
-                       'FORTH': 1.5, 'FTM': 25, 'FXS': 1, 'GAL': 2.5, 'GALA': 200, 'GARI': 150, 'GHST': 5, 'GLMR': 15,
-                       'GMT': 12.5, 'GNO': 0.06, 'GRT': 80, 'GST': 200, 'GTC': 3, 'HDX': 10, 'HFT': 8.5, 'ICP': 1.5,
-                       'ICX': 30, 'IDEX': 100, 'IMX': 12, 'INJ': 3, 'INTR': 250, 'JASMY': 1250, 'JUNO': 2.5,
-                       'KAR': 22.5, 'KAVA': 5, 'KEEP': 75, 'KEY': 1500, 'KILT': 12, 'KIN': 500000, 'KINT': 6.5,
-                       'KNC': 10, 'KP3R': 0.065, 'KSM': 0.2, 'LCX': 125, 'LDO': 5, 'LINK': 0.8, 'LPT': 0.65, 'LRC': 20,
-                       'LSK': 7.5, 'LTC': 0.06, 'LUNA': 30000, 'LUNA2': 3, 'MANA': 12.5, 'MASK': 2, 'MATIC': 6,
-                       'MC': 12, 'MINA': 10, 'MIR': 35, 'MKR': 0.0075, 'MLN': 0.25, 'MNGO': 250, 'MOVR': 0.65,
-                       'MSOL': 0.35, 'MULTI': 1.5, 'MV': 25, 'MXC': 150, 'NANO': 8, 'NEAR': 3, 'NMR': 0.5, 'NODL': 2000,
-                       'NYM': 25, 'OCEAN': 35, 'OGN': 50, 'OMG': 5, 'ORCA': 10, 'OXT': 75, 'OXY': 600, 'PARA': 350,
-                       'PAXG': 0.003, 'PERP': 12.5, 'PHA': 35, 'PLA': 25, 'POLIS': 30, 'POLS': 15, 'POND': 600,
-                       'POWR': 30, 'PSTAKE': 65, 'QNT': 0.05, 'QTUM': 2.5, 'RAD': 3, 'RARE': 35, 'RARI': 2, 'RAY': 25,
-                       'RBC': 150, 'REN': 60, 'REP': 1.5, 'REPV2': 1, 'REQ': 50, 'RLC': 6.5, 'RNDR': 10, 'ROOK': 0.35,
-                       'RPL': 0.25, 'RUNE': 5, 'SAMO': 2000, 'SAND': 8.5, 'SBR': 5000, 'SC': 2000, 'SCRT': 10,
-                       'SDN': 17.5, 'SGB': 400, 'SHIB': 500000, 'SNX': 3, 'SOL': 0.35, 'SPELL': 7500, 'SRM': 20,
-                       'STEP': 500, 'STG': 12, 'STORJ': 15, 'STX': 20, 'SUPER': 50, 'SUSHI': 5, 'SYN': 8, 'T': 250,
-                       'TBTC': 0.0001, 'TEER': 15, 'TLM': 350, 'TOKE': 5, 'TRIBE': 25, 'TRU': 100, 'TRX': 100,
-                       'TVK': 175, 'UMA': 3, 'UNFI': 1.5, 'UNI': 1, 'USDC': 5, 'USDT': 5, 'UST': 250, 'WAVES': 2.5,
-                       'WAXL': 5, 'WBTC': 0.0001, 'WOO': 50, 'XCN': 100, 'XLM': 60, 'XMR': 0.05, 'XRP': 12.5, 'XRT': 2,
-                       'XTZ': 5, 'YFI': 0.002, 'YGG': 25, 'ZEC': 0.15, 'ZRX': 25,
-                       # These additional ones were provided from the following URL:
-                       # https://support.kraken.com/hc/en-us/articles/360001185506-How-to-interpret-asset-codes
-                       'ETH2': 0.001, 'WAVE': 2.5, 'XETC': 0.25, 'XETH': 0.01, 'XLTC': 0.06, 'XMLN': 0.25, 'XREP': 1.5,
-                       'XREPV2': 1, 'XXBT': 0.0001, 'XXDG': 60, 'XXLM': 60, 'XXMR': 0.05, 'xxrp': 12.5, 'XXTZ': 5,
-                       'XZEC': 0.15, 'ZAUD': 10, 'ZEUR': 5, 'ZUSD': 5}
-# Total credits to specific account types and the amount that those credits come back every second
-# TODO - Not used
-account_limits = {'starter': {'amount': 60, 'decay': 1},
-                  'intermediate': {'amount': 125, 'decay': 2.34},
-                  'pro': {'amount': 180, 'decay': 3.75}}
-# Edit / Cancel are not 5/10/15/etc. seconds
-# They're all less than the specified amount, other than 301 which is greater-than 300
-# These rate-limits are also not expecting you to use anything else to interact with the API
-# ---
-# https://support.kraken.com/hc/en-us/articles/360045239571 for trading rate-limits
-# TODO - Setup these other rate limits too
-# https://support.kraken.com/hc/en-us/articles/206548367 for all rate-limits
-# TODO - Not used
-rate_limits = {'place_order': 1,
-               'edit': {5: 6, 10: 5, 15: 4, 45: 3, 90: 2, 300: 0, 301: 0},
-               'cancel': {5: 8, 10: 6, 15: 5, 45: 4, 90: 2, 300: 1, 301: 0}}
-
-
-# Taken from https://docs.kraken.com/rest/#section/Authentication/Headers-and-Signature
-def get_kraken_signature(urlpath, data, secret):
-    post_data = urllib.parse.urlencode(data)
-    encoded = (str(data['nonce']) + post_data).encode()
-    message = urlpath.encode() + hashlib.sha256(encoded).digest()
-    mac = hmac.new(base64.b64decode(secret), message, hashlib.sha512)
-    sig_digest = base64.b64encode(mac.digest())
-    return sig_digest.decode()
-
-
-# Attaches auth headers and returns results of a POST request
-def kraken_request(uri_path, data):
-    headers = {'API-Key': api_key, 'API-Sign': get_kraken_signature(uri_path, data, api_secret)}
-    try:
-        req = requests.post((api_url + uri_path), headers=headers, data=data)
-    except requests.exceptions.ConnectionError:
-        return None
-    else:
-        return req
-
-
-# https://docs.kraken.com/rest/#tag/Market-Data/operation/getTickerInformation
-# This gets volume as well as ask/bid
-# Is retrieved at the beginning of program start and every 6~ seconds afterwards
-def get_24_hour_volume():
-    global ticker_information
-    while not last_updates['kill']:
-        try:
-            all_ticker_pairs = requests.get('https://api.kraken.com/0/public/Ticker').json()['result']
-        # TODO - "Exception" is too broad
-        except Exception as e:
-            if ticker_information['error'] is None:
-                ticker_information['error'] = True
-                time.sleep(1)
-            else:
-                time.sleep(6)
-        else:
-            for each_pair in all_ticker_pairs:
-                ticker_information[each_pair] = all_ticker_pairs[each_pair]
-            ticker_information['error'] = False
-            time.sleep(6)
-
-
-# This gets all available pairs, and is only retrieved once -- at the start of the program.
-def check_available_pairs():
-    global available_pairs
-    while not last_updates['kill']:
-        try:
-            the_pairs = requests.get('https://api.kraken.com/0/public/AssetPairs').json()['result']
-        # TODO - "Exception" is too broad
-        except Exception as e:
-            time.sleep(5)
-        else:
-            break
-    available_pairs = the_pairs
-
-
-# https://docs.kraken.com/rest/#tag/User-Trading/operation/addOrder
-# Used to generate buy or sell orders
-def generate_order(order_direction: str, volume: str, pair: str, price: str):
-    global current_order
-    global open_orders
-    global last_updates
-    # Loop the order until it succeeds. This gets around invalid nonces
-    while True:
-        order_request = kraken_request("/0/private/AddOrder",
-                                       # time.time() is a float by default.
-                                       # This removes the decimals with int(),
-                                       # and then turns it into a string, which is what's expected by the API.
-                                       {"nonce": str(int(time.time()) * 1000),
-                                        'ordertype': "limit",
-                                        'type': order_direction,
-                                        'price': str(price),
-                                        'volume': volume,
-                                        'pair': pair})
-        if order_request.status_code == 200:
-            if not order_request.json()['error']:
-                print(f'Order request: {order_request.json()}')
-                break
-            else:
-                print("There was an issue in the order:")
-                print(f"Order json: {order_request.json()}")
-                print(f"Order status code: {order_request.status_code}")
-                print("Trying again in 5 seconds")
-                time.sleep(5)
-        else:
-            print("There was an issue in the order:")
-            print(f"Order json: {order_request.json()}")
-            print(f"Order status code: {order_request.status_code}")
-            print("Trying again in 5 seconds")
-            time.sleep(5)
-    if order_request.status_code == 200:
-        if not order_request.json()['error']:
-            json_result_order = order_request.json()['result']
-            the_txid = json_result_order['txid'][0]
-            open_orders[the_txid] = 'No information available yet'
-            # TODO - Don't do this on the main thread
-            all_current_orders.insert(0, json_result_order['txid'][0])
-            # TODO - store order information better
-            # Force an update for orders
-            last_updates['order'] = 0
-            current_order = None
-
-
-# https://docs.kraken.com/rest/#tag/User-Trading/operation/cancelOrder
-# Used to close orders
-# Is used when "cancel order" is pressed after selecting an order on the main screen
-def close_this_order(txid):
-    try:
-        cancel_request = kraken_request("/0/private/CancelOrder",
-                                        {"nonce": str(int(time.time()) * 1000),
-                                         'txid': txid})
-    except Exception as e:
-        if str(e) != 'EOrder:Unknown order':
-            print(f"Issue cancelling order, will not retry. Here's your error: {str(e)}")
-        else:
-            print("This order can't be cancelled as it's already completed.")
-    else:
-        if cancel_request is not None:
-            if cancel_request.status_code == 200:
-                if not cancel_request.json()['error']:
-                    json_result_cancel = cancel_request.json()['result']
-                    if not cancel_request.json()['error']:
-                        # TODO - Don't do this on the main thread
-                        all_current_orders.delete(ACTIVE)
-                        print(f"Cancelled order: {json_result_cancel}")
-                    else:
-                        print(f"Issue cancelling order, will not retry. Here's your error: {cancel_request.json()}")
-                else:
-                    print(f"Issue cancelling order, will not retry. Here's your error: {cancel_request.json()}")
-            else:
-                print(f"Issue cancelling order, will not retry. Status code was {cancel_request.status_code} for some reason.")
-        else:
-            print("Connection issue. Will not retry cancelling this order.")
-
-
-# Get account balance
-# Is retrieved at the beginning of program start and every 34~ seconds afterwards
-def get_account_balance():
-    global current_balance
-    while not last_updates['kill']:
-        if last_updates['balance'] == 0:
-            last_updates['balance'] = (int(time.time()) - 35)
-            time.sleep(1)
-        time_since_last = (int(time.time()) - last_updates['balance'])
-        if time_since_last >= 34:
-            resp = kraken_request("/0/private/Balance",
-                                  {"nonce": str(int(time.time()) * 1000)})
-            if resp is not None:
-                if resp.status_code == 200:
-                    if not resp.json()['error']:
-                        new_current_balance = {'error': False}
-                        json_result = resp.json()['result']
-                        for each_item in json_result:
-                            if decimal.Decimal(json_result[each_item]) != 0:
-                                new_current_balance[each_item] = json_result[each_item]
-                        current_balance = new_current_balance
-                    else:
-                        current_balance['error'] = True
-                else:
-                    current_balance['error'] = True
-            else:
-                current_balance['error'] = True
-            last_updates['balance'] = int(time.time())
-        time.sleep(1)
-
-
-# https://docs.kraken.com/rest/#tag/User-Data/operation/getOpenOrders
-# Get new orders
-# Is retrieved at the beginning of program start and every 15~ seconds afterwards
-def get_open_orders():
-    global open_orders
-    global all_current_orders
-    global current_order
-    while not last_updates['kill']:
-        if last_updates['order'] == 0:
-            last_updates['order'] = (int(time.time()) - 3)
-        time_since_last = (int(time.time()) - last_updates['order'])
-        if time_since_last >= 5:
-            resp = kraken_request("/0/private/OpenOrders",
-                                  {"nonce": str(int(time.time() * 1000)), "trades": "true"})
-            if resp is not None:
-                if resp.status_code == 200:
-                    if not resp.json()['error']:
-                        new_open_orders = {'error': False}
-                        json_result_open = resp.json()['result']["open"]
-                        for the_index, each_open_order in enumerate(json_result_open):
-                            new_open_orders[each_open_order] = json_result_open[each_open_order]
-                        open_orders = new_open_orders
-                    else:
-                        open_orders['error'] = True
-                else:
-                    open_orders['error'] = True
-            else:
-                open_orders['error'] = True
-            last_updates['order'] = int(time.time())
-        time.sleep(1)
+from tkinter.messagebox import askokcancel, WARNING, showinfo, showerror
+from config import verify_closing
+from rate_limiter import limiter
+import kraken_api
+import engine
+from event_bus import bus
+from order_table import OrderTable
+from engine import calculate_order_sizes, check_existence_of_all_vars
 
 
 # Is used in the order double-check screen
@@ -295,99 +33,18 @@ def check_order_direction():
         return 'sell'
 
 
-def check_existence_of_all_vars(the_pair, limit_price, the_total_amount,
-                                the_interval, trade_type, the_trade_size_percent):
-    not_found = []
-    # trade_type is either fixed/volume and can't be blank
-    # if not the_trade_type:
-    # order_direction is either buy/sell and also can't be blank
-    # if not order_direction
-    if not the_pair:
-        not_found.append('coin pair symbol')
-    if not limit_price:
-        not_found.append('limit price')
-    if not the_total_amount:
-        not_found.append('total amount')
-    if not the_interval:
-        not_found.append('second inbetween trades')
-    if not the_trade_size_percent:
-        if trade_type == 'fixed':
-            not_found.append('order size')
-        elif trade_type == 'volume':
-            not_found.append('volume percent')
-    if len(not_found) >= 3:
-        not_found[-1] = f'and {not_found[-1]}'
-    return not_found
-
-
 def find_minimum_order_size():
-    the_coin_pair = pair_symbol_variable.get()
-    if the_coin_pair:
-        for each_coin in minimum_order_sizes:
-            if the_coin_pair.startswith(each_coin):
-                return minimum_order_sizes[each_coin], each_coin
-    return None, None
-
-
-def calculate_order_sizes(trade_type, total_amount_var, trade_size_percent_var):
-    if trade_type == 'fixed':
-        how_many_each_order = decimal.Decimal(total_amount_var) / decimal.Decimal(trade_size_percent_var)
-        return str(how_many_each_order)
-    elif trade_type == 'volume':
-        how_many_each_order = decimal.Decimal(total_amount_var) * decimal.Decimal(trade_size_percent_var)
-        return str(how_many_each_order)
-
-
-def process_order():
-    global this_bot
-    global current_order
-    global last_updates
-    interval = int(this_bot["interval"])
-    limit_price = this_bot["limit_price"]
-    order_direction = this_bot['direction']
-    the_price = get_current_ask_and_buy()
-    while not last_updates['kill']:
-        # Is there currently an order being done?
-        if current_order is None:
-            # How many orders are left?
-            if this_bot["total_orders"] >= 1:
-                # If total orders are at least 1, there's no current orders, and get_current_ask_and_buy() is good,
-                # ORDER. Otherwise, sleep for interval
-                if the_price >= limit_price:
-                    # How much is this order for?
-                    the_order_size = this_bot["order_sizes"]
-                    pair = this_bot["pair"]
-                    if this_bot["total_orders"] != 0:
-                        this_bot["total_orders"] -= 1
-                        generate_order(order_direction, the_order_size, pair, str(the_price))
-                    time.sleep(interval)
-                else:
-                    time.sleep(interval)
-            else:
-                time.sleep(interval)
-        else:
-            time.sleep(interval)
+    return engine.find_minimum_order_size(pair_symbol_variable.get())
 
 
 def get_current_ask_and_buy():
-    order_direction = check_order_direction()
-    limit_price = decimal.Decimal(limit_price_variable.get())
-    current_ask = decimal.Decimal(ticker_information[pair_symbol_variable.get()]['a'][1])
-    current_bid = decimal.Decimal(ticker_information[pair_symbol_variable.get()]['b'][1])
-    if order_direction == 'sell':
-        order_sell = decimal.Decimal(current_ask) * decimal.Decimal(0.999)
-        the_price = max([limit_price, order_sell])
-        return the_price
-    else:
-        order_buy = decimal.Decimal(current_bid) * decimal.Decimal(0.999)
-        the_price = min([limit_price, order_buy])
-        return the_price
+    return engine.get_current_ask_and_buy(pair_symbol_variable.get(), check_order_direction(),
+                                          limit_price_variable.get())
 
 
 # Order double-check screen. Presents user with all the information for a just-in-case.
 def submit_order_double_check(the_new_order_box):
     global order_wait_time
-    global this_bot
     the_trade_type = None
     the_pair = pair_symbol_variable.get()
     order_direction = check_order_direction()
@@ -404,8 +61,8 @@ def submit_order_double_check(the_new_order_box):
             double_check_message = f"You're trying to submit an order with the following info:\n\nOrder direction: {order_direction}\nPair: {the_pair}\nLimit price: {limit_price}\nSell price:{the_price}\nTotal amount: {the_total_amount}\nInterval: {the_interval}\nTrade type: {the_trade_type}\nTotal orders: {the_trade_size_percent}\nOrder sizes: {order_sizes}",
         else:
             double_check_message = f"You're trying to submit an order with the following info:\n\nOrder direction: {order_direction}\nPair: {the_pair}\nLimit price: {limit_price}\nBuy price:{the_price}\nTotal amount: {the_total_amount}\nInterval: {the_interval}\nTrade type: {the_trade_type}\nTotal orders: {the_trade_size_percent}\nOrder sizes: {order_sizes}",
-    # else, which can only be 1
-    else:
+    # volume - 1
+    elif trade_or_volume_fixed_checkbox_var.get() == 1:
         the_trade_type = 'volume'
         order_sizes = calculate_order_sizes(the_trade_type, the_total_amount, the_trade_size_percent)
         # TODO - Verify these
@@ -413,7 +70,11 @@ def submit_order_double_check(the_new_order_box):
             double_check_message = f"You're trying to submit an order with the following info:\n\nOrder direction: {order_direction}\nPair: {the_pair}\nLimit price: {limit_price}\nSell price:{the_price}\nTotal amount: {the_total_amount}\nInterval: {the_interval}\nTrade type: {the_trade_type}\nTrade size percent: {the_trade_size_percent}\nOrder sizes: {order_sizes}",
         else:
             double_check_message = f"You're trying to submit an order with the following info:\n\nOrder direction: {order_direction}\nPair: {the_pair}\nLimit price: {limit_price}\nBuy price:{the_price}\nTotal amount: {the_total_amount}\nInterval: {the_interval}\nTrade type: {the_trade_type}\nTrade size percent: {the_trade_size_percent}\nOrder sizes: {order_sizes}",
-    if the_trade_type in ['fixed', 'volume']:
+    # pov - 2, order sizes come from the trades while it runs
+    else:
+        the_trade_type = 'pov'
+        double_check_message = f"You're trying to submit an order with the following info:\n\nOrder direction: {order_direction}\nPair: {the_pair}\nLimit price: {limit_price}\n{order_direction.capitalize()} price:{the_price}\nTotal amount: {the_total_amount}\nInterval: {the_interval}\nTrade type: {the_trade_type}\nShare of volume: {the_trade_size_percent}\nOrder sizes: sized from live trades",
+    if the_trade_type in ['fixed', 'volume', 'pov']:
         these_werent_found = check_existence_of_all_vars(the_pair, limit_price, the_total_amount,
                                                          the_interval, the_trade_type, the_trade_size_percent)
         if not these_werent_found:
@@ -423,22 +84,20 @@ def submit_order_double_check(the_new_order_box):
                                                      message=double_check_message,
                                                      icon=WARNING)
                 if submitted_verification:
-                    current_time_string = str(current_time)
-                    these_orders = {'total_orders': int(the_trade_size_percent),
-                                    'order_sizes': order_sizes,
-                                    'pair': the_pair,
-                                    'limit_price': limit_price,
-                                    'interval': the_interval,
-                                    'direction': order_direction,
-                                    'orders': {},
-                                    'status': 'not_started'}
-                    this_bot = these_orders
-                    if int(the_trade_size_percent) >= 2:
+                    try:
+                        these_orders = engine.create_schedule(the_pair, order_direction, limit_price,
+                                                              the_total_amount, the_interval, the_trade_type,
+                                                              the_trade_size_percent)
+                    except ValueError as e:
+                        showerror(title="Order problem", message=str(e))
+                        the_new_order_box.lift()
+                        the_new_order_box.focus_set()
+                        return
+                    if these_orders['total_orders'] >= 2 or the_trade_type == 'pov':
                         showinfo(title="Orders processing", message="The orders are now being processed")
                     else:
                         showinfo(title="Order processing", message="The order is now being processed")
-                    process_order_thread = threading.Thread(target=process_order, name="process_order").start()
-                    q.put(process_order_thread)
+                    engine.start_schedule(these_orders)
                 else:
                     the_new_order_box.lift()
                     the_new_order_box.focus_set()
@@ -454,24 +113,36 @@ def submit_order_double_check(the_new_order_box):
             the_new_order_box.focus_set()
 
 
-# Get more information on the selected order on the main screen
+# Get more information on the order that was double-clicked on the main screen
 def get_more_info_selected(event):
-    the_txid = all_current_orders.get(all_current_orders.curselection()[0])
-    if the_txid not in open_orders:
+    the_txid = all_current_orders.txid_at(event.y)
+    if the_txid is None:
+        return
+    the_order = all_current_orders.order(the_txid)
+    if the_order is None:
         messagebox.showinfo("Info",
-                            "This is a new order and we haven't retrieved the info for it yet.\n\nThe wait time should be at most 15 seconds.")
+                            "This order isn't open anymore.")
     else:
-        messagebox.showinfo("Info", f"{open_orders[the_txid]}")
+        messagebox.showinfo("Info", f"Order: {the_txid}\nStatus: {the_order.status}\nPair: {the_order.pair}\n"
+                                    f"Side: {the_order.type} ( {the_order.ordertype} )\nPrice: {the_order.price}\n"
+                                    f"Volume: {the_order.vol}\nFilled: {the_order.vol_exec}\n"
+                                    f"Opened: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(the_order.opentm))}")
+
+
+# Called on the Tk thread by the event bus with {schedule id: message} for schedules that stopped
+# because Kraken turned their orders down
+def show_schedule_errors(the_errors):
+    for each_id in the_errors:
+        messagebox.showerror("Schedule stopped", the_errors[each_id])
 
 
 # If you press the "cancel order" button on the main screen, this is ran
+# Every selected order is cancelled in the background. They're taken off the list once the cancel goes through.
 def cancel_selected_order():
-    if all_current_orders.size() >= 1:
-        if all_current_orders.curselection():
-            the_index = all_current_orders.curselection()[0]
-            txid = all_current_orders.get(the_index)
-            cancel_this_txid = threading.Thread(target=close_this_order(txid), name="cancel_txid").start()
-            q.put(cancel_this_txid)
+    if len(all_current_orders) >= 1:
+        txids = all_current_orders.selected_txids()
+        if txids:
+            engine.cancel_orders(txids)
             # Focus the main window so an order doesn't get cancelled on accident
             main_window.focus_set()
         else:
@@ -481,23 +152,33 @@ def cancel_selected_order():
         main_window.focus_set()
 
 
+# File > Cancel all orders
+def cancel_all_orders():
+    if len(all_current_orders) >= 1:
+        if messagebox.askokcancel("Cancel all", "Would you like to cancel every open order?"):
+            engine.cancel_all_orders()
+    else:
+        messagebox.showinfo("Info", "You can't cancel something that doesn't exist.")
+    main_window.focus_set()
+
+
 # An X button was pressed, or you went to File > Exit
 def closing_verify():
     if verify_closing:
         if messagebox.askokcancel("Quit", "Would you like to quit?"):
             print("Killing threads, one moment..")
-            last_updates['kill'] = True
+            engine.stop()
             main_window.destroy()
     else:
         print("Killing threads, one moment..")
-        last_updates['kill'] = True
+        engine.stop()
         main_window.destroy()
 
 
 # You pressed X for the loading screen
 def closing_loading_screen():
     print("Killing threads, one moment..")
-    last_updates['kill'] = True
+    engine.stop()
     try:
         loading_screen.destroy()
         main_window.destroy()
@@ -509,7 +190,7 @@ def closing_loading_screen():
 # Help > How-to
 def how_do_i():
     messagebox.showinfo("How do I?",
-                        f'Create a new order:\nPress "Add New" and supply the information asked.\n\nGet information about an order:\nDouble-click the order in the list.\n\nCancel an order:\nSelect the order from the list and then press "Cancel" and confirm.')
+                        f'Create a new order:\nPress "Add New" and supply the information asked.\n\nGet information about an order:\nDouble-click the order in the list. Click a column heading to sort by it.\n\nCancel an order:\nSelect the order from the list and then press "Cancel" and confirm.')
 
 
 # You pressed cancel in the new order screen
@@ -536,6 +217,7 @@ def check_buy_sell_buttons(pair_symbol_dropdown):
 # If fixed is chosen, set "Order size" label.
 # - If volume is chosen, set "Volume percent" label.#
 #   If pair symbol from dropdown is ALSO chosen, do "Volume percent" + 24h volume from ticker_information
+# - If POV is chosen, set "Share of volume" label.
 def check_trade_type_buttons(fixed_or_volume, the_pair_symbol_variable):
     if fixed_or_volume.get() == 0:
         percent_label_variable.set("Order size:")
@@ -543,10 +225,12 @@ def check_trade_type_buttons(fixed_or_volume, the_pair_symbol_variable):
         if not the_pair_symbol_variable.get():
             percent_label_variable.set("Volume percent:")
         else:
-            the_24h_volume = ticker_information[the_pair_symbol_variable.get()]['v'][1]
+            the_24h_volume = kraken_api.snapshot('tickers')[the_pair_symbol_variable.get()].volume_24h
             volume_percent_string = f'{"Volume percent:":^22}'
-            the_24h_volume_string = f'24h v: {int(float(the_24h_volume))}'
+            the_24h_volume_string = f'24h v: {int(the_24h_volume)}'
             percent_label_variable.set(f"{volume_percent_string}\n{the_24h_volume_string:^22}")
+    elif fixed_or_volume.get() == 2:
+        percent_label_variable.set("Share of volume:")
     else:
         percent_label_variable.set("Trade type unselected:")
 
@@ -624,8 +308,8 @@ def limit_to_just_numbers_and_decimal(*args):
                             if the_minimum_order_size > each_per_order:
                                 minimum_amount_warning.set(
                                     f"Amount / order size won't meet\n  minimum required amount of {the_minimum_order_size}")
-                        # sell will be 1, but it's the only other option.
-                        else:
+                        # volume. POV order sizes aren't known until it's running
+                        elif trade_or_volume_fixed_checkbox_var.get() == 1:
                             each_per_order = the_total_amount * the_trade_size
                             if the_minimum_order_size > each_per_order:
                                 minimum_amount_warning.set(
@@ -697,12 +381,16 @@ def trade_size_percent_check(*args):
                     minimum_amount_warning.set(f"Amount * order size won't meet\nminimum required amount of {the_minimum_order_size}")
                 else:
                     minimum_amount_warning.set("")
+            # pov
+            elif trade_or_volume_fixed_checkbox_var.get() == 2:
+                percentage_math_variable.set('Each order is sized from live trades')
+                minimum_amount_warning.set("")
             # volume
             else:
                 if the_pair_symbol_variable and the_trade_size_percent:
                     try:
-                        the_24_hour_volume = ticker_information[the_pair_symbol_variable]['v'][1]
-                        volume_per_order = decimal.Decimal(the_trade_size_percent) * decimal.Decimal(the_24_hour_volume)
+                        the_24_hour_volume = kraken_api.snapshot('tickers')[the_pair_symbol_variable].volume_24h
+                        volume_per_order = decimal.Decimal(the_trade_size_percent) * the_24_hour_volume
                         percentage_math_variable.set(str(volume_per_order))
                         percentage_math_variable.set(f'Total amount each order: {str(volume_per_order)}')
                         if the_minimum_order_size > volume_per_order:
@@ -719,28 +407,24 @@ def trade_size_percent_check(*args):
 # When the pair symbol combobox "pair_symbol_dropdown" changes selection
 def pair_symbol_changed(*args):
     the_pair = pair_symbol_variable.get()
-    the_24h_volume = ticker_information[the_pair]['v'][1]
+    the_24h_volume = kraken_api.snapshot('tickers')[the_pair].volume_24h
     if trade_or_volume_fixed_checkbox_var.get() == 1:
         if not the_pair:
             percent_label_variable.set("Volume percent:")
         else:
             volume_percent_string = f'{"Volume percent:":^22}'
-            the_24h_volume_string = f'24h v: {int(float(the_24h_volume))}'
+            the_24h_volume_string = f'24h v: {int(the_24h_volume)}'
             percent_label_variable.set(f"{volume_percent_string}\n{the_24h_volume_string:^22}")
-    for each_asset in current_balance:
-        if each_asset != 'error':
-            # buy
-            if buy_or_sell_box_var.get() == 0:
-                if the_pair.endswith(each_asset):
-                    the_asset_amount = current_balance[each_asset]
-                    total_amount_variable.set(the_asset_amount)
-                    break
-            # sell
-            else:
-                if the_pair.startswith(each_asset):
-                    the_asset_amount = current_balance[each_asset]
-                    total_amount_variable.set(the_asset_amount)
-                    break
+    the_pair_info = kraken_api.pair_index.pair(the_pair)
+    if the_pair_info is not None:
+        # buy spends the quote currency, sell spends the base currency
+        if buy_or_sell_box_var.get() == 0:
+            the_asset = the_pair_info['quote']
+        else:
+            the_asset = the_pair_info['base']
+        the_balances = kraken_api.snapshot('balances')
+        if the_asset in the_balances:
+            total_amount_variable.set(str(the_balances[the_asset]))
 
 
 # THE new order screen. The entire thing.
@@ -815,13 +499,19 @@ def create_new_order():
                                         value=1,
                                         command=lambda: check_trade_type_buttons(trade_or_volume_fixed_checkbox_var,
                                                                                  pair_symbol_variable))
+
+    trade_type_pov_box = Radiobutton(new_order_box, text='POV', variable=trade_or_volume_fixed_checkbox_var,
+                                     value=2,
+                                     command=lambda: check_trade_type_buttons(trade_or_volume_fixed_checkbox_var,
+                                                                              pair_symbol_variable))
     trade_or_volume_fixed_checkbox_var.set(0)
 
-    # fixed / volume radio buttons
+    # fixed / POV / volume radio buttons
     trade_type_fixed_box.grid(row=6, column=1, sticky=W)
     trade_type_fixed_box.select()
 
     trade_type_volume_box.grid(row=6, column=1, sticky=E)
+    trade_type_pov_box.grid(row=6, column=1)
 
     # "Order size" / "Volume percent" / "Volume percent" with label
     trade_size_percent_label = ttk.Label(new_order_box, textvariable=percent_label_variable)
@@ -860,44 +550,44 @@ def edit_settings():
     pass
 
 
+# Settings > Rate limits
+# Shows how many rate-limit credits are currently used, and how much headroom is left
+def view_rate_limits():
+    the_usage = limiter.usage()
+    usage_message = f"Account type: {the_usage['account_type']}\n\nAPI counter: {the_usage['api']['count']} / {the_usage['api']['max']} ( {the_usage['api']['headroom']} left )"
+    for each_pair in the_usage['trading']:
+        the_pair_usage = the_usage['trading'][each_pair]
+        usage_message += f"\n{each_pair}: {the_pair_usage['count']} / {the_pair_usage['max']} ( {the_pair_usage['headroom']} left )"
+    messagebox.showinfo("Rate limits", usage_message)
+
+
 if __name__ == '__main__':
-    current_time = str(time.time())
     main_window = Tk()
     main_window.title("Kraken API - Main Screen")
     # For whatever reason, Windows makes the window far larger than it needs to be.
     # geometry is W-E x N-S
     if sys.platform.startswith('win32'):
-        main_window.geometry('235x224')
-        main_window.maxsize(235, 224)
-        main_window.minsize(235, 224)
+        main_window.geometry('540x290')
+        main_window.maxsize(540, 290)
+        main_window.minsize(540, 290)
     elif sys.platform.startswith('linux'):
-        main_window.geometry('328x250')
-        main_window.maxsize(328, 250)
-        main_window.minsize(328, 250)
+        main_window.geometry('600x320')
+        main_window.maxsize(600, 320)
+        main_window.minsize(600, 320)
     main_window.resizable(False, False)
     main_window.config(highlightthickness=0)
     main_window.protocol("WM_DELETE_WINDOW", closing_verify)
 
-    all_current_orders = Listbox(main_window, activestyle='none')
+    all_current_orders = OrderTable(main_window)
 
-    this_bot = {}
     # internet_available = None
-    open_orders = {'error': None}
     show_pairs = {'buy': [], 'sell': []}
-    current_balance = {'error': None}
-    last_updates = {'balance': 0, 'order': 0, 'kill': False}
-    available_pairs = {}
-    ticker_information = {'error': None}
+    bus.subscribe('orders', all_current_orders.apply_changes)
+    bus.subscribe('schedule_errors', show_schedule_errors)
 
     q = queue.Queue()
-    open_orders_thread = threading.Thread(target=get_open_orders, name="open_orders").start()
-    account_balance_thread = threading.Thread(target=get_account_balance, name="account_balance").start()
-    available_pairs_thread = threading.Thread(target=check_available_pairs, name="available_pairs").start()
-    ticker_thread = threading.Thread(target=get_24_hour_volume, name="ticker").start()
-    q.put(open_orders_thread)
-    q.put(account_balance_thread)
-    q.put(available_pairs_thread)
-    q.put(ticker_thread)
+    for each_update_thread in kraken_api.start_updates():
+        q.put(each_update_thread)
 
     percent_label_variable = StringVar()
     percent_label_variable.set("Order size:")
@@ -908,7 +598,6 @@ if __name__ == '__main__':
     minimum_amount_warning = StringVar()
     percentage_math_variable = StringVar()
     order_wait_time = 0
-    current_order = None
 
     # to buy or sell
     buy_or_sell_box_var = IntVar()
@@ -935,7 +624,8 @@ if __name__ == '__main__':
     loading_screen.maxsize(420, 350)
     loading_screen.minsize(420, 350)
 
-    # Show loading screen until we've gotten orders and current balance
+    # Show loading screen until we've gotten the current balance and the pairs.
+    # Open orders don't have to be there yet, they're added to the list as they come in.
     while True:
         try:
             main_window.update()
@@ -943,19 +633,16 @@ if __name__ == '__main__':
             loading_screen.focus_set()
         except TclError:
             pass
-        time.sleep(3)
-        if open_orders['error'] is not None and not open_orders['error']:
-            if current_balance['error'] is not None and not current_balance['error']:
-                if available_pairs:
-                    if ticker_information['error'] is not None:
-                        for each_available_pair in available_pairs:
-                            for each_balance in current_balance:
-                                if each_balance != 'error':
-                                    if each_available_pair.endswith(each_balance):
-                                        show_pairs['buy'].append(each_available_pair)
-                                    elif each_available_pair.startswith(each_balance):
-                                        show_pairs['sell'].append(each_available_pair)
-                        break
+        if kraken_api.wait_until_ready(('balances', 'pairs', 'tickers'), timeout=0.05):
+            for each_balance in kraken_api.snapshot('balances'):
+                if each_balance != 'error':
+                    show_pairs['buy'] += kraken_api.pair_index.buy_pairs(each_balance)
+                    show_pairs['sell'] += kraken_api.pair_index.sell_pairs(each_balance)
+            # Stream the pairs that can be picked in the new order screen
+            kraken_api.stream_pairs(show_pairs['buy'] + show_pairs['sell'])
+            # Schedules that were still going when the program last stopped
+            engine.resume_schedules()
+            break
     try:
         loading_screen.destroy()
         the_menu = Menu(main_window)
@@ -963,6 +650,7 @@ if __name__ == '__main__':
 
         file_menu = Menu(the_menu, tearoff=False)
         the_menu.add_cascade(label='File', menu=file_menu)
+        file_menu.add_command(label='Cancel all orders', command=cancel_all_orders)
         file_menu.add_command(label='Exit', command=closing_verify)
 
         settings_menu = Menu(the_menu, tearoff=False)
@@ -971,6 +659,7 @@ if __name__ == '__main__':
         settings_menu.add_command(label='View', command=view_current_settings)
         # TODO
         settings_menu.add_command(label='Edit', command=edit_settings)
+        settings_menu.add_command(label='Rate limits', command=view_rate_limits)
 
         help_menu = Menu(the_menu, tearoff=False)
         the_menu.add_cascade(label='Help', menu=help_menu)
@@ -979,8 +668,7 @@ if __name__ == '__main__':
         current_bots_text = ttk.Label(main_window, text="Current orders:")
         current_bots_text.grid(row=1, column=2, sticky=S)
 
-        all_current_orders.configure(width=21)
-        all_current_orders.bind('<Double-Button-1>', get_more_info_selected)
+        all_current_orders.bind_double_click(get_more_info_selected)
         all_current_orders.grid(row=2, column=2)
 
         add_new_button = Button(main_window, text="Add new\norder", command=create_new_order)
@@ -989,6 +677,8 @@ if __name__ == '__main__':
         cancel_selected = Button(main_window, text="Cancel\norder", command=cancel_selected_order)
         cancel_selected.grid(row=3, column=3, sticky=W)
 
+        # Changes from the background threads are applied from here on, on this thread
+        bus.attach(main_window)
         main_window.mainloop()
     except TclError as the_error:
         if 'application has been destroyed' in str(the_error):
@@ -999,5 +689,6 @@ if __name__ == '__main__':
             pass
         else:
             print(f'TclError: {str(the_error)}')
+    kraken_api.transport.close()
 else:
     sys.exit()
@@ -0,0 +1,57 @@
+# Tests run against the local stand-in in kraken_stub.py, never against api.kraken.com.
+#
+# Modules like kraken_api and engine start talking to Kraken as soon as they're imported, so tests that need them
+# take the stub fixture, which points everything at the stand-in first ( see benchmark.use_stub ).
+# Tests that don't need them should only import the module they test.
+import argparse
+import os
+import sys
+import time
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# The stand-in, with kraken_api started against it. One for the whole run, since kraken_api can only be imported once.
+@pytest.fixture(scope='session')
+def stub():
+    import benchmark
+    stub_server = benchmark.use_stub(argparse.Namespace(latency=0.0, rate_limit_every=0, fill_after=None,
+                                                        respect_limits=False))
+    import kraken_api
+    kraken_api.start_updates()
+    kraken_api.wait_until_ready()
+    yield stub_server.exchange
+    if 'engine' in sys.modules:
+        sys.modules['engine'].stop()
+    else:
+        kraken_api.stop_updates()
+    stub_server.shutdown()
+
+
+# The engine on the stand-in, with a journal of its own in tmp_path and none of the schedules other tests left behind
+@pytest.fixture
+def engine(stub, tmp_path, monkeypatch):
+    import engine
+    from journal import Journal
+    monkeypatch.setattr(engine, 'journal', Journal(str(tmp_path / 'before'), sync_interval=0))
+    monkeypatch.setattr(engine, 'schedules', {})
+    monkeypatch.setattr(engine, 'to_resume', [])
+    monkeypatch.setattr(engine, 'order_owners', {})
+    yield engine
+    for each_id in list(engine.schedules):
+        engine.scheduler.cancel(each_id)
+    engine.journal.stop()
+
+
+# wait_for(the_check) polls the_check until it's true, for things that happen on other threads.
+# Fails the test if that takes more than the_timeout seconds.
+@pytest.fixture
+def wait_for():
+    def polling(the_check, the_timeout=10):
+        give_up_at = time.monotonic() + the_timeout
+        while not the_check():
+            if time.monotonic() > give_up_at:
+                pytest.fail(f"Gave up waiting after {the_timeout} seconds")
+            time.sleep(0.02)
+    return polling
@@ -0,0 +1,114 @@
+import time
+import pytest
+
+
+# Counts the requests made to the_endpoint on the stand-in
+def count_calls(stub, monkeypatch, the_endpoint):
+    the_calls = []
+    the_handler = stub.endpoints[the_endpoint]
+
+    def counting(the_body):
+        the_calls.append(the_body)
+        return the_handler(the_body)
+
+    monkeypatch.setitem(stub.endpoints, the_endpoint, counting)
+    return the_calls
+
+
+def test_one_bad_order_only_fails_itself_when_the_batch_is_turned_down(stub, monkeypatch):
+    import kraken_api
+    from batcher import OrderBatcher, OrderError
+    batch_calls = count_calls(stub, monkeypatch, '/0/private/AddOrderBatch')
+    the_batcher = OrderBatcher(kraken_api.kraken_request, window=0.1)
+    orders_before = len(stub.orders)
+    # The stand-in's ordermin for XBT/USD is 0.0001
+    the_futures = [the_batcher.submit('sell', each_volume, 'XXBTZUSD', '1000000')
+                   for each_volume in ('0.001', '0.00001', '0.002')]
+    assert the_futures[0].result(10)
+    assert the_futures[2].result(10)
+    with pytest.raises(OrderError) as the_error:
+        the_futures[1].result(10)
+    assert the_error.value.kind == 'permanent'
+    # They went out together first, and the batch was turned down as a whole
+    assert len(batch_calls) == 1
+    assert len(stub.orders) - orders_before == 2
+    the_batcher.stop()
+
+
+def test_a_schedule_sharing_a_batch_with_a_bad_order_keeps_going(engine, monkeypatch, stub, wait_for):
+    batch_calls = count_calls(stub, monkeypatch, '/0/private/AddOrderBatch')
+    good = engine.create_schedule('XXBTZUSD', 'sell', '1', '0.002', 0.05, 'fixed', '2')
+    bad = engine.create_schedule('XXBTZUSD', 'sell', '1', '0.00002', 0.05, 'fixed', '2')
+    engine.start_schedule(good)
+    engine.start_schedule(bad)
+    wait_for(lambda: good['status'] == 'finished' and bad['status'] == 'failed')
+    assert batch_calls
+    assert good['orders_placed'] == 2
+    assert bad['orders_placed'] == 0
+
+
+def test_a_slow_pair_doesnt_hold_up_the_others(stub, monkeypatch):
+    import kraken_api
+    from batcher import OrderBatcher
+    the_handler = stub.endpoints['/0/private/AddOrder']
+    the_calls = []
+
+    # XBT/USD takes half a second to answer
+    def slow_for_xbt(the_body):
+        started_at = time.monotonic()
+        if the_body.get('pair') == 'XXBTZUSD':
+            time.sleep(0.5)
+        the_calls.append((the_body.get('pair'), started_at, time.monotonic()))
+        return the_handler(the_body)
+
+    monkeypatch.setitem(stub.endpoints, '/0/private/AddOrder', slow_for_xbt)
+    the_batcher = OrderBatcher(kraken_api.kraken_request, window=0.05)
+    first_xbt = the_batcher.submit('sell', '0.001', 'XXBTZUSD', '1000000')
+    time.sleep(0.2)
+    # Due while the first one is still out
+    second_xbt = the_batcher.submit('sell', '0.001', 'XXBTZUSD', '1000000')
+    the_eth = the_batcher.submit('sell', '0.1', 'XETHZUSD', '1000000')
+    assert the_eth.result(10)
+    assert not first_xbt.done()
+    assert first_xbt.result(10) and second_xbt.result(10)
+    the_batcher.stop()
+    xbt_calls = [each_call for each_call in the_calls if each_call[0] == 'XXBTZUSD']
+    # One send out at a time for a pair
+    assert xbt_calls[1][1] >= xbt_calls[0][2]
+
+
+def test_cancel_only_mode_isnt_looked_up_or_sent_again(stub, monkeypatch):
+    import kraken_api
+    from batcher import OrderBatcher, OrderError
+    monkeypatch.setitem(stub.endpoints, '/0/private/AddOrder', lambda the_body: 'EService:Market in cancel_only mode')
+    add_calls = count_calls(stub, monkeypatch, '/0/private/AddOrder')
+    lookups = count_calls(stub, monkeypatch, '/0/private/OpenOrders')
+    the_batcher = OrderBatcher(kraken_api.kraken_request, window=0.05)
+    with pytest.raises(OrderError) as the_error:
+        the_batcher.submit('sell', '0.001', 'XXBTZUSD', '1000000').result(10)
+    the_batcher.stop()
+    # Nothing was placed, so there's nothing to look for, and the schedule only tries again at its next step
+    assert the_error.value.kind == 'cancel_only'
+    assert len(add_calls) == 1
+    assert lookups == []
+
+
+@pytest.mark.parametrize('the_volumes', [('0.001',), ('0.001', '0.002', '0.001')])
+def test_orders_whose_answer_was_lost_are_found_and_not_placed_again(stub, monkeypatch, the_volumes):
+    import batcher
+    import kraken_api
+    monkeypatch.setattr(batcher, 'lookup_delay', 0.05)
+    the_endpoint = '/0/private/AddOrder' if len(the_volumes) == 1 else '/0/private/AddOrderBatch'
+    place_calls = count_calls(stub, monkeypatch, the_endpoint)
+    lookups = count_calls(stub, monkeypatch, '/0/private/OpenOrders')
+    the_batcher = batcher.OrderBatcher(kraken_api.kraken_request, window=0.1)
+    orders_before = set(stub.orders)
+    monkeypatch.setattr(stub, 'lose_answers', 1)
+    the_futures = [the_batcher.submit('sell', each_volume, 'XXBTZUSD', '1000000') for each_volume in the_volumes]
+    the_txids = [each_future.result(10) for each_future in the_futures]
+    the_batcher.stop()
+    # Placed once, looked up once, and every order got its own txid from the lookup
+    assert len(place_calls) == 1
+    assert len(lookups) == 1
+    assert sorted(the_txids) == sorted(set(stub.orders) - orders_before)
+    assert [stub.orders[each_txid]['vol'] for each_txid in the_txids] == list(the_volumes)
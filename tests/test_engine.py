@@ -0,0 +1,35 @@
+import json
+import pytest
+
+
+@pytest.mark.parametrize('the_interval', ['0', 0, -1, '-0.5', 'abc', '', None, float('nan'), float('inf')])
+def test_schedules_need_an_interval_of_more_than_0_seconds(engine, the_interval):
+    with pytest.raises(ValueError):
+        engine.create_schedule('XXBTZUSD', 'sell', '1', '0.003', the_interval, 'fixed', '3')
+
+
+def test_fractional_intervals_are_kept(engine):
+    schedule = engine.create_schedule('XXBTZUSD', 'sell', '1', '0.003', '0.5', 'fixed', '3')
+    assert schedule['interval'] == 0.5
+
+
+def test_schedules_file_skips_bad_intervals(engine, tmp_path):
+    the_schedule = {'pair': 'XXBTZUSD', 'direction': 'sell', 'limit_price': '1', 'total_amount': '0.003',
+                    'trade_type': 'fixed', 'trade_size': '3'}
+    the_path = tmp_path / 'schedules.json'
+    the_path.write_text(json.dumps([{**the_schedule, 'interval': each_interval} for each_interval in (0, -1, 'x', 2)]))
+    assert [each_schedule['interval'] for each_schedule in engine.load_schedules(str(the_path))] == [2.0]
+
+
+def test_schedules_file_skips_bad_trade_types_and_amounts(engine, tmp_path):
+    the_schedule = {'pair': 'XXBTZUSD', 'direction': 'sell', 'limit_price': '1', 'total_amount': '0.003',
+                    'interval': 2, 'trade_type': 'fixed', 'trade_size': '3'}
+    the_entries = [{**the_schedule, 'trade_type': 'twap'},
+                   {**the_schedule, 'limit_price': 'abc'},
+                   {**the_schedule, 'total_amount': 'lots'},
+                   {**the_schedule, 'trade_size': 'three'},
+                   {**the_schedule, 'trade_type': 'volume', 'trade_size': '0.001', 'total_amount': '0.003'},
+                   the_schedule]
+    the_path = tmp_path / 'schedules.json'
+    the_path.write_text(json.dumps(the_entries))
+    assert [each_schedule['trade_type'] for each_schedule in engine.load_schedules(str(the_path))] == ['volume', 'fixed']
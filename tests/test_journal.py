@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+from journal import Journal
+
+
+# A journal in tmp_path that writes straight away
+def new_journal(the_dir, snapshot_every=1000):
+    return Journal(str(the_dir), sync_interval=0, snapshot_every=snapshot_every)
+
+
+def test_a_half_written_last_line_is_left_out(tmp_path):
+    the_journal = new_journal(tmp_path)
+    the_journal.start()
+    for each_number in range(3):
+        assert the_journal.append({'n': each_number}).result(5)
+    the_journal.stop()
+    # The program died halfway through writing the next record
+    with open(the_journal.segment_path(0), 'a') as the_file:
+        the_file.write('{"n": 3, "ha')
+    the_journal = new_journal(tmp_path)
+    the_state, the_records = the_journal.load()
+    assert the_state is None
+    assert the_records == [{'n': 0}, {'n': 1}, {'n': 2}]
+    # Records after the restart go to a new segment, so they're never glued onto the broken line
+    the_journal.start()
+    assert the_journal.append({'n': 4}).result(5)
+    the_journal.stop()
+    assert new_journal(tmp_path).load()[1] == [{'n': 0}, {'n': 1}, {'n': 2}, {'n': 4}]
+
+
+def test_replay_across_snapshots_gives_back_every_record(tmp_path):
+    the_journal = new_journal(tmp_path, snapshot_every=4)
+    # The engine's side: what every record has added up to, changed under a lock the snapshot also takes
+    applied = []
+    the_lock = threading.Lock()
+
+    def journal_state():
+        with the_lock:
+            the_state = list(applied)
+            the_journal.rotate()
+        return the_state
+
+    the_journal.state_function = journal_state
+    the_journal.start()
+    for each_number in range(10):
+        with the_lock:
+            applied.append(each_number)
+            the_future = the_journal.append({'n': each_number})
+        assert the_future.result(5)
+    the_journal.stop()
+    with open(the_journal.snapshot_path()) as the_file:
+        the_snapshot = json.load(the_file)
+    # Segments the snapshot covers are deleted
+    assert all(int(each_name.split('.')[1]) >= the_snapshot['segment'] for each_name in the_journal.segment_names())
+    the_state, the_records = new_journal(tmp_path).load()
+    assert the_state + [each_record['n'] for each_record in the_records] == list(range(10))
+
+
+# Writes what the journal would have if the program died right after sending the first of a schedule's 3 orders,
+# and points the engine at it as if it was just started. Returns the schedule's id.
+def crash(engine, the_dir, monkeypatch):
+    schedule = engine.create_schedule('XXBTZUSD', 'sell', '1', '0.003', 0.05, 'fixed', '3')
+    engine.journal.stop()
+    schedule['status'] = 'running'
+    schedule['key'] = 'main'
+    the_records = [{'type': 'start', 'id': schedule['id'], 'time': 0, 'schedule': engine.schedule_to_json(schedule)},
+                   {'type': 'submit', 'id': schedule['id'], 'time': 0, 'seq': 1, 'volume': '0.001', 'price': '1',
+                    'pov_owed': '0'}]
+    os.makedirs(the_dir, exist_ok=True)
+    with open(os.path.join(the_dir, 'journal.0.log'), 'w') as the_file:
+        for each_record in the_records:
+            the_file.write(json.dumps(each_record) + '\n')
+    monkeypatch.setattr(engine, 'journal', Journal(str(the_dir), sync_interval=0))
+    return schedule['id']
+
+
+def test_resume_never_places_an_order_that_was_in_flight_again(engine, stub, tmp_path, monkeypatch, wait_for):
+    schedule_id = crash(engine, tmp_path / 'crashed', monkeypatch)
+    orders_before = len(stub.orders)
+    engine.open_journal()
+    schedule = engine.schedules[schedule_id]
+    # The order that was sent but never answered might have been placed, so it's counted as placed
+    assert schedule['orders_in_flight'] == 0
+    assert schedule['orders_placed'] == 1
+    assert schedule['total_orders'] == 2
+    assert engine.resume_schedules() == 1
+    wait_for(lambda: schedule['status'] == 'finished')
+    assert len(stub.orders) - orders_before == 2
+    assert schedule['orders_placed'] == 3
+    # Read back once more, the journal has the same schedule the engine ended up with
+    engine.journal.stop()
+    _, the_records = engine.journal.load()
+    restored = engine.schedule_from_json(the_records[0]['schedule'])
+    for each_record in the_records[1:]:
+        engine.apply_record(restored, each_record)
+    for each_field in ('status', 'orders_placed', 'orders_in_flight', 'total_orders', 'volume_placed'):
+        assert restored[each_field] == schedule[each_field]
@@ -0,0 +1,20 @@
+import base64
+import os
+from key_pool import ApiKey, KeyPool
+
+
+def new_key(the_name):
+    return ApiKey(the_name, f'{the_name}_key', base64.b64encode(os.urandom(64)).decode(), None, None, None)
+
+
+def test_a_key_with_a_name_thats_taken_is_left_out():
+    the_main = new_key('main')
+    the_sub = new_key('sub')
+    the_pool = KeyPool([the_main, new_key('main'), the_sub, new_key('sub'), new_key('other')],
+                       lambda uri_path, data, the_key=None: the_key)
+    assert [each_key.name for each_key in the_pool] == ['main', 'sub', 'other']
+    # The main key is still config.py's, and requests for a name go to the first key with it
+    assert the_pool.main is the_main
+    assert the_pool.get('main') is the_main
+    assert the_pool.get('sub') is the_sub
+    assert the_pool.get('sub').request('/0/private/Balance', {}) is the_sub
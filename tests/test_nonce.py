@@ -0,0 +1,46 @@
+import pytest
+import nonce
+from nonce import NonceGenerator
+
+
+# The clock stands still, so only the reservation can keep nonces going up across a restart
+@pytest.fixture
+def stopped_clock(monkeypatch):
+    monkeypatch.setattr(nonce.time, 'time_ns', lambda: 1700000000 * 10 ** 9)
+
+
+def test_a_restart_carries_on_past_the_last_nonce(tmp_path, stopped_clock):
+    the_path = str(tmp_path / 'nonce')
+    first = NonceGenerator(the_path)
+    the_nonces = [int(first.next()) for _ in range(100)]
+    assert the_nonces == sorted(set(the_nonces))
+    second = NonceGenerator(the_path)
+    assert int(second.next()) > the_nonces[-1]
+
+
+def test_nonces_keep_going_up_when_the_clock_goes_back(tmp_path, monkeypatch):
+    the_generator = NonceGenerator(str(tmp_path / 'nonce'))
+    before = int(the_generator.next())
+    monkeypatch.setattr(nonce.time, 'time_ns', lambda: 0)
+    assert int(the_generator.next()) == before + 1
+    assert int(NonceGenerator(str(tmp_path / 'nonce')).next()) > before + 1
+
+
+def test_a_missing_nonce_file_is_made_on_the_first_nonce(tmp_path, stopped_clock):
+    the_path = tmp_path / 'not_there_yet'
+    the_nonce = int(NonceGenerator(str(the_path)).next())
+    assert the_nonce == 1700000000 * 10 ** 6
+    assert int(the_path.read_text()) == the_nonce + nonce.reserve_seconds * 10 ** 6
+
+
+@pytest.mark.parametrize('the_contents', ['', '   \n', 'garbage', '17000000000000\x00\x00', '-', b'\xff\xfe'])
+def test_a_corrupt_nonce_file_starts_from_the_clock_and_is_written_again(tmp_path, stopped_clock, the_contents):
+    the_path = tmp_path / 'nonce'
+    if isinstance(the_contents, bytes):
+        the_path.write_bytes(the_contents)
+    else:
+        the_path.write_text(the_contents)
+    the_generator = NonceGenerator(str(the_path))
+    the_nonce = int(the_generator.next())
+    assert the_nonce == 1700000000 * 10 ** 6
+    assert int(the_path.read_text()) > the_nonce
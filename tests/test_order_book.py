@@ -0,0 +1,63 @@
+import pytest
+from kraken_stub import start_ws_stub
+from market_feed import MarketFeed
+from order_book import OrderBooks
+
+pytest.importorskip('websocket')
+
+
+@pytest.fixture
+def feed():
+    the_server = start_ws_stub(push_interval=0.02)
+    the_feed = MarketFeed({}, f'ws://127.0.0.1:{the_server.server_address[1]}')
+    the_subscriptions = []
+    send_subscription = the_feed.send_subscription
+
+    def recording(the_event, the_channel, ws_pair_names):
+        the_subscriptions.append((the_event, the_channel, ws_pair_names))
+        send_subscription(the_event, the_channel, ws_pair_names)
+
+    the_feed.send_subscription = recording
+    the_feed.subscriptions_sent = the_subscriptions
+    yield the_feed
+    the_feed.stop()
+    the_server.shutdown()
+
+
+def test_book_follows_the_updates_and_their_checksums(feed, wait_for):
+    the_books = OrderBooks(feed)
+    the_book = the_books.track('XXBTZUSD', 'XBT/USD')
+    wait_for(lambda: the_book.valid)
+    first_update = the_book.last_update
+    wait_for(lambda: the_book.last_update > first_update + 0.2)
+    # Every update's checksum matched, so the book was never subscribed to again
+    assert feed.subscriptions_sent == [('subscribe', 'book', ['XBT/USD'])]
+    assert the_books.fill_price('XXBTZUSD', 'buy', 0.1)['filled'] == pytest.approx(0.1)
+
+
+def test_checksum_mismatch_resubscribes_for_a_fresh_snapshot(feed, wait_for):
+    the_books = OrderBooks(feed)
+    the_book = the_books.track('XXBTZUSD', 'XBT/USD')
+    wait_for(lambda: the_book.valid)
+    # A level the stand-in doesn't have, at the top of the book, so the next update's checksum can't match
+    with the_book.lock:
+        the_book.levels['asks']['1.00000'] = '999.00000000'
+    wait_for(lambda: len(feed.subscriptions_sent) == 3)
+    assert feed.subscriptions_sent[1:] == [('unsubscribe', 'book', ['XBT/USD']), ('subscribe', 'book', ['XBT/USD'])]
+    # The book comes back from the new snapshot, not from Depth over REST
+    wait_for(lambda: the_book.valid)
+    assert '1.00000' not in the_book.levels['asks']
+    resynced_at = the_book.last_update
+    wait_for(lambda: the_book.last_update > resynced_at + 0.2)
+    assert len(feed.subscriptions_sent) == 3
+
+
+def test_updates_are_dropped_while_waiting_for_the_snapshot(feed, wait_for):
+    the_books = OrderBooks(feed)
+    the_book = the_books.track('XXBTZUSD', 'XBT/USD')
+    wait_for(lambda: the_book.valid)
+    the_book.valid = False
+    the_levels = {each_side: dict(the_book.levels[each_side]) for each_side in the_book.levels}
+    the_books.on_book_message('XXBTZUSD', {'a': [[next(iter(the_levels['asks'])), '0.00000000', '0']], 'c': '0'})
+    assert the_book.levels == the_levels
+    assert the_books.fill_price('XXBTZUSD', 'buy', 0.1) is None
@@ -0,0 +1,49 @@
+import decimal
+import json
+import pytest
+import order_tracker
+from order_tracker import OrderTracker
+
+websocket = pytest.importorskip('websocket')
+
+
+# Hands out the_messages from recv() one after another, then '' like a closed connection
+class FakeConnection:
+    def __init__(self, the_messages):
+        self.messages = the_messages
+
+    def send(self, the_message):
+        pass
+
+    def recv(self):
+        return self.messages.pop(0) if self.messages else ''
+
+    def close(self):
+        pass
+
+
+def open_order(the_volume):
+    return {'status': 'open', 'vol': the_volume, 'vol_exec': '0', 'opentm': '1700000000.0',
+            'descr': {'pair': 'XBTUSD', 'type': 'buy', 'ordertype': 'limit', 'price': '1.0'}}
+
+
+def test_messages_that_cant_be_read_dont_stop_the_stream(monkeypatch):
+    the_messages = ['{"event": "heartbeat"}',
+                    '["openOrders"]',
+                    '[]',
+                    'not json',
+                    json.dumps([[{'OFIRST-AAAAA-AAAAAA': open_order('1.5')}], 'openOrders', {'sequence': 1}]),
+                    json.dumps([['not an update'], 'openOrders', {'sequence': 2}]),
+                    json.dumps([[{'OFIRST-AAAAA-AAAAAA': {'vol_exec': 'lots'}}], 'openOrders', {'sequence': 3}]),
+                    json.dumps([[{'OSECOND-BBBBB-BBBBBB': open_order('2')}], 'openOrders', {'sequence': 4}])]
+    # The stub fixture turns the stream off for everything else, see benchmark.use_stub
+    monkeypatch.setattr(order_tracker, 'websocket', websocket)
+    monkeypatch.setattr(websocket, 'create_connection', lambda the_url, timeout=None: FakeConnection(the_messages))
+    the_tracker = OrderTracker(lambda *the_arguments, **the_options: None)
+    monkeypatch.setattr(the_tracker, 'private_result', lambda uri_path, data: {'token': 'the_token'})
+    # Returns once the connection is done, instead of dying on the first message it can't read
+    assert the_tracker.stream() is True
+    assert the_messages == []
+    assert the_tracker.open_orders['OFIRST-AAAAA-AAAAAA'].vol == decimal.Decimal('1.5')
+    assert 'OSECOND-BBBBB-BBBBBB' in the_tracker.open_orders
+    assert the_tracker.open_orders['error'] is False
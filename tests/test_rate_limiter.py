@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+import requests
+from rate_limiter import RateLimiter, order_age_penalty
+from retry_policy import RetryPolicy
+
+
+# A response like the ones kraken_request hands back, with Kraken's error list
+def kraken_response(the_errors, the_result=None):
+    the_response = requests.Response()
+    the_response.status_code = 200
+    the_response._content = json.dumps({'error': the_errors, 'result': the_result or {}}).encode()
+    return the_response
+
+
+def test_counters_decay_by_the_account_types_rate():
+    the_limiter = RateLimiter('starter')
+    for _ in range(15):
+        assert the_limiter.acquire('/0/private/Balance') == 0
+    assert the_limiter.usage()['api']['count'] == 15
+    # Three seconds go by without sleeping through them
+    the_limiter.last_decay -= 3
+    assert abs(the_limiter.usage()['api']['count'] - (15 - 3 * 0.33)) < 0.01
+    the_limiter.last_decay -= 100
+    assert the_limiter.usage()['api']['count'] == 0
+
+
+def test_trading_calls_count_per_pair_and_not_on_the_api_counter():
+    the_limiter = RateLimiter('starter')
+    the_limiter.acquire('/0/private/AddOrder', 'XXBTZUSD')
+    the_limiter.acquire('/0/private/CancelOrder', 'XXBTZUSD', order_age_penalty('cancel', 2))
+    the_usage = the_limiter.usage()
+    assert the_usage['api']['count'] == 0
+    assert the_usage['trading']['XXBTZUSD']['count'] == 1 + 8
+    assert 'XETHZUSD' not in the_usage['trading']
+
+
+def test_acquire_waits_until_the_call_fits():
+    the_limiter = RateLimiter('starter')
+    the_limiter.api_decay = 20
+    the_limiter.api_count = the_limiter.api_max
+    waited = the_limiter.acquire('/0/private/TradesHistory')
+    # TradesHistory costs 2, which takes 2 / 20 seconds to come back
+    assert 0.05 < waited < 0.5
+    assert the_limiter.usage()['api']['count'] <= the_limiter.api_max
+
+
+def test_rate_limit_error_fills_the_counter_before_trying_again():
+    the_limiter = RateLimiter('starter')
+    the_limiter.api_decay = 10
+    the_answers = [kraken_response(['EAPI:Rate limit exceeded']), kraken_response([], {'ZUSD': '1.0'})]
+    the_waits = []
+
+    def request_function(uri_path, data, pair=None):
+        the_waits.append(the_limiter.acquire(uri_path, pair))
+        return the_answers.pop(0)
+
+    the_result = RetryPolicy(the_limiter).send(request_function, '/0/private/Balance', {})
+    assert the_result == {'ZUSD': '1.0'}
+    # The first try had the whole counter. The second only went once the counter ( marked full ) had room again,
+    # which is 1 credit at 10 a second.
+    assert the_waits[0] == 0
+    assert 0.05 < the_waits[1] < 0.5
+
+
+def test_rate_limited_trading_call_only_fills_its_pairs_counter():
+    the_limiter = RateLimiter('starter')
+    the_limiter.mark_full('/0/private/AddOrder', 'XXBTZUSD')
+    the_usage = the_limiter.usage()
+    assert the_usage['trading']['XXBTZUSD']['headroom'] < 1
+    assert the_usage['api']['count'] == 0
+
+
+def test_reserve_is_checked_and_charged_in_one_step():
+    the_limiter = RateLimiter('starter')
+    the_limiter.api_decay = 2
+    the_reserve = 6
+    # Room for exactly one TradesHistory call ( 2 credits ) that leaves the reserve
+    the_limiter.api_count = the_limiter.api_max - the_reserve - 2
+    finished = []
+
+    def export_call():
+        the_limiter.acquire('/0/private/TradesHistory', reserve=the_reserve)
+        finished.append(time.monotonic())
+
+    the_threads = [threading.Thread(target=export_call) for _ in range(2)]
+    started_at = time.monotonic()
+    for each_thread in the_threads:
+        each_thread.start()
+    for each_thread in the_threads:
+        each_thread.join(5)
+    finished.sort()
+    assert len(finished) == 2
+    # One went straight away, the other had to wait for 2 credits to decay
+    assert finished[0] - started_at < 0.3
+    assert finished[1] - started_at > 0.7
@@ -0,0 +1,99 @@
+import json
+import pytest
+import requests
+from rate_limiter import RateLimiter
+from retry_policy import RetryPolicy, RequestFailed, classify, error_kind, backoff_delay
+
+
+# A response like the ones kraken_request hands back, with Kraken's error list
+def kraken_response(the_errors, the_result=None, status_code=200):
+    the_response = requests.Response()
+    the_response.status_code = status_code
+    the_response._content = json.dumps({'error': the_errors, 'result': the_result or {}}).encode()
+    return the_response
+
+
+# A request_function that answers with the_answers one after another, and keeps every call it gets
+def answering(the_answers):
+    the_calls = []
+
+    def request_function(uri_path, data, pair=None, **request_options):
+        the_calls.append(uri_path)
+        return the_answers[min(len(the_calls), len(the_answers)) - 1]
+
+    return request_function, the_calls
+
+
+@pytest.mark.parametrize('the_response, the_kind', [
+    (None, 'connection'),
+    (kraken_response([], {'ZUSD': '1.0'}), None),
+    (kraken_response(['EAPI:Invalid nonce']), 'nonce'),
+    (kraken_response(['EAPI:Rate limit exceeded']), 'rate_limit'),
+    (kraken_response(['EGeneral:Temporary lockout']), 'lockout'),
+    (kraken_response(['EService:Unavailable']), 'unavailable'),
+    (kraken_response(['EService:Market in cancel_only mode']), 'cancel_only'),
+    (kraken_response(['EOrder:Insufficient funds']), 'permanent'),
+    (kraken_response([], status_code=429), 'rate_limit'),
+    (kraken_response([], status_code=502), 'unavailable'),
+    (kraken_response([], status_code=403), 'permanent'),
+])
+def test_classify_sorts_every_response_into_a_kind(the_response, the_kind):
+    assert classify(the_response)[0] == the_kind
+
+
+def test_the_worst_of_several_errors_decides():
+    assert error_kind(['EAPI:Invalid nonce', 'EService:Busy']) == 'unavailable'
+    assert error_kind(['EService:Busy', 'EGeneral:Invalid arguments']) == 'permanent'
+    assert error_kind([]) == 'permanent'
+
+
+def test_backoff_grows_with_every_attempt_up_to_the_max():
+    for each_attempt in range(10):
+        the_delays = [backoff_delay(each_attempt, 0.5, 8) for _ in range(200)]
+        assert 0 <= min(the_delays) and max(the_delays) <= min(8, 0.5 * 2 ** each_attempt)
+    # Jittered, so threads that failed together don't come back together
+    assert len({backoff_delay(3, 0.5, 8) for _ in range(20)}) > 1
+
+
+def test_failures_that_can_pass_are_sent_again_until_the_budget_runs_out():
+    the_policy = RetryPolicy(RateLimiter('starter'), budgets={'/0/private/Balance': 2}, base_delay=0.001,
+                             max_delay=0.001)
+    request_function, the_calls = answering([kraken_response(['EService:Busy'])])
+    with pytest.raises(RequestFailed) as the_error:
+        the_policy.send(request_function, '/0/private/Balance', {})
+    assert the_error.value.kind == 'unavailable'
+    # The first try and 2 more
+    assert len(the_calls) == 3
+
+
+def test_it_stops_as_soon_as_the_budget_allows_it_to_work():
+    the_policy = RetryPolicy(RateLimiter('starter'), budgets={'/0/private/Balance': 2}, base_delay=0.001,
+                             max_delay=0.001)
+    request_function, the_calls = answering([None, kraken_response(['EService:Busy']),
+                                             kraken_response([], {'ZUSD': '1.0'})])
+    assert the_policy.send(request_function, '/0/private/Balance', {}) == {'ZUSD': '1.0'}
+    assert len(the_calls) == 3
+
+
+def test_a_permanent_error_is_never_sent_again():
+    the_policy = RetryPolicy(RateLimiter('starter'), base_delay=0.001, max_delay=0.001)
+    request_function, the_calls = answering([kraken_response(['EOrder:Insufficient funds'])])
+    with pytest.raises(RequestFailed) as the_error:
+        the_policy.send(request_function, '/0/private/AddOrder', {}, pair='XXBTZUSD')
+    assert the_error.value.kind == 'permanent'
+    assert the_error.value.errors == ['EOrder:Insufficient funds']
+    assert len(the_calls) == 1
+
+
+def test_an_order_that_might_have_been_placed_is_never_sent_again():
+    the_policy = RetryPolicy(RateLimiter('starter'), base_delay=0.001, max_delay=0.001)
+    for each_answer in (None, kraken_response(['EService:Deadline elapsed'])):
+        request_function, the_calls = answering([each_answer])
+        with pytest.raises(RequestFailed):
+            the_policy.send(request_function, '/0/private/AddOrderBatch', {}, pair='XXBTZUSD')
+        assert len(the_calls) == 1
+    # A nonce error means Kraken didn't do anything with it, so that one is sent again
+    request_function, the_calls = answering([kraken_response(['EAPI:Invalid nonce']),
+                                             kraken_response([], {'txid': ['O1']})])
+    assert the_policy.send(request_function, '/0/private/AddOrder', {}, pair='XXBTZUSD') == {'txid': ['O1']}
+    assert len(the_calls) == 2
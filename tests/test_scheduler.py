@@ -0,0 +1,62 @@
+import threading
+import time
+from scheduler import Scheduler
+
+
+def test_jobs_run_in_order_of_when_they_are_due():
+    ran = []
+    done = threading.Event()
+
+    def run_step(the_job):
+        ran.append(the_job)
+        if len(ran) == 3:
+            done.set()
+        return None
+
+    the_scheduler = Scheduler(run_step, workers=1)
+    the_scheduler.add('late', 'late', 0.3)
+    the_scheduler.add('first', 'first', 0.05)
+    the_scheduler.add('second', 'second', 0.15)
+    assert done.wait(5)
+    the_scheduler.stop()
+    assert ran == ['first', 'second', 'late']
+    # A step that returns None is the end of the job
+    assert len(the_scheduler) == 0
+
+
+def test_a_repeating_job_runs_again_after_its_interval():
+    ran = []
+
+    def run_step(the_job):
+        ran.append((the_job, time.monotonic()))
+        return 0.05 if the_job == 'fast' else None
+
+    the_scheduler = Scheduler(run_step, workers=2)
+    the_scheduler.add('fast', 'fast')
+    the_scheduler.add('slow', 'slow', 0.32)
+    time.sleep(0.5)
+    the_scheduler.stop()
+    the_names = [each_name for each_name, _ in ran]
+    # Every 0.05 seconds from 0, so the fast job ran up to 7 times before the slow one's only step
+    assert the_names.index('slow') >= 4
+    assert the_names.count('slow') == 1
+
+
+def test_paused_and_cancelled_jobs_are_skipped():
+    ran = []
+
+    def run_step(the_job):
+        ran.append(the_job)
+        return None
+
+    the_scheduler = Scheduler(run_step, workers=1)
+    for each_name in ('paused', 'cancelled', 'kept'):
+        the_scheduler.add(each_name, each_name, 0.1)
+    the_scheduler.pause('paused')
+    the_scheduler.cancel('cancelled')
+    time.sleep(0.3)
+    assert ran == ['kept']
+    the_scheduler.resume('paused')
+    time.sleep(0.1)
+    the_scheduler.stop()
+    assert ran == ['kept', 'paused']
@@ -0,0 +1,53 @@
+import base64
+import json
+import os
+import urllib.parse
+import pytest
+from signing import Signer, BodyTemplate
+
+the_secret = base64.b64encode(os.urandom(64)).decode()
+the_nonce = '1716196112345678'
+
+
+# The signature the way Kraken's documentation ( and kraken_api.get_kraken_signature ) makes it, from the dict
+@pytest.fixture
+def baseline_signature(stub):
+    import kraken_api
+    return kraken_api.get_kraken_signature
+
+
+@pytest.mark.parametrize('the_data', [
+    {'nonce': the_nonce},
+    {'nonce': the_nonce, 'ordertype': 'limit', 'type': 'buy', 'volume': '1.25', 'pair': 'XBTUSD', 'price': '27500.1'},
+    # AddOrderBatch's orders, the way they're sent url-encoded
+    {'nonce': the_nonce, 'pair': 'XBTUSD',
+     'orders[0][ordertype]': 'limit', 'orders[0][type]': 'buy', 'orders[0][volume]': '0.5', 'orders[0][price]': '1',
+     'orders[1][ordertype]': 'limit', 'orders[1][type]': 'sell', 'orders[1][volume]': '0.7', 'orders[1][price]': '2'},
+    {'nonce': the_nonce, 'txid': 'OABCDE-FGHIJ-KLMNOP,OQRSTU-VWXYZ-ABCDEF', 'note': 'spaces & symbols=?/+'},
+])
+def test_signer_matches_the_baseline_signature(baseline_signature, the_data):
+    the_body = urllib.parse.urlencode(the_data).encode()
+    assert Signer(the_secret).sign('/0/private/AddOrder', the_nonce, the_body) == \
+        baseline_signature('/0/private/AddOrder', the_data, the_secret)
+
+
+def test_a_json_body_with_a_list_of_orders_matches_the_baseline_signature(baseline_signature):
+    the_orders = [{'ordertype': 'limit', 'type': 'buy', 'volume': '0.5', 'price': '1', 'userref': 7},
+                  {'ordertype': 'limit', 'type': 'buy', 'volume': '0.7', 'price': '2', 'userref': 7}]
+    the_data = {'nonce': the_nonce, 'pair': 'XBTUSD', 'orders': the_orders}
+    the_body = json.dumps(the_data)
+    assert Signer(the_secret).sign('/0/private/AddOrderBatch', the_nonce, the_body.encode()) == \
+        baseline_signature('/0/private/AddOrderBatch', the_data, the_secret, the_body)
+
+
+@pytest.mark.parametrize('the_values', [
+    {'volume': '0.001', 'price': '27500.1', 'userref': 12345},
+    {'volume': '1e-8', 'price': '0.5', 'userref': 1, 'oflags': 'post,fciq'},
+])
+def test_a_filled_template_is_the_same_body_and_signature_as_the_dict(baseline_signature, the_values):
+    the_fields = {'ordertype': 'limit', 'type': 'sell', 'pair': 'XXBTZUSD'}
+    the_body = BodyTemplate(the_fields).fill(**the_values).encode(the_nonce)
+    the_data = {'nonce': the_nonce, **the_fields, **the_values}
+    assert the_body == urllib.parse.urlencode(the_data).encode()
+    assert Signer(the_secret).sign('/0/private/AddOrder', the_nonce, the_body) == \
+        baseline_signature('/0/private/AddOrder', the_data, the_secret)
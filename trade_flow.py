@@ -0,0 +1,108 @@
+# Keeps up with how much is trading on a pair right now, for sizing POV ( participation of volume ) orders.
+# https://docs.kraken.com/rest/#tag/Market-Data/operation/getRecentTrades
+#
+# The 24 hour volume in the ticker is a day old by the end of the day and never changes during a schedule.
+# Here every tracked pair's public trades are fetched with the "since" cursor Kraken sent back the last time,
+# so each fetch only has the trades that happened since the one before. The volume of the last window seconds
+# of trades is kept as a running total: new trades are added to it and ones that fall out of the window are
+# taken off, so reading it never goes through the trades again.
+import collections
+import decimal
+import threading
+import time
+import requests
+from config import pov_window, trades_fetch_interval
+from transport import transport
+from responses import body
+
+# Trades only returns 1000 trades at a time. A busy pair can have more than that between two fetches.
+trades_page_limit = 1000
+max_pages = 10
+
+
+class TradeFlow:
+    def __init__(self, window=pov_window):
+        self.window = window
+        # pair -> {'since': cursor, 'trades': deque of ( time, volume ), 'volume': total of those,
+        #          'fetched': False until the first fetch is in}
+        self.pairs = {}
+        self.lock = threading.Lock()
+        # Called with ( pair, trades ) after every fetch that found new trades, with the trades as Kraken sends them
+        self.listeners = []
+
+    def add_listener(self, the_listener):
+        self.listeners.append(the_listener)
+
+    # Starts keeping up with this pair ( REST pair name ). The first fetch goes back a whole window,
+    # so sizing can start right away instead of after a window's worth of waiting.
+    def track(self, the_pair):
+        with self.lock:
+            if the_pair not in self.pairs:
+                the_start = time.time() - self.window
+                self.pairs[the_pair] = {'since': str(int(the_start)), 'trades': collections.deque(),
+                                        'volume': decimal.Decimal(0), 'fetched': False}
+
+    def untrack(self, the_pair):
+        with self.lock:
+            self.pairs.pop(the_pair, None)
+
+    # One fetch for every tracked pair. A job on the poller, so it returns the seconds until the next one.
+    def poll_step(self):
+        with self.lock:
+            the_pairs = {each_pair: self.pairs[each_pair]['since'] for each_pair in self.pairs}
+        for each_pair in the_pairs:
+            self.fetch(each_pair, the_pairs[each_pair])
+        return trades_fetch_interval
+
+    def fetch(self, the_pair, the_since):
+        new_trades = []
+        raw_trades = []
+        worked = False
+        for _ in range(max_pages):
+            try:
+                the_result = body(transport.public_get('/0/public/Trades', {'pair': the_pair, 'since': the_since}))['result']
+            except (requests.exceptions.RequestException, KeyError):
+                break
+            worked = True
+            the_page = next((the_result[each_key] for each_key in the_result if each_key != 'last'), [])
+            # [price, volume, time, buy / sell, market / limit, miscellaneous, trade id]
+            new_trades += [(float(each_trade[2]), decimal.Decimal(each_trade[1])) for each_trade in the_page]
+            raw_trades += the_page
+            the_since = str(the_result.get('last', the_since))
+            if len(the_page) < trades_page_limit:
+                break
+        with self.lock:
+            the_flow = self.pairs.get(the_pair)
+            if the_flow is None or not worked:
+                return
+            the_flow['fetched'] = True
+            the_flow['since'] = the_since
+            for each_trade in new_trades:
+                the_flow['trades'].append(each_trade)
+                the_flow['volume'] += each_trade[1]
+            self.expire(the_flow)
+        if raw_trades:
+            for each_listener in self.listeners:
+                each_listener(the_pair, raw_trades)
+
+    # Takes off the trades that are older than the window. Must be called with self.lock held.
+    def expire(self, the_flow):
+        oldest = time.time() - self.window
+        while the_flow['trades'] and the_flow['trades'][0][0] < oldest:
+            the_flow['volume'] -= the_flow['trades'].popleft()[1]
+
+    # Volume traded on the pair over the last window seconds, or None if nothing's been fetched for it yet
+    def volume(self, the_pair):
+        with self.lock:
+            the_flow = self.pairs.get(the_pair)
+            if the_flow is None or not the_flow['fetched']:
+                return None
+            self.expire(the_flow)
+            return the_flow['volume']
+
+    # Volume traded per second, averaged over the window
+    def volume_rate(self, the_pair):
+        the_volume = self.volume(the_pair)
+        if the_volume is None:
+            return None
+        return the_volume / decimal.Decimal(self.window)
@@ -0,0 +1,60 @@
+# Shared HTTP transport for everything that talks to the Kraken REST API.
+#
+# A bare requests.get / requests.post opens a brand-new TCP+TLS connection every time,
+# which is the bulk of the latency when polling every few seconds.
+# A Transport keeps one requests.Session with a pooled HTTPAdapter, so connections stay alive between calls.
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from config import api_url, pool_size, connect_timeout, read_timeout, prewarm_connections
+from metrics import metrics
+
+
+class Transport:
+    def __init__(self, base_url, the_pool_size=pool_size, timeout=(connect_timeout, read_timeout)):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        # pool_connections is the amount of hosts to keep pools for, pool_maxsize is the connections per host.
+        # Every call goes to the same host, so only pool_maxsize really matters.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=the_pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    # https://docs.kraken.com/rest/#tag/Market-Data
+    # Public endpoints are GET requests without any auth headers
+    def public_get(self, uri_path, params=None):
+        start_time = time.perf_counter()
+        try:
+            the_response = self.session.get(self.base_url + uri_path, params=params, timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            metrics.record_call(uri_path, time.perf_counter() - start_time, 'connection_error')
+            raise
+        metrics.record_call(uri_path, time.perf_counter() - start_time, the_response.status_code)
+        return the_response
+
+    # Private endpoints are POST requests. The headers are made by kraken_request()
+    def private_post(self, uri_path, headers, data):
+        return self.session.post(self.base_url + uri_path, headers=headers, data=data, timeout=self.timeout)
+
+    # Opens "how_many" connections at the same time so the pool already has live connections
+    # before the first real request. /0/public/Time is the cheapest endpoint Kraken has.
+    def prewarm(self, how_many=prewarm_connections):
+        def warm_one():
+            try:
+                self.public_get('/0/public/Time')
+            except requests.exceptions.RequestException:
+                pass
+        warm_threads = [threading.Thread(target=warm_one, name="prewarm") for _ in range(how_many)]
+        for each_thread in warm_threads:
+            each_thread.start()
+        for each_thread in warm_threads:
+            each_thread.join()
+
+    def close(self):
+        self.session.close()
+
+
+# The transport every part of the program shares
+transport = Transport(api_url)